@@ -15,4 +15,132 @@ class Settings:
     # model settings
     NEBIUS_MODEL: str = "openai/gpt-oss-20b"
 
-settings = Settings()
\ No newline at end of file
+    # prompt text compression (zstd), fields smaller than the threshold are stored as plain strings
+    PROMPT_COMPRESSION_ENABLED: bool = os.getenv("PROMPT_COMPRESSION_ENABLED", "true").lower() == "true"
+    PROMPT_COMPRESSION_THRESHOLD: int = int(os.getenv("PROMPT_COMPRESSION_THRESHOLD", "1024"))  # bytes
+    PROMPT_COMPRESSION_LEVEL: int = int(os.getenv("PROMPT_COMPRESSION_LEVEL", "6"))
+    PROMPT_COMPRESSION_DICT: str = os.getenv("PROMPT_COMPRESSION_DICT")  # optional trained dictionary path
+    # comma-separated earlier dictionaries, still needed to read documents written with them
+    PROMPT_COMPRESSION_RETIRED_DICTS: str = os.getenv("PROMPT_COMPRESSION_RETIRED_DICTS", "")
+
+    # long prompts are parsed in concurrent chunks above this size
+    PARSE_CHUNK_THRESHOLD_TOKENS: int = int(os.getenv("PARSE_CHUNK_THRESHOLD_TOKENS", "6000"))
+    PARSE_CHUNK_MAX_TOKENS: int = int(os.getenv("PARSE_CHUNK_MAX_TOKENS", "3000"))
+    PARSE_CHUNK_CONCURRENCY: int = int(os.getenv("PARSE_CHUNK_CONCURRENCY", "8"))
+
+    # local pre-pass before the model sees a prompt (services/prompt_reduction.py):
+    # "off" | "light" | "standard" | "aggressive"
+    PROMPT_REDUCTION_LEVEL: str = os.getenv("PROMPT_REDUCTION_LEVEL", "light")
+    PROMPT_REDUCTION_BLOCK_TOKENS: int = int(os.getenv("PROMPT_REDUCTION_BLOCK_TOKENS", "800"))
+
+    # completion budgets per LLM call (services/llm_budget.py); effort "" = model default
+    LLM_BUDGETS_ENABLED: bool = os.getenv("LLM_BUDGETS_ENABLED", "true").lower() == "true"
+    LLM_OPTIMIZE_EXPANSION_RATIO: float = float(os.getenv("LLM_OPTIMIZE_EXPANSION_RATIO", "1.5"))
+    LLM_MIN_ANSWER_TOKENS: int = int(os.getenv("LLM_MIN_ANSWER_TOKENS", "256"))
+    LLM_MAX_COMPLETION_TOKENS: int = int(os.getenv("LLM_MAX_COMPLETION_TOKENS", "32768"))
+    LLM_PARSE_REASONING_EFFORT: str = os.getenv("LLM_PARSE_REASONING_EFFORT", "low")
+    LLM_OPTIMIZE_REASONING_EFFORT: str = os.getenv("LLM_OPTIMIZE_REASONING_EFFORT", "medium")
+
+    # server / worker sizing (server.py)
+    SERVER_WORKERS: int = int(os.getenv("SERVER_WORKERS", "0"))  # 0 = derive from CPU and memory limits
+    SERVER_MAX_WORKERS: int = int(os.getenv("SERVER_MAX_WORKERS", "8"))
+    SERVER_WORKER_MEMORY_MB: int = int(os.getenv("SERVER_WORKER_MEMORY_MB", "256"))  # budget per derived worker
+    LLM_EXPECTED_LATENCY_MS: float = float(os.getenv("LLM_EXPECTED_LATENCY_MS", "3000"))
+    SERVER_MAX_REQUESTS: int = int(os.getenv("SERVER_MAX_REQUESTS", "5000"))  # recycle workers (0 = never)
+    SERVER_GRACEFUL_TIMEOUT: int = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "60"))
+
+    # upstream warmup / readiness (services/warmup.py); WARMUP_MODELS comma-separated, "" = NEBIUS_MODEL
+    WARMUP_UPSTREAMS: bool = os.getenv("WARMUP_UPSTREAMS", "true").lower() == "true"
+    WARMUP_TIMEOUT_S: float = float(os.getenv("WARMUP_TIMEOUT_S", "15"))
+    WARMUP_MODELS: str = os.getenv("WARMUP_MODELS", "")
+    WARMUP_LLM_CONNECTIONS: int = int(os.getenv("WARMUP_LLM_CONNECTIONS", "2"))
+    KEEPALIVE_INTERVAL_S: float = float(os.getenv("KEEPALIVE_INTERVAL_S", "45"))  # 0 = off
+    LLM_KEEPALIVE_EXPIRY_S: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY_S", "120"))
+
+    # analytics aggregates: shard documents per user (more shards = less write contention)
+    ANALYTICS_SHARDS: int = int(os.getenv("ANALYTICS_SHARDS", "10"))
+
+    # request deadlines (X-Request-Deadline-Ms header overrides the default)
+    REQUEST_DEADLINE_MS: float = float(os.getenv("REQUEST_DEADLINE_MS", "120000"))
+    REQUEST_DEADLINE_MAX_MS: float = float(os.getenv("REQUEST_DEADLINE_MAX_MS", "300000"))
+
+    # local write-ahead journal for Firestore writes (SQLite WAL file shared by the workers)
+    WRITE_JOURNAL_ENABLED: bool = os.getenv("WRITE_JOURNAL_ENABLED", "true").lower() == "true"
+    WRITE_JOURNAL_PATH: str = os.getenv("WRITE_JOURNAL_PATH", "write_journal.db")
+    WRITE_JOURNAL_MAX_PENDING: int = int(os.getenv("WRITE_JOURNAL_MAX_PENDING", "10000"))
+    WRITE_JOURNAL_BATCH_SIZE: int = int(os.getenv("WRITE_JOURNAL_BATCH_SIZE", "100"))
+    WRITE_JOURNAL_INTERVAL_S: float = float(os.getenv("WRITE_JOURNAL_INTERVAL_S", "0.2"))
+
+    # write-behind for ratings / favorites / copy counts (services/write_behind.py), per worker
+    WRITE_BEHIND_ENABLED: bool = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+    WRITE_BEHIND_INTERVAL_S: float = float(os.getenv("WRITE_BEHIND_INTERVAL_S", "1"))
+    WRITE_BEHIND_MAX_PENDING: int = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "500"))  # prompts, flush early
+
+    # per-user / per-project quotas over a sliding window (0 = unlimited)
+    QUOTA_ENABLED: bool = os.getenv("QUOTA_ENABLED", "true").lower() == "true"
+    QUOTA_WINDOW_S: int = int(os.getenv("QUOTA_WINDOW_S", "3600"))
+    QUOTA_WINDOW_BUCKETS: int = int(os.getenv("QUOTA_WINDOW_BUCKETS", "60"))
+    QUOTA_USER_REQUESTS: int = int(os.getenv("QUOTA_USER_REQUESTS", "300"))
+    QUOTA_USER_TOKENS: int = int(os.getenv("QUOTA_USER_TOKENS", "500000"))
+    QUOTA_PROJECT_REQUESTS: int = int(os.getenv("QUOTA_PROJECT_REQUESTS", "0"))
+    QUOTA_PROJECT_TOKENS: int = int(os.getenv("QUOTA_PROJECT_TOKENS", "0"))
+    QUOTA_SYNC_INTERVAL_S: float = float(os.getenv("QUOTA_SYNC_INTERVAL_S", "5"))
+
+    # request profiling (X-Profile: <token> header, or a random sample of requests)
+    PROFILING_ADMIN_TOKEN: str = os.getenv("PROFILING_ADMIN_TOKEN", "")
+    PROFILING_SAMPLE_RATE: float = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+    PROFILING_SAMPLER: bool = os.getenv("PROFILING_SAMPLER", "false").lower() == "true"
+    PROFILING_SAMPLER_INTERVAL_MS: float = float(os.getenv("PROFILING_SAMPLER_INTERVAL_MS", "5"))
+    PROFILING_DIR: str = os.getenv("PROFILING_DIR", "profiles")
+
+    # admission control for LLM-bound routes (per worker, AIMD-adjusted limit)
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    ADMISSION_INITIAL_LIMIT: int = int(os.getenv("ADMISSION_INITIAL_LIMIT", "32"))
+    ADMISSION_MIN_LIMIT: int = int(os.getenv("ADMISSION_MIN_LIMIT", "4"))
+    ADMISSION_MAX_LIMIT: int = int(os.getenv("ADMISSION_MAX_LIMIT", "256"))
+    ADMISSION_LATENCY_TARGET_MS: float = float(os.getenv("ADMISSION_LATENCY_TARGET_MS", "8000"))
+    ADMISSION_DECREASE_FACTOR: float = float(os.getenv("ADMISSION_DECREASE_FACTOR", "0.8"))
+    ADMISSION_DECREASE_INTERVAL_S: float = float(os.getenv("ADMISSION_DECREASE_INTERVAL_S", "2"))
+    ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+    ADMISSION_MAX_QUEUE_MS: float = float(os.getenv("ADMISSION_MAX_QUEUE_MS", "2000"))
+    # threads beyond ADMISSION_MAX_LIMIT for work outside admission (history loads, search, ...)
+    ADMISSION_EXECUTOR_HEADROOM: int = int(os.getenv("ADMISSION_EXECUTOR_HEADROOM", "32"))
+
+    # history delta sync: cursors older than this need a full reload
+    HISTORY_TOMBSTONE_TTL_DAYS: int = int(os.getenv("HISTORY_TOMBSTONE_TTL_DAYS", "30"))
+
+    # live history push over WebSocket (per worker limits)
+    HISTORY_PUSH_SOURCE: str = os.getenv("HISTORY_PUSH_SOURCE", "firestore")  # "fake" for local runs
+    HISTORY_PUSH_MAX_CONNECTIONS: int = int(os.getenv("HISTORY_PUSH_MAX_CONNECTIONS", "2000"))
+    HISTORY_PUSH_MAX_LISTENERS: int = int(os.getenv("HISTORY_PUSH_MAX_LISTENERS", "500"))
+    HISTORY_PUSH_MAX_TABS: int = int(os.getenv("HISTORY_PUSH_MAX_TABS", "8"))
+    HISTORY_PUSH_QUEUE_SIZE: int = int(os.getenv("HISTORY_PUSH_QUEUE_SIZE", "100"))
+    HISTORY_PUSH_IDLE_S: float = float(os.getenv("HISTORY_PUSH_IDLE_S", "30"))
+    HISTORY_PUSH_PING_S: float = float(os.getenv("HISTORY_PUSH_PING_S", "25"))
+
+    # per-user full-text search indexes (services/history_search.py), per worker
+    HISTORY_SEARCH_MEMORY_MB: float = float(os.getenv("HISTORY_SEARCH_MEMORY_MB", "256"))
+    HISTORY_SEARCH_SYNC_S: float = float(os.getenv("HISTORY_SEARCH_SYNC_S", "5"))
+
+    # model registry overrides: JSON {"model": {"encoding": ..., "input_price": ..., ...}}
+    MODEL_REGISTRY_JSON: str = os.getenv("MODEL_REGISTRY_JSON", "")
+
+    # in-process stand-ins (services/fakes.py) for local runs and load replay: "fake" to enable
+    FIRESTORE_BACKEND: str = os.getenv("FIRESTORE_BACKEND", "firestore")
+    LLM_BACKEND: str = os.getenv("LLM_BACKEND", "nebius")
+    FAKE_FIRESTORE_LATENCY_MS: float = float(os.getenv("FAKE_FIRESTORE_LATENCY_MS", "15"))
+    FAKE_LLM_LATENCY_MS: float = float(os.getenv("FAKE_LLM_LATENCY_MS", "600"))
+    FAKE_LLM_MS_PER_TOKEN: float = float(os.getenv("FAKE_LLM_MS_PER_TOKEN", "4"))
+
+    # traffic recording (services/traffic_recorder.py): JSONL output path, empty = off
+    TRAFFIC_RECORD_PATH: str = os.getenv("TRAFFIC_RECORD_PATH", "")
+    TRAFFIC_RECORD_SAMPLE_RATE: float = float(os.getenv("TRAFFIC_RECORD_SAMPLE_RATE", "1"))
+    TRAFFIC_RECORD_MAX_BODY_BYTES: int = int(os.getenv("TRAFFIC_RECORD_MAX_BODY_BYTES", "1048576"))
+    # hex ID hash key shared by all workers of one recording, empty = random per process
+    TRAFFIC_RECORD_SALT: str = os.getenv("TRAFFIC_RECORD_SALT", "")
+
+    # prompt storage (services/prompt_repository.py): "flat" or "nested"; dual write during migration
+    PROMPT_LAYOUT: str = os.getenv("PROMPT_LAYOUT", "flat")
+    PROMPT_DUAL_WRITE: bool = os.getenv("PROMPT_DUAL_WRITE", "false").lower() == "true"
+
+settings = Settings()
@@ -0,0 +1,19 @@
+import orjson
+from fastapi.responses import JSONResponse
+
+try:
+    from ..services.profiling import span
+except ImportError:
+    import sys
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from services.profiling import span
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson (handles datetime and non-str dict keys natively)"""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        with span("serialize"):
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
@@ -1,8 +1,48 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from .core.responses import ORJSONResponse
 from .routers import prompt_router, user_router, auth_router
+from .services.metrics import snapshot
+from .services.compression import get_compression_stats
+from .services.warmup import warmup, readiness
+from .core.config import settings
+from .services.write_journal import replayer, get_journal_stats
+from .services.write_behind import buffer as write_behind
+from .services.quota import syncer as quota_syncer
+from .services.profiling import ProfilingMiddleware
+from .services.traffic_recorder import TrafficRecorderMiddleware, writer as traffic_writer
+from .services.admission import controller as admission, executor as admission_executor
+from .services.history_push import hub as push_hub
 
-app = FastAPI(title="Prompt Refiner MVP", version="1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # threads for every slot admission may hand out (asyncio's default is min(32, cpu + 4))
+    asyncio.get_running_loop().set_default_executor(admission_executor())
+    # load tokenizer tables etc. before the worker accepts traffic
+    app.state.warmup = warmup()
+    # TLS / gRPC handshakes and credentials, then keep the pools from going cold
+    if settings.WARMUP_UPSTREAMS:
+        app.state.warmup["upstreams"] = readiness.warm()
+        readiness.start()
+    # push journaled writes to Firestore in the background; flush what's left on shutdown
+    replayer.start()
+    # coalesced ratings / favorites / copies; flushed into the journal before it drains
+    write_behind.start()
+    quota_syncer.start()
+    yield
+    push_hub.close_all()
+    readiness.stop()
+    quota_syncer.stop()
+    write_behind.stop()
+    replayer.stop()
+    traffic_writer.close()
+
+
+# orjson for every router that doesn't set its own response class
+app = FastAPI(title="Prompt Refiner MVP", version="1.0", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # cors settings (to be able to talk with frontend)
 app.add_middleware(
@@ -12,6 +52,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# profiles requests sent with X-Profile: <PROFILING_ADMIN_TOKEN> (or sampled), see services/profiling.py
+app.add_middleware(ProfilingMiddleware)
+# anonymized request shapes for tools/replay_traffic.py when TRAFFIC_RECORD_PATH is set
+app.add_middleware(TrafficRecorderMiddleware)
 
 
 # include router to the system
@@ -22,4 +66,16 @@ app.include_router(auth_router.router, prefix="/api/v1", tags=["Auth"])
 
 @app.get("/")
 def read_root():
-    return {"status": "System Operational", "architecture": "Modular"}
\ No newline at end of file
+    return {"status": "System Operational", "architecture": "Modular"}
+
+@app.get("/ready")
+def read_ready(response: Response):
+    """Readiness probe: 503 until every upstream has been warmed up"""
+    report = readiness.report()
+    if not report["ready"]:
+        response.status_code = 503
+    return report
+
+@app.get("/metrics")
+def read_metrics():
+    return {"counters": snapshot(), "compression": get_compression_stats(), "journal": get_journal_stats(), "writeBehind": write_behind.stats(), "admission": admission.stats(), "push": push_hub.stats()}
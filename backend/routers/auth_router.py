@@ -1,12 +1,11 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from firebase_admin import auth
 from datetime import datetime
 import sys
 from pathlib import Path
  
 try:
-    from services.firebase_db import initialize_firebase, get_firestore_client
+    from ..services.firebase_db import initialize_firebase, get_firestore_client
 except ImportError:
     sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
     from services.firebase_db import initialize_firebase, get_firestore_client
@@ -42,6 +41,7 @@ async def verify_firebase_token(request: TokenVerifyRequest):
     Verify Firebase ID token from frontend and return user info.
     Creates user in Firestore if they don't exist.
     """
+    from firebase_admin import auth
     try:
         # Initialize Firebase Admin if not already done
         initialize_firebase()
@@ -121,6 +121,7 @@ async def signup_with_email(request: EmailPasswordSignupRequest):
     Create a new user with email and password.
     Returns user info and custom token for frontend authentication.
     """
+    from firebase_admin import auth
     try:
         initialize_firebase()
        
@@ -172,6 +173,7 @@ async def login_with_email(request: EmailPasswordLoginRequest):
     Note: Password verification happens on the frontend with Firebase Client SDK.
     This endpoint verifies the user exists and returns user info.
     """
+    from firebase_admin import auth
     try:
         initialize_firebase()
        
@@ -228,6 +230,7 @@ async def reset_password(request: PasswordResetRequest):
     Note: The actual email sending is handled by Firebase.
     This endpoint generates a password reset link.
     """
+    from firebase_admin import auth
     try:
         initialize_firebase()
        
@@ -1,5 +1,9 @@
+import asyncio
 from time import perf_counter
-from fastapi import APIRouter, HTTPException
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request, Response, WebSocket
+from fastapi.responses import StreamingResponse
 
 
 # from schemas.prompt import PromptInput, PromptDBModel
@@ -10,23 +14,69 @@ try:
     from ..schemas.prompt import PromptDBModel, PromptInput
     from ..services.nebius_ai import  test_nebius_api
     from ..services.firebase_db import get_firestore_client
+    from ..services.history_export import iter_user_prompts, export_ndjson, export_csv
+    from ..services import analytics
+    from ..services.fan_out import fan_out_optimize, FAN_OUT_POLICIES
+    from ..services.deadline import run_with_deadline, wait_with_deadline, request_scope, check_budget
+    from ..services.write_journal import get_write_batch
+    from ..services.prompt_repository import repository as prompt_repository
+    from ..services import quota
+    from ..services.admission import controller as admission
+    from ..services import history_sync
+    from ..services.history_push import hub as push_hub, PushLimitReached, CLOSE_TRY_AGAIN, backfill as push_backfill
+    from ..core.config import settings
+    from ..services.model_registry import known_models
+    from ..services.llm_budget import parse_target
+    from ..services.history_search import indexes as search_indexes
+    from ..services.write_behind import buffer as write_behind
 except ImportError:
     # Add parent directory to path when running directly
     sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
     from schemas.prompt import PromptDBModel, PromptInput
     from services.nebius_ai import test_nebius_api
     from services.firebase_db import get_firestore_client
+    from services.history_export import iter_user_prompts, export_ndjson, export_csv
+    from services import analytics
+    from services.fan_out import fan_out_optimize, FAN_OUT_POLICIES
+    from services.deadline import run_with_deadline, wait_with_deadline, request_scope, check_budget
+    from services.write_journal import get_write_batch
+    from services.prompt_repository import repository as prompt_repository
+    from services import quota
+    from services.admission import controller as admission
+    from services import history_sync
+    from services.history_push import hub as push_hub, PushLimitReached, CLOSE_TRY_AGAIN, backfill as push_backfill
+    from core.config import settings
+    from services.model_registry import known_models
+    from services.llm_budget import parse_target
+    from services.history_search import indexes as search_indexes
+    from services.write_behind import buffer as write_behind
     
 import uuid
+import orjson
 
 router = APIRouter()
 
 @router.post("/parse", response_model=dict)
-async def parse_only(request: PromptInput):
+async def parse_only(request: PromptInput, http_request: Request, response: Response):
     """
     Step 1: Parse and analyze a prompt without optimization.
     Returns parsed data, scores, and promptID for later optimization.
+    Cancelled when the client disconnects or the X-Request-Deadline-Ms budget runs out.
+    Rejected with 429 when the user is over quota, 503 when the worker is saturated.
     """
+    # over-quota requests get their 429 right away instead of waiting for a slot first
+    estimate = PromptDBModel(inputPrompt=request.inputPrompt).estimate_cost(optimize=False)
+    account = quota.admit(request.userID, request.projectID, estimate["totalTokens"])
+    # one deadline for queueing and the work
+    async with request_scope(http_request):
+        async with admission.slot(on_reject=account.refund if account else None):
+            result = await run_with_deadline(http_request, _parse_only, request)
+    if account:
+        response.headers.update(account.headers())
+    return result
+
+
+def _parse_only(request: PromptInput) -> dict:
     try:
         start_time = perf_counter()
         
@@ -34,7 +84,7 @@ async def parse_only(request: PromptInput):
         prompt_model = PromptDBModel(
             promptID=str(uuid.uuid4()),
             userID=request.userID,
-            projectID="default-project",
+            projectID=request.projectID,
             inputPrompt=request.inputPrompt,
         )
         
@@ -45,7 +95,7 @@ async def parse_only(request: PromptInput):
         parse_latency = (end_time - start_time) * 1000
         
         # Save to Firestore with parsed data only
-        prompt_model.set_to_firestore()
+        prompt_model.set_to_firestore(analytics_deltas=analytics.prompt_deltas(prompt_model, new_prompt=True))
         
         return {
             "status": "success",
@@ -54,46 +104,82 @@ async def parse_only(request: PromptInput):
             "overallScores": parsed_result.get("overallScores"),
             "completionTokens": parsed_result.get("completionTokens"),
             "promptTokens": parsed_result.get("promptTokens"),
+            "inputReduction": parsed_result.get("inputReduction"),
             "parseLatencyMs": parse_latency
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/optimizeExisting/{prompt_id}", response_model=dict)
-async def optimize_existing(prompt_id: str, weights: dict = None, ai_model: str = "openai/gpt-oss-20b"):
+async def optimize_existing(prompt_id: str, http_request: Request, response: Response, weights: dict = None, ai_model: str = "openai/gpt-oss-20b",
+                            target: Optional[str] = None):
     """
     Step 2: Optimize an already-parsed prompt.
     Takes a promptID from /parse endpoint and generates optimized version.
+    target: "shorter" (than the input) or a token count; results over it are flagged with overBudget.
+    """
+    parse_target(target, 0)
+    # one deadline for loading, queueing and the LLM call
+    async with request_scope(http_request):
+        prompt_model, estimated_tokens = await run_with_deadline(http_request, _load_for_optimize, prompt_id, weights,
+                                                                 [ai_model])
+        # the owner's quota is checked before queueing for a slot; admitted on the event loop,
+        # so the account is current in the optimize thread and its LLM tokens are charged
+        account = quota.admit(prompt_model.userID, prompt_model.projectID, estimated_tokens)
+        async with admission.slot(on_reject=account.refund if account else None):
+            return await run_with_deadline(http_request, _optimize_existing, prompt_model, weights, ai_model,
+                                           response, target, account)
+
+
+def _load_for_optimize(prompt_id: str, weights: Optional[dict], models: list[str],
+                       target: Optional[str] = None) -> tuple:
+    """
+    Load a parsed prompt, check the target against it and estimate an optimization
+    with each model: (PromptDBModel, estimated total tokens). Blocking (Firestore, tiktoken).
     """
     try:
-        from services.firebase_db import get_firestore_client
-        
-        start_time = perf_counter()
-        
-        # Load prompt from Firestore
         prompt_model = PromptDBModel.get_prompt_from_firestore(prompt_id)
         if not prompt_model:
             raise HTTPException(status_code=404, detail="Prompt not found")
-        
+        parse_target(target, prompt_model.initialTokenSize)
+        estimated_tokens = sum(prompt_model.estimate_cost(model, weights, parse=False)["totalTokens"] for model in models)
+        return prompt_model, estimated_tokens
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _optimize_existing(prompt_model: PromptDBModel, weights: Optional[dict], ai_model: str, response: Response,
+                       target: Optional[str] = None, account=None) -> dict:
+    try:
+        start_time = perf_counter()
+        prompt_id = prompt_model.promptID
+
         # Optimize with optional weights
         if weights:
-            optimized_result = prompt_model.optimize_new_prompt_with_llm(ai_model=ai_model, weights=weights)
+            optimized_result = prompt_model.optimize_new_prompt_with_llm(ai_model=ai_model, weights=weights, target=target)
         else:
-            optimized_result = prompt_model.optimize_new_prompt_with_llm(ai_model=ai_model)
+            optimized_result = prompt_model.optimize_new_prompt_with_llm(ai_model=ai_model, target=target)
         
         end_time = perf_counter()
         optimize_latency = (end_time - start_time) * 1000
+        if account:
+            response.headers.update(account.headers())
+        prompt_model.latencyMs[optimized_result["optimizedPromptID"]] = optimize_latency
         
-        # Save latency to Firestore
-        prompt_model.save_latency_to_firestore(optimize_latency, optimized_result["optimizedPromptID"])
-        
-        # Update Firestore with optimized data
+        # Update Firestore with optimized data and latency (raises instead of answering 200 for a lost write)
         prompt_model.update_in_firestore({
             "optimizedPrompts": prompt_model.optimizedPrompts,
+            "latencyMs": prompt_model.latencyMs,
             "finalTokenSizes": prompt_model.finalTokenSizes,
-            "usedLLMs": prompt_model.usedLLMs
-        })
+            "usedLLMs": prompt_model.usedLLMs,
+            "completionUsage": prompt_model.completionUsage,
+            "promptVersions": prompt_model.promptVersions
+        }, analytics_deltas=analytics.prompt_deltas(prompt_model, [optimized_result["optimizedPromptID"]]))
         
         return {
             "status": "success",
@@ -102,6 +188,9 @@ async def optimize_existing(prompt_id: str, weights: dict = None, ai_model: str
             "optimizedPrompt": optimized_result["optimizedPrompt"],
             "finalTokenSize": optimized_result["finalTokenSize"],
             "usedLLM": optimized_result["usedLLM"],
+            "truncated": optimized_result["truncated"],
+            "overBudget": optimized_result["overBudget"],
+            "usage": optimized_result["usage"],
             "optimizeLatencyMs": optimize_latency
         }
     except HTTPException:
@@ -110,12 +199,114 @@ async def optimize_existing(prompt_id: str, weights: dict = None, ai_model: str
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/optimizeFanOut/{prompt_id}", response_model=dict)
+async def optimize_fan_out(prompt_id: str, request: dict, http_request: Request, response: Response):
+    """
+    Optimize an already-parsed prompt with several models at the same time.
+    
+    Request body:
+    {
+        "models": ["openai/gpt-oss-20b", "..."],
+        "policy": "first" | "all" | "best",   // default "best"
+        "weights": {...},                      // optional
+        "target": "shorter" | 300              // optional strict length, see /optimizeExisting
+    }
+    first: return the fastest variant, the others finish in the background
+    all:   wait for every model and return all variants
+    best:  wait for every model and rank variants by token reduction
+    All variants are saved in one Firestore write.
+    Cancelled when the client disconnects or the X-Request-Deadline-Ms budget runs out.
+    """
+    try:
+        models = request.get("models") or []
+        policy = request.get("policy", "best")
+        if not models:
+            raise HTTPException(status_code=400, detail="models must be a non-empty list")
+        if policy not in FAN_OUT_POLICIES:
+            raise HTTPException(status_code=400, detail=f"policy must be one of {', '.join(FAN_OUT_POLICIES)}")
+
+        models = list(dict.fromkeys(models))
+        target = request.get("target")
+        target = str(target) if target is not None else None
+
+        # one deadline for loading, queueing and the models
+        async with request_scope(http_request):
+            start_time = perf_counter()
+            prompt_model, estimated_tokens = await run_with_deadline(
+                http_request, _load_for_optimize, prompt_id, request.get("weights"), models, target
+            )
+            account = quota.admit(prompt_model.userID, prompt_model.projectID, estimated_tokens)
+
+            def persist(variants: list) -> None:
+                prompt_model.update_in_firestore({
+                    "optimizedPrompts": prompt_model.optimizedPrompts,
+                    "finalTokenSizes": prompt_model.finalTokenSizes,
+                    "usedLLMs": prompt_model.usedLLMs,
+                    "latencyMs": prompt_model.latencyMs,
+                    "completionUsage": prompt_model.completionUsage,
+                    "promptVersions": prompt_model.promptVersions
+                }, analytics_deltas=analytics.prompt_deltas(prompt_model, [v["optimizedPromptID"] for v in variants]))
+
+            # one slot per model
+            async with admission.slot(weight=len(models), on_reject=account.refund if account else None):
+                result = await wait_with_deadline(http_request, fan_out_optimize(
+                    prompt_model, models, policy, request.get("weights"), persist, target
+                ))
+                if result.get("background") is not None:
+                    # "first": the models still running keep their slots until they finish
+                    admission.retain(len(result["pending"]), result["background"])
+            if result["selected"] is None:
+                # models that gave up on the deadline: 504 instead of 502
+                check_budget()
+                raise HTTPException(status_code=502, detail={"message": "All models failed", "errors": result["errors"]})
+        if account:
+            response.headers.update(account.headers())
+
+        return {
+            "status": "success",
+            "promptID": prompt_id,
+            "policy": policy,
+            "optimizedPromptID": result["selected"]["optimizedPromptID"],
+            "optimizedPrompt": result["selected"]["optimizedPrompt"],
+            "finalTokenSize": result["selected"]["finalTokenSize"],
+            "usedLLM": result["selected"]["usedLLM"],
+            "variants": result["variants"],
+            "pendingModels": result.get("pending", []),
+            "errors": result["errors"],
+            "optimizeLatencyMs": (perf_counter() - start_time) * 1000
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/optimize", response_model=dict)
-async def optimize_prompt(request: PromptInput, weights: dict = None, ai_model: str = "openai/gpt-oss-20b"):
+async def optimize_prompt(request: PromptInput, http_request: Request, response: Response, weights: dict = None, ai_model: str = "openai/gpt-oss-20b", dryRun: bool = False,
+                          target: Optional[str] = None):
     """
     Combined workflow: Parse and optimize in one request.
     For quick optimization without UI interaction between steps.
+    Cancelled when the client disconnects or the X-Request-Deadline-Ms budget runs out.
+    Rejected with 429 when the user is over quota, 503 when the worker is saturated.
+    With dryRun=true only the token / cost estimate is returned and no model is called.
+    target: "shorter" (than the input) or a token count; results over it are flagged with overBudget.
     """
+    parse_target(target, 0)
+    estimate = PromptDBModel(inputPrompt=request.inputPrompt).estimate_cost(ai_model, weights)
+    if dryRun:
+        return {"status": "success", "dryRun": True, "model": ai_model, "estimate": estimate}
+
+    account = quota.admit(request.userID, request.projectID, estimate["totalTokens"])
+    async with request_scope(http_request):
+        async with admission.slot(on_reject=account.refund if account else None):
+            result = await run_with_deadline(http_request, _optimize_prompt, request, weights, ai_model, target)
+    if account:
+        response.headers.update(account.headers())
+    return result
+
+
+def _optimize_prompt(request: PromptInput, weights: Optional[dict], ai_model: str, target: Optional[str] = None) -> dict:
     try:
         total_start = perf_counter()
         
@@ -123,27 +314,30 @@ async def optimize_prompt(request: PromptInput, weights: dict = None, ai_model:
         prompt_model = PromptDBModel(
             promptID=str(uuid.uuid4()),
             userID=request.userID,
-            projectID="default-project",
+            projectID=request.projectID,
             inputPrompt=request.inputPrompt,
         )
         
         # Step 1: Parse
         parse_start = perf_counter()
-        parsed_result = prompt_model.get_parsed_data_and_scores_from_llm_returns_score(weights or {})
+        if weights:
+            parsed_result = prompt_model.get_parsed_data_and_scores_from_llm_returns_score(weights)
+        else:
+            parsed_result = prompt_model.get_parsed_data_and_scores_from_llm_returns_score()
         parse_latency = (perf_counter() - parse_start) * 1000
         
         # Step 2: Optimize
         optimize_start = perf_counter()
-        optimized_result = prompt_model.optimize_new_prompt_with_llm(ai_model=ai_model, weights=weights or {})
+        optimized_result = prompt_model.optimize_new_prompt_with_llm(ai_model=ai_model, weights=weights or {}, target=target)
         optimize_latency = (perf_counter() - optimize_start) * 1000
         
         total_latency = (perf_counter() - total_start) * 1000
         
-        # Save latency
-        prompt_model.save_latency_to_firestore(optimize_latency, optimized_result["optimizedPromptID"])
-        
-        # Save to Firestore
-        prompt_model.set_to_firestore()
+        # Save to Firestore, latency included
+        prompt_model.latencyMs[optimized_result["optimizedPromptID"]] = optimize_latency
+        prompt_model.set_to_firestore(analytics_deltas=analytics.prompt_deltas(
+            prompt_model, [optimized_result["optimizedPromptID"]], new_prompt=True
+        ))
         
         return {
             "status": "success",
@@ -154,10 +348,16 @@ async def optimize_prompt(request: PromptInput, weights: dict = None, ai_model:
             "optimizedPrompt": optimized_result["optimizedPrompt"],
             "initialTokenSize": parsed_result.get("completionTokens"),
             "finalTokenSize": optimized_result["finalTokenSize"],
+            "inputReduction": parsed_result.get("inputReduction"),
+            "truncated": optimized_result["truncated"],
+            "overBudget": optimized_result["overBudget"],
+            "usage": {"parse": parsed_result.get("usage"), "optimize": optimized_result["usage"]},
             "parseLatencyMs": parse_latency,
             "optimizeLatencyMs": optimize_latency,
             "totalLatencyMs": total_latency
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -182,44 +382,169 @@ async def test_nebius_ai(request : dict):
         
         user_response = test_nebius_api(user_input, ai_model)
         
-        return user_response
+        return user_response.to_dict()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/models")
+async def list_models():
+    """
+    Models with known tokenizer and prices (USD per 1M tokens)
+    """
+    return {"status": "success", "models": known_models()}
+
+
 @router.get("/history/{user_id}")
-async def get_prompt_history(user_id: str, limit: int = 50):
+async def get_prompt_history(user_id: str, limit: int = 50, since: Optional[str] = None,
+                             projectID: Optional[str] = None):
     """
     Get prompt history for a specific user
+
+    Without `since` the latest `limit` prompts are returned. Pass the returned
+    `cursor` as `since` to get only what changed afterwards:
+    `history` holds created / modified prompts, `deleted` the removed prompt IDs.
+    With `hasMore` call again with the new cursor; with `fullResync` reload
+    without `since`. `projectID` limits the history to one project.
     """
     try:
-        db = get_firestore_client()
-        prompts_ref = db.collection("prompts")
-        # Query prompts for this user, order by createdAt descending
-        query = prompts_ref.where("userID", "==", user_id).limit(limit)
-        docs = query.stream()
-        
-        history = []
-        for doc in docs:
-            data = doc.to_dict()
-            # Handle timestamp conversion
-            created_at = data.get("createdAt")
-            if hasattr(created_at, 'isoformat'):
-                created_at = created_at.isoformat()
-            
-            history.append({
-                "id": data.get("promptID"),
-                "prompt": data.get("inputPrompt"),
-                "optimizedPrompt": data.get("optimizedPrompts", {}).get("default", ""),
-                "timestamp": created_at,
-                "tokenCount": data.get("initialTokenSize", 0),
-                "latency": data.get("latencyMs", {}).get("default", 0),
-            })
-        
-        # Sort by timestamp in Python (descending)
-        history.sort(key=lambda x: x.get("timestamp") or "", reverse=True)
-        
-        return {"status": "success", "history": history}
+        if since:
+            changes = history_sync.changes_since(user_id, history_sync.decode_cursor(since), project_id=projectID)
+            return {
+                "status": "success",
+                "history": [history_sync.history_item(data) for data in changes["changed"]],
+                "deleted": changes["deleted"],
+                "cursor": changes["cursor"],
+                "hasMore": changes["hasMore"],
+                "fullResync": changes["fullResync"],
+            }
+
+        # includes acknowledged writes still waiting in the write journal
+        loaded = history_sync.latest(user_id, limit, project_id=projectID)
+        history = [history_sync.history_item(data) for data in loaded["documents"]]
+        return {"status": "success", "history": history, "cursor": loaded["cursor"]}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.websocket("/history/{user_id}/live")
+async def history_live(websocket: WebSocket, user_id: str, since: Optional[str] = None):
+    """
+    Push history changes while the app is open.
+
+    Messages: {"type": "ready"}, {"type": "changed", "prompt": {...}, "cursor": ...},
+    {"type": "deleted", "id": ..., "cursor": ...}, {"type": "ping"} and
+    {"type": "resync"} (client fell behind: reload with /history?since=, then reconnect).
+    `since`: the cursor of the client's last /history load; what changed after it is
+    sent right after "ready" (a diff may arrive twice). Without it only changes made
+    after connecting are pushed.
+    Closed with 1013 when the worker's connection limits are reached, 1008 for an invalid `since`.
+    """
+    await websocket.accept()
+    try:
+        cursor = history_sync.decode_cursor(since) if since else None
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+    try:
+        queue = push_hub.connect(user_id)
+    except PushLimitReached as e:
+        await websocket.close(code=CLOSE_TRY_AGAIN, reason=str(e))
+        return
+
+    async def send(diff: dict) -> bool:
+        """Send one message; False once the connection was closed for a resync"""
+        await websocket.send_text(orjson.dumps(diff).decode())
+        if diff["type"] == "resync":
+            await websocket.close()
+            return False
+        return True
+
+    async def pump():
+        await websocket.send_text('{"type":"ready"}')
+        # registered first, so changes from here on are queued while the backfill is read
+        if cursor is not None:
+            for diff in await asyncio.to_thread(push_backfill, user_id, cursor):
+                if not await send(diff):
+                    return
+        while True:
+            try:
+                diff = await asyncio.wait_for(queue.get(), settings.HISTORY_PUSH_PING_S)
+            except asyncio.TimeoutError:
+                diff = {"type": "ping"}
+            if not await send(diff):
+                return
+
+    async def drain():
+        # the client doesn't send anything meaningful; this notices the disconnect
+        while True:
+            await websocket.receive_text()
+
+    tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(drain())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        push_hub.disconnect(user_id, queue)
+
+
+@router.get("/history/{user_id}/export")
+async def export_prompt_history(
+    user_id: str,
+    format: str = "ndjson",
+    projectID: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    isFavorite: Optional[bool] = None,
+    includeVariants: bool = False,
+):
+    """
+    Stream a user's full prompt history as NDJSON or CSV.
+    Firestore is paged with cursors, so memory use doesn't grow with history size.
+    """
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+
+    prompts = iter_user_prompts(user_id, project_id=projectID, start=start, end=end, is_favorite=isFavorite)
+    if format == "csv":
+        rows = export_csv(prompts, include_variants=includeVariants)
+        media_type = "text/csv"
+    else:
+        rows = export_ndjson(prompts, include_variants=includeVariants)
+        media_type = "application/x-ndjson"
+
+    filename = f"prompt-history-{user_id}.{format}"
+    return StreamingResponse(rows, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@router.get("/history/{user_id}/search")
+async def search_prompt_history(user_id: str, q: str, limit: int = 20, projectID: Optional[str] = None):
+    """
+    Full-text search over a user's prompts (input, optimized variants, parsed components),
+    ranked by BM25. The first search of a user builds the index, later ones use it.
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="q must not be empty")
+    try:
+        start = perf_counter()
+        result = await asyncio.to_thread(search_indexes.search, user_id, q, max(1, min(limit, 100)), projectID)
+        return {"status": "success", **result, "tookMs": round((perf_counter() - start) * 1000, 2)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/analytics/{user_id}")
+async def get_user_analytics(user_id: str):
+    """
+    Token savings, scores, ratings and latency percentiles for a user,
+    overall and per project / model. Reads only the pre-aggregated shards.
+    """
+    try:
+        return {"status": "success", "analytics": analytics.read_user_analytics(user_id)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -227,12 +552,19 @@ async def get_prompt_history(user_id: str, limit: int = 50):
 @router.delete("/prompt/{prompt_id}")
 async def delete_prompt(prompt_id: str):
     """
-    Delete a prompt from history
+    Delete a prompt from history (leaves a tombstone for /history?since= syncs)
     """
     try:
         db = get_firestore_client()
-        prompt_ref = db.collection("prompts").document(prompt_id)
-        prompt_ref.delete()
+        prompt_data = prompt_repository.get(db, prompt_id)
+        batch = get_write_batch(db)
+        prompt_repository.delete(db, batch, prompt_id)
+        if prompt_data is not None:
+            analytics.add_to_batch(db, batch, prompt_data.get("userID", ""), analytics.delete_deltas(prompt_data))
+            history_sync.add_tombstone(db, batch, prompt_id, prompt_data.get("userID", ""))
+        batch.commit()
+        if prompt_data is not None:
+            search_indexes.remove(prompt_data.get("userID", ""), prompt_id)
         return {"status": "success", "message": f"Prompt {prompt_id} deleted"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -242,31 +574,27 @@ async def delete_prompt(prompt_id: str):
 async def save_feedback(feedback_data: dict):
     """
     Save user rating for a prompt (1-5)
-    
+
     Request body:
     {
         "promptID": "...",
         "rating": 5  // number between 1-5
     }
+
+    Acknowledged once buffered; the rating and its analytics are written with
+    the next write-behind flush (see services/write_behind.py).
     """
     try:
-        db = get_firestore_client()
-        
         # Validate rating
         rating = feedback_data.get("rating")
         if not rating or not isinstance(rating, (int, float)) or rating < 1 or rating > 5:
             raise HTTPException(status_code=400, detail="Rating must be a number between 1 and 5")
-        
-        # Update prompt with rating directly
-        if feedback_data.get("promptID"):
-            prompt_ref = db.collection("prompts").document(feedback_data["promptID"])
-            prompt_ref.update({
-                "ratings": {"user": int(rating)}
-            })
-            return {"status": "success", "promptID": feedback_data["promptID"]}
-        else:
+        if not feedback_data.get("promptID"):
             raise HTTPException(status_code=400, detail="promptID is required")
-        
+
+        write_behind.rate(feedback_data["promptID"], int(rating))
+        return {"status": "success", "promptID": feedback_data["promptID"]}
+
     except HTTPException:
         raise
     except Exception as e:
@@ -276,34 +604,51 @@ async def save_feedback(feedback_data: dict):
 @router.put("/prompt/{prompt_id}/favorite")
 async def toggle_favorite(prompt_id: str, data: dict):
     """
-    Toggle favorite status of a prompt
+    Toggle favorite status of a prompt (write-behind, the last toggle wins)
     """
     try:
-        db = get_firestore_client()
-        prompt_ref = db.collection("prompts").document(prompt_id)
-        prompt_ref.update({"isFavorite": data.get("isFavorite", False)})
+        write_behind.favorite(prompt_id, bool(data.get("isFavorite", False)))
         return {"status": "success", "message": "Favorite status updated"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/prompt/{prompt_id}/copy")
+async def record_copy(prompt_id: str):
+    """
+    Count a copy of a prompt (copyCount); copies are summed until the next write-behind flush
+    """
+    try:
+        write_behind.copied(prompt_id)
+        return {"status": "success", "promptID": prompt_id}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/parsePrompt", response_model=dict)
 async def parse_prompt(request: PromptDBModel):
-    try:
-        start_time = perf_counter()
-        parsed_result = request.get_parsed_data_and_scores_from_llm_returns_score()
+    async with admission.slot():
+        try:
+            start_time = perf_counter()
+            parsed_result = request.get_parsed_data_and_scores_from_llm_returns_score()
         
-        optimized_result = request.optimize_new_prompt_with_llm()
+            optimized_result = request.optimize_new_prompt_with_llm()
 
-        process_time = perf_counter() - start_time
+            process_time = perf_counter() - start_time
 
-        request.save_latency_to_firestore(process_time, optimized_result["optimizedPromptID"])
+            request.save_latency_to_firestore(process_time, optimized_result["optimizedPromptID"])
         
-        return {
-            "parsedData": parsed_result,
-            "optimizedPrompt": optimized_result,
-            "processTime" : process_time
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+            return {
+                "parsedData": parsed_result,
+                "optimizedPrompt": optimized_result,
+                "processTime" : process_time
+            }
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
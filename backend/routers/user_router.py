@@ -2,8 +2,6 @@ from fastapi import APIRouter, HTTPException, Depends
 from typing import Optional
 from datetime import datetime
 import uuid
-from passlib.context import CryptContext
-import jwt
 
 import sys
 from pathlib import Path
@@ -29,7 +27,15 @@ class UserCreateRequest:
         self.email = email
         self.profileImageURL = profileImageURL
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# passlib / jwt are only needed by /login, load them lazily
+_pwd_context = None
+
+def get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
 
 # Secret key for JWT
 SECRET_KEY = "your_secret_key"
@@ -37,12 +43,13 @@ ALGORITHM = "HS256"
 
 # Helper functions
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
  
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
  
 def create_access_token(data: dict):
+    import jwt
     return jwt.encode(data, SECRET_KEY, algorithm=ALGORITHM)
 
 @router.post("/create", response_model=dict)
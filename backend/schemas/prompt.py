@@ -1,7 +1,9 @@
 import json
 import uuid
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union
 from datetime import datetime
 
 # Handle imports for both direct execution and module import
@@ -12,18 +14,47 @@ from pathlib import Path
 try:    
     from ..services.nebius_ai import run_nebius_ai
     from ..services.firebase_db import get_firestore_client
-    from ..services.token_counter import count_tokens
+    from ..services.token_counter import count_tokens, DEFAULT_ENCODING
+    from ..services.model_registry import encoding_for, estimate_call, combine_estimates
+    from ..services.compression import compress_prompt_fields, decompress_prompt_fields
+    from ..services.chunking import split_prompt
+    from ..services.prompt_reduction import reduce_prompt, ReducedPrompt
+    from ..services.metrics import increment
+    from ..services.llm_budget import parse_budget, optimize_budget, parse_target, CompletionTruncated
+    from ..services import analytics
+    from ..services.deadline import check_budget, firestore_call_kwargs
+    from ..services.write_journal import get_write_batch
+    from ..services.prompt_repository import repository, DEFAULT_PROJECT
+    from ..services.profiling import span
+    from ..services.history_sync import touch, add_tombstone
+    from ..services.history_search import indexes as search_indexes
+    from ..core.config import settings
 except ImportError:
     # Add parent directory to path when running directly
     sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
     from services.firebase_db import get_firestore_client
     from services.nebius_ai import run_nebius_ai
-    from services.token_counter import count_tokens    
+    from services.token_counter import count_tokens, DEFAULT_ENCODING
+    from services.model_registry import encoding_for, estimate_call, combine_estimates
+    from services.compression import compress_prompt_fields, decompress_prompt_fields
+    from services.chunking import split_prompt
+    from services.prompt_reduction import reduce_prompt, ReducedPrompt
+    from services.metrics import increment
+    from services.llm_budget import parse_budget, optimize_budget, parse_target, CompletionTruncated
+    from services import analytics
+    from services.deadline import check_budget, firestore_call_kwargs
+    from services.write_journal import get_write_batch
+    from services.prompt_repository import repository, DEFAULT_PROJECT
+    from services.profiling import span
+    from services.history_sync import touch, add_tombstone
+    from services.history_search import indexes as search_indexes
+    from core.config import settings
 
 
 class PromptInput(BaseModel):
     userID: str
     inputPrompt: str
+    projectID: str = DEFAULT_PROJECT
     targetRole : Optional[str] = ""
  
 # 1. parsed data
@@ -61,6 +92,106 @@ class ParsedPrompt(BaseModel):
         }
 
 
+PARSED_COMPONENTS = ("role", "task", "context", "style", "output", "rules")
+
+
+def merge_parsed_prompts(parts: List[ParsedPrompt]) -> ParsedPrompt:
+    """
+    Combine the extractions of several prompt chunks into one ParsedPrompt.
+    Component texts are joined in chunk order (duplicates dropped) and each
+    component keeps the best score any chunk gave it.
+    """
+    merged = {}
+    for component in PARSED_COMPONENTS:
+        texts = []
+        scores = []
+        for part in parts:
+            text = getattr(part, component)
+            if not text:
+                continue
+            if text not in texts:
+                texts.append(text)
+            scores.append(getattr(part, f"{component}_score") or 0)
+        merged[component] = "\n".join(texts)
+        merged[f"{component}_score"] = max(scores) if scores else 0
+    return ParsedPrompt(**merged)
+
+
+# system prompts, module level so pre-flight estimates count exactly what is sent
+PARSE_SYSTEM_PROMPT = """
+        You are an expert Prompt Engineer. Analyze the provided prompt and parse it into six components: Task, Role, Style, Output, Rules, and Context.
+
+        ### Instructions
+        1. **Extraction:** Extract the *verbatim* text for each component. Do not summarize or alter the text.
+        2. **Scoring:** Rate each component from 0-10 based on the "Scoring Rubric" below.
+        3. **Missing Data:** If a component is not found, set its text aspect to "" (empty string) and its score to 0.
+
+        ### Scoring Rubric
+        * **0:** Component is completely missing.
+        * **1-4:** Vague or implied (e.g., "write something").
+        * **5-7:** Clear but generic (e.g., "write a blog post").
+        * **8-10:** Highly specific, detailed, and constraint-driven.
+
+        ### Output Format
+        Return valid JSON only. Adhere strictly to this schema:
+        {
+        "task": "extracted text", "task_score": int,
+        "role": "extracted text", "role_score": int,
+        "style": "extracted text", "style_score": int,
+        "output": "extracted text", "output_score": int,
+        "rules": "extracted text", "rules_score": int,
+        "context": "extracted text", "context_score": int
+        }
+        """
+
+
+def optimize_system_prompt(weights: dict[str, float]) -> str:
+    return f"""
+        You are a world-class Prompt Engineering expert. Using the parsed components of the user's prompt, rewrite it into a highly optimized, professional prompt that will yield the best results from an AI model.
+
+        ### Instructions
+        1. **Incorporate Components:** Seamlessly integrate the Task, Role, Style, Output, Rules, and Context into a coherent prompt.
+        2. **Enhance Clarity:** Use precise language and structure to ensure the prompt is clear and unambiguous.
+        3. **Maximize Effectiveness:** Tailor the prompt to leverage the strengths of AI models, focusing on specificity and detail.
+        4. **Weighted Approach:** Prioritize components based on the following weights when crafting the prompt:
+        {weights}
+
+        ### Output
+        Provide only the optimized prompt text without any additional commentary or formatting.
+        """
+
+
+# system prompt versions: register a new one when the rubric or the optimize prompt changes,
+# tools/reoptimize_history.py re-runs existing prompts under it for comparison
+SYSTEM_PROMPT_VERSIONS = {
+    "v1": {"parse": PARSE_SYSTEM_PROMPT, "optimize": optimize_system_prompt},
+}
+CURRENT_SYSTEM_PROMPT_VERSION = "v1"
+
+
+def system_prompts(version: Optional[str] = None) -> dict:
+    """
+    Raises:
+        ValueError: Unknown version
+    """
+    version = version or CURRENT_SYSTEM_PROMPT_VERSION
+    if version not in SYSTEM_PROMPT_VERSIONS:
+        raise ValueError(f"unknown system prompt version {version!r}, expected one of {tuple(SYSTEM_PROMPT_VERSIONS)}")
+    return SYSTEM_PROMPT_VERSIONS[version]
+
+
+USAGE_KEYS = ("prompt_tokens", "completion_tokens", "total_tokens", "reasoning_tokens")
+# expected visible completion size, relative to the input prompt (pre-flight estimates)
+PARSE_COMPLETION_OVERHEAD_TOKENS = 80  # JSON keys and scores around the verbatim extracts
+OPTIMIZE_COMPLETION_RATIO = 1.5  # rewritten prompts tend to be longer than the input
+
+
+def record_completion(response) -> None:
+    """Token usage metrics, for tuning budgets against latency"""
+    increment("llm.completion_tokens", response.usage.get("completion_tokens", 0))
+    increment("llm.reasoning_tokens", response.usage.get("reasoning_tokens", 0))
+
+
 # 2. prompt object data to be stored in firestore
 class PromptDBModel(BaseModel):
     promptID: str = ""
@@ -75,9 +206,13 @@ class PromptDBModel(BaseModel):
     # metrics
     initialTokenSize: int = 0
     finalTokenSizes: Dict[str, int] = {}
+    tokenEncoding: Optional[str] = None  # encoding initialTokenSize / finalTokenSizes were counted with
     latencyMs: Dict[str, float] = {}
+    completionUsage: Dict[str, dict] = {}  # per variant / "parse": token usage, budget and flags
+    promptVersions: Dict[str, str] = {}  # per variant / "parse": system prompt version it was made with
+    parsedVersions: Dict[str, dict] = {}  # re-parses under other versions: {version: {parsedData, overallScores}}
     copyCount: int = 0
-    overallScores: Optional[Dict[str, float]] = None
+    overallScores: Optional[Union[float, Dict[str, float]]] = None  # weighted score (float)
     
     # metadata
     createdAt: datetime = Field(default_factory=datetime.now)
@@ -99,82 +234,133 @@ class PromptDBModel(BaseModel):
             "initialTokenSize": self.initialTokenSize,
             "finalTokenSizes": self.finalTokenSizes,
             "latencyMs": self.latencyMs,
+            "completionUsage": self.completionUsage,
+            "promptVersions": self.promptVersions,
+            "parsedVersions": self.parsedVersions,
             "copyCount": self.copyCount,
             "overallScores": self.overallScores,
+            "tokenEncoding": self.tokenEncoding,
             "createdAt": self.createdAt,  # Firestore handles datetime objects
             "isFavorite": self.isFavorite,
             "ratings": self.ratings
         }
-        return data
+        # large text fields are stored zstd-compressed
+        return compress_prompt_fields(data)
     
-    def set_to_firestore(self) -> str:
-        from services.firebase_db import get_firestore_client
+    def set_to_firestore(self, analytics_deltas: Optional[dict] = None) -> str:
+        # skip the write if the client is gone or the deadline passed
+        check_budget()
         db = get_firestore_client()
-        prompt_ref = db.collection("prompts").document(self.promptID)
-        prompt_ref.set(self.to_firestore_dict())
+
+        # prompt document and aggregate increments in one atomic write (journaled when enabled)
+        batch = get_write_batch(db)
+        repository.set(db, batch, touch(self.to_firestore_dict()))
+        if analytics_deltas:
+            analytics.add_to_batch(db, batch, self.userID, analytics_deltas)
+        with span("firestore.write prompts"):
+            batch.commit(**firestore_call_kwargs())
+        search_indexes.upsert(self.userID, self.model_dump())
         
         return self.promptID
         
-    def delete_from_firestore(self) -> bool:
-        try:
-            from services.firebase_db import get_firestore_client
-            db = get_firestore_client()
-            prompt_ref = db.collection("prompts").document(self.promptID)
-            prompt_ref.delete()
-            return True
-        except Exception as e:
-            return False
-        
-    def update_in_firestore(self, update_data: dict) -> bool:
-        try:
-            from services.firebase_db import get_firestore_client
-            db = get_firestore_client()
-            prompt_ref = db.collection("prompts").document(self.promptID)
-            prompt_ref.update(update_data)
-            return True
-        except Exception as e:
-            return False
-        
+    def delete_from_firestore(self) -> None:
+        """
+        Raises:
+            JournalBackpressure: The write journal is full (503)
+            Exception: The write failed
+        """
+        db = get_firestore_client()
+        stored = repository.get(db, self.promptID, self.userID, self.projectID)
+        batch = get_write_batch(db)
+        repository.delete(db, batch, self.promptID, self.userID, self.projectID)
+        if stored is not None:
+            # take the prompt's contribution back out of the aggregates
+            analytics.add_to_batch(db, batch, self.userID, analytics.delete_deltas(stored))
+        # tombstone for clients syncing history deltas
+        add_tombstone(db, batch, self.promptID, self.userID)
+        batch.commit()
+        search_indexes.remove(self.userID, self.promptID)
+
+    def update_in_firestore(self, update_data: dict, analytics_deltas: Optional[dict] = None) -> None:
+        """
+        Raises:
+            JournalBackpressure: The write journal is full (503)
+            Exception: The write failed
+        """
+        check_budget()
+        db = get_firestore_client()
+        batch = get_write_batch(db)
+        repository.update(db, batch, self.promptID, touch(compress_prompt_fields(dict(update_data))),
+                          self.userID, self.projectID)
+        if analytics_deltas:
+            analytics.add_to_batch(db, batch, self.userID, analytics_deltas)
+        with span("firestore.write prompts"):
+            batch.commit(**firestore_call_kwargs())
+        search_indexes.upsert(self.userID, self.model_dump())
+
     def get_parsed_data_and_scores_from_llm_returns_score(self, weights : dict[str, float] = {
         "task" : 2,
         "role" : 2,
         "style" : 2,
         "output" : 2,
         "rules" : 2,
-    }, ai_model: str = "openai/gpt-oss-20b") -> Optional[Dict[str, Any]]:
-        system_prompt = """
-        You are an expert Prompt Engineer. Analyze the provided prompt and parse it into six components: Task, Role, Style, Output, Rules, and Context.
+    }, ai_model: str = "openai/gpt-oss-20b", version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Args:
+            version: System prompt version (default CURRENT_SYSTEM_PROMPT_VERSION)
+        """
+        version = version or CURRENT_SYSTEM_PROMPT_VERSION
+        parse_prompt = system_prompts(version)["parse"]
+        # count with the parsing model's tokenizer; variants are counted with the same one
+        self.tokenEncoding = encoding_for(ai_model)
+        self.initialTokenSize = count_tokens(self.inputPrompt, self.tokenEncoding)
+        reduced = self.reduced_input(ai_model)
+        system_prompt = reduced.system_prompt(parse_prompt)
 
-        ### Instructions
-        1. **Extraction:** Extract the *verbatim* text for each component. Do not summarize or alter the text.
-        2. **Scoring:** Rate each component from 0-10 based on the "Scoring Rubric" below.
-        3. **Missing Data:** If a component is not found, set its text aspect to "" (empty string) and its score to 0.
+        # Long prompts: parse structural chunks concurrently and merge (map-reduce)
+        if reduced.reduced_tokens > settings.PARSE_CHUNK_THRESHOLD_TOKENS:
+            chunks = split_prompt(reduced.text, settings.PARSE_CHUNK_MAX_TOKENS)
+        else:
+            chunks = [reduced.text]
 
-        ### Scoring Rubric
-        * **0:** Component is completely missing.
-        * **1-4:** Vague or implied (e.g., "write something").
-        * **5-7:** Clear but generic (e.g., "write a blog post").
-        * **8-10:** Highly specific, detailed, and constraint-driven.
+        def parse_chunk(chunk: str):
+            budget = parse_budget(count_tokens(chunk, self.tokenEncoding) if len(chunks) > 1 else reduced.reduced_tokens)
+            response = run_nebius_ai(prompt=chunk, system_prompt=system_prompt, ai_model=ai_model,
+                                     **budget.request_kwargs())
+            record_completion(response)
+            if response.finish_reason == "length":
+                # cut-off JSON can't be parsed
+                increment("llm.truncated")
+                raise CompletionTruncated("parse", budget)
+            content = response.content
+            if isinstance(content, str):
+                with span("json.loads"):
+                    content = json.loads(content)
+            with span("validate ParsedPrompt"):
+                parsed = ParsedPrompt(**content)
+            return parsed, response.usage, budget
+
+        if len(chunks) == 1:
+            results = [parse_chunk(chunks[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(chunks), settings.PARSE_CHUNK_CONCURRENCY)) as executor:
+                # each chunk thread gets a copy of the context so it sees the request deadline
+                futures = [executor.submit(contextvars.copy_context().run, parse_chunk, chunk) for chunk in chunks]
+                results = [future.result() for future in futures]
 
-        ### Output Format
-        Return valid JSON only. Adhere strictly to this schema:
-        {
-        "task": "extracted text", "task_score": int,
-        "role": "extracted text", "role_score": int,
-        "style": "extracted text", "style_score": int,
-        "output": "extracted text", "output_score": int,
-        "rules": "extracted text", "rules_score": int,
-        "context": "extracted text", "context_score": int
-        }
-        """
-        response = run_nebius_ai(prompt=self.inputPrompt, system_prompt=system_prompt, ai_model=ai_model)
-        
         # Get parsed data and scores
-        content = response["choices"][0]["message"]["content"]
-        if isinstance(content, str):
-            content = json.loads(content)
-        self.parsedData = ParsedPrompt(**content)
-        self.initialTokenSize = count_tokens(self.inputPrompt) 
+        parts = [parsed for parsed, _, _ in results]
+        self.parsedData = parts[0] if len(parts) == 1 else merge_parsed_prompts(parts)
+        if reduced.blocks:
+            # components quote the reduced input: placeholders become the elided blocks again
+            self.parsedData = self.parsedData.model_copy(update={
+                field: reduced.restore(value, append_missing=False)
+                for field, value in self.parsedData.to_dict().items() if isinstance(value, str)
+            })
+        usage = {key: sum(u.get(key, 0) for _, u, _ in results) for key in USAGE_KEYS}
+        prompt_tokens = usage["prompt_tokens"]
+        self.completionUsage["parse"] = {**usage, **results[0][2].to_dict(), "calls": len(results)}
+        self.promptVersions["parse"] = version
         
         # Calculate overall score
         total_weight = sum(weights.values())
@@ -189,107 +375,185 @@ class PromptDBModel(BaseModel):
             "parsedData": self.parsedData.to_dict() if self.parsedData else None,
             "overallScores": self.overallScores,
             "completionTokens" : self.initialTokenSize,
-            "promptTokens" : response.get("usage").get("prompt_tokens", 0),
+            "promptTokens" : prompt_tokens,
+            "chunkCount" : len(chunks),
+            "inputReduction" : reduced.stats(),
+            "usage" : self.completionUsage["parse"],
         }
     
-    def optimize_new_prompt_with_llm(self, ai_model: str = "openai/gpt-oss-20b", weights: dict[str, float] = {
+    def generate_optimized_variant(self, ai_model: str = "openai/gpt-oss-20b", weights: dict[str, float] = {
         "task" : 2,
         "role" : 2,
         "style" : 2,
         "output" : 2,
         "rules" : 2,
-    }) -> dict[str, Any]:
-        system_prompt = f"""
-        You are a world-class Prompt Engineering expert. Using the parsed components of the user's prompt, rewrite it into a highly optimized, professional prompt that will yield the best results from an AI model.
-
-        ### Instructions
-        1. **Incorporate Components:** Seamlessly integrate the Task, Role, Style, Output, Rules, and Context into a coherent prompt.
-        2. **Enhance Clarity:** Use precise language and structure to ensure the prompt is clear and unambiguous.
-        3. **Maximize Effectiveness:** Tailor the prompt to leverage the strengths of AI models, focusing on specificity and detail.
-        4. **Weighted Approach:** Prioritize components based on the following weights when crafting the prompt:
-        {weights}
-
-        ### Output
-        Provide only the optimized prompt text without any additional commentary or formatting.
+    }, target: Optional[str] = None, version: Optional[str] = None) -> dict[str, Any]:
         """
-        response = run_nebius_ai(prompt=self.inputPrompt, system_prompt=system_prompt, ai_model=ai_model)
+        Args:
+            target: Strict length for the result: "shorter" (than the input) or a token count
+            version: System prompt version (default CURRENT_SYSTEM_PROMPT_VERSION)
         
-        optimized_prompt = response["choices"][0]["message"]["content"]
-        new_optimized_id = str(uuid.uuid4())
-        self.optimizedPrompts[new_optimized_id] = optimized_prompt
-        self.finalTokenSizes[new_optimized_id] = count_tokens(optimized_prompt)
-        self.usedLLMs[new_optimized_id] = ai_model
+        Raises:
+            CompletionTruncated: The completion budget ran out before any answer was written
+        """
+        version = version or CURRENT_SYSTEM_PROMPT_VERSION
+        optimize_prompt = system_prompts(version)["optimize"]
+        reduced = self.reduced_input(ai_model)
+        target_tokens = parse_target(target, self.initialTokenSize or reduced.original_tokens)
+        budget = optimize_budget(reduced.reduced_tokens, target_tokens, reduced.block_tokens)
+        system_prompt = budget.system_prompt(reduced.system_prompt(optimize_prompt(weights)), reduced.block_tokens)
+        response = run_nebius_ai(prompt=reduced.text, system_prompt=system_prompt, ai_model=ai_model,
+                                 **budget.request_kwargs())
+        record_completion(response)
+        if response.finish_reason == "length" and not (response.content or "").strip():
+            # all of the budget went to reasoning
+            increment("llm.truncated")
+            raise CompletionTruncated("optimize", budget)
         
+        # elided code / log blocks go back where the model kept their placeholders
+        optimized_prompt = reduced.restore(response.content)
+        final_tokens = count_tokens(optimized_prompt, self.token_encoding(ai_model))
+        flags = budget.check(response.finish_reason, final_tokens)
+        for flag, value in flags.items():
+            if value:
+                increment(f"llm.{flag}")
         return {
-            "optimizedPromptID": new_optimized_id,
+            "optimizedPromptID": str(uuid.uuid4()),
             "optimizedPrompt": optimized_prompt,
-            "finalTokenSize": self.finalTokenSizes[new_optimized_id],
-            "usedLLM": ai_model
+            "finalTokenSize": final_tokens,
+            "usedLLM": ai_model,
+            "promptVersion": version,
+            "llmLatencyMs": response.latency_ms,
+            "inputTokensRemoved": reduced.tokens_removed,
+            **flags,
+            "usage": {**response.usage, **budget.to_dict(), "finishReason": response.finish_reason, **flags},
         }
 
-    def save_rating_to_firestore(self, rating: float, optimizedPromptID : str) -> bool:
-        try:
-            self.ratings[optimizedPromptID] = rating
-
-            db = get_firestore_client()
-            prompt_ref = db.collection("prompts").document(self.promptID)
-            prompt_ref.update(
-                {
-                    "ratings" : self.ratings
-                }
-            )
-            
-            return True
-        except:
-            return False
-
-    def save_latency_to_firestore(self, latency, optimizedPromptID : str) -> bool:
-        try:
-            self.latencyMs[optimizedPromptID] = latency
-
-            db = get_firestore_client()
-            prompt_ref = db.collection("prompts").document(self.promptID)
-            prompt_ref.update(
-                {
-                    "latencyMs" : self.latencyMs
-                }
-            )
-            
-            return True
-        except:
-            return False       
-
-    def toggle_favorite_in_firestore(self) -> bool:
-        try:
-            self.isFavorite = not self.isFavorite
-
-            db = get_firestore_client()
-            prompt_ref = db.collection("prompts").document(self.promptID)
-            prompt_ref.update(
-                {
-                    "isFavorite" : self.isFavorite
-                }
-            )
-            
-            return True
-        except:
-            return False
-    
+    def reduced_input(self, ai_model: str) -> ReducedPrompt:
+        """inputPrompt after the local reduction pre-pass, measured with the model's tokenizer"""
+        reduced = reduce_prompt(self.inputPrompt, settings.PROMPT_REDUCTION_LEVEL, self.token_encoding(ai_model))
+        increment("reduction.tokens_removed", reduced.tokens_removed)
+        return reduced
+
+    def token_encoding(self, ai_model: str) -> str:
+        """Encoding to count this prompt's tokens with, so initial and final sizes are comparable"""
+        if self.tokenEncoding:
+            return self.tokenEncoding
+        # prompts stored before the registry were counted with cl100k_base
+        return DEFAULT_ENCODING if self.initialTokenSize else encoding_for(ai_model)
+
+    def estimate_cost(self, ai_model: str = "openai/gpt-oss-20b", weights: Optional[dict[str, float]] = None,
+                      parse: bool = True, optimize: bool = True) -> dict:
+        """
+        Pre-flight token and cost estimate for parsing and/or optimizing this prompt,
+        without calling the model.
+
+        Returns:
+            combine_estimates() result with "parse" / "optimize" steps
+        """
+        weights = weights or {"task": 2, "role": 2, "style": 2, "output": 2, "rules": 2}
+        # what the model will see, after the reduction pre-pass
+        prompt = reduce_prompt(self.inputPrompt, settings.PROMPT_REDUCTION_LEVEL, encoding_for(ai_model))
+        input_tokens = prompt.reduced_tokens
+        steps = {}
+        if parse:
+            calls = 1
+            if input_tokens > settings.PARSE_CHUNK_THRESHOLD_TOKENS:
+                calls = -(-input_tokens // settings.PARSE_CHUNK_MAX_TOKENS)
+            steps["parse"] = estimate_call(ai_model, prompt.system_prompt(PARSE_SYSTEM_PROMPT), f"Given prompt:{prompt.text}",
+                                           input_tokens + calls * PARSE_COMPLETION_OVERHEAD_TOKENS, calls=calls)
+        if optimize:
+            steps["optimize"] = estimate_call(ai_model, prompt.system_prompt(optimize_system_prompt(weights)),
+                                              f"Given prompt:{prompt.text}",
+                                              int(input_tokens * OPTIMIZE_COMPLETION_RATIO))
+        return combine_estimates(steps)
+
+    def add_optimized_variant(self, variant: dict) -> None:
+        """Store a result of generate_optimized_variant on this prompt (not persisted)"""
+        variant_id = variant["optimizedPromptID"]
+        self.optimizedPrompts[variant_id] = variant["optimizedPrompt"]
+        self.finalTokenSizes[variant_id] = variant["finalTokenSize"]
+        self.usedLLMs[variant_id] = variant["usedLLM"]
+        if variant.get("llmLatencyMs") is not None:
+            self.latencyMs[variant_id] = variant["llmLatencyMs"]
+        if variant.get("usage"):
+            self.completionUsage[variant_id] = variant["usage"]
+        if variant.get("promptVersion"):
+            self.promptVersions[variant_id] = variant["promptVersion"]
+
+    def optimize_new_prompt_with_llm(self, ai_model: str = "openai/gpt-oss-20b", weights: dict[str, float] = {
+        "task" : 2,
+        "role" : 2,
+        "style" : 2,
+        "output" : 2,
+        "rules" : 2,
+    }, target: Optional[str] = None) -> dict[str, Any]:
+        variant = self.generate_optimized_variant(ai_model=ai_model, weights=weights, target=target)
+        self.add_optimized_variant(variant)
+        return variant
+
+    def save_rating_to_firestore(self, rating: float, optimizedPromptID : str) -> None:
+        self.ratings[optimizedPromptID] = rating
+        db = get_firestore_client()
+        batch = get_write_batch(db)
+        repository.update(
+            db, batch, self.promptID,
+            touch({
+                "ratings" : self.ratings
+            }),
+            self.userID, self.projectID,
+        )
+        batch.commit()
+
+    def save_latency_to_firestore(self, latency, optimizedPromptID : str) -> None:
+        self.latencyMs[optimizedPromptID] = latency
+        db = get_firestore_client()
+        batch = get_write_batch(db)
+        repository.update(
+            db, batch, self.promptID,
+            touch({
+                "latencyMs" : self.latencyMs
+            }),
+            self.userID, self.projectID,
+        )
+        batch.commit()
+
+    def toggle_favorite_in_firestore(self) -> None:
+        self.isFavorite = not self.isFavorite
+        db = get_firestore_client()
+        batch = get_write_batch(db)
+        repository.update(
+            db, batch, self.promptID,
+            touch({
+                "isFavorite" : self.isFavorite
+            }),
+            self.userID, self.projectID,
+        )
+        batch.commit()
+        search_indexes.set_favorite(self.userID, self.promptID, self.isFavorite)
+
     @staticmethod
-    def get_prompt_from_firestore(prompt_id: str) -> Optional["PromptDBModel"]:
-        from services.firebase_db import get_firestore_client
+    def get_prompt_from_firestore(prompt_id: str, user_id: Optional[str] = None,
+                                  project_id: Optional[str] = None) -> Optional["PromptDBModel"]:
+        check_budget()
         db = get_firestore_client()
-        prompt_ref = db.collection("prompts").document(prompt_id)
-        doc = prompt_ref.get()
-        if doc.exists:
-            data = doc.to_dict()
-            # Convert parsedData back to ParsedPrompt model
-            if data.get("parsedData"):
-                data["parsedData"] = ParsedPrompt(**data["parsedData"])
-            return PromptDBModel(**data)
+        # owner known: direct path in the nested layout, otherwise looked up by prompt ID
+        with span("firestore.get prompts"):
+            data = repository.get(db, prompt_id, user_id, project_id, **firestore_call_kwargs())
+        if data is not None:
+            return PromptDBModel.from_firestore_dict(data)
         else:
             return None
 
+    @staticmethod
+    def from_firestore_dict(data: dict) -> "PromptDBModel":
+        """Model from a raw stored document (decompressed in place)"""
+        data = decompress_prompt_fields(data)
+        # Convert parsedData back to ParsedPrompt model
+        if data.get("parsedData"):
+            data["parsedData"] = ParsedPrompt(**data["parsedData"])
+        return PromptDBModel(**data)
+
 
 
 
@@ -9,11 +9,13 @@ from pathlib import Path
 
 try:
     from ..services.firebase_db import get_firestore_client
+    from ..services.write_journal import get_write_batch, overlay
     from ..schemas.prompt import PromptDBModel
 except ImportError:
     # Add parent directory to path when running directly
     sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
     from services.firebase_db import get_firestore_client
+    from services.write_journal import get_write_batch, overlay
     from schemas.prompt import PromptDBModel
 
 
@@ -57,10 +59,11 @@ class User:
     
     def save_to_firestore(self) -> str:
         try:
-            from services.firebase_db import get_firestore_client
             db = get_firestore_client()
             user_ref = db.collection("users").document(self.userID)
-            user_ref.set(self.to_firestore_dict())
+            batch = get_write_batch(db)
+            batch.set(user_ref, self.to_firestore_dict())
+            batch.commit()
             
             return self.userID
         except Exception as e:
@@ -68,10 +71,11 @@ class User:
     
     def update_in_firestore(self) -> bool:
         try:
-            from services.firebase_db import get_firestore_client
             db = get_firestore_client()
             user_ref = db.collection("users").document(self.userID)
-            user_ref.update(self.to_firestore_dict())
+            batch = get_write_batch(db)
+            batch.update(user_ref, self.to_firestore_dict())
+            batch.commit()
             return True
         except Exception as e:
             return False
@@ -84,7 +88,9 @@ class User:
             self.projectIDs.append(project_entry)
 
             user_ref = db.collection("users").document(user_id)
-            user_ref.update({"projectIDs": self.projectIDs})
+            batch = get_write_batch(db)
+            batch.update(user_ref, {"projectIDs": self.projectIDs})
+            batch.commit()
 
             return project_id
         except Exception as e:
@@ -92,12 +98,11 @@ class User:
 
     @staticmethod
     def get_user_from_firestore(user_id: str) -> Optional["User"]:
-        from services.firebase_db import get_firestore_client
         db = get_firestore_client()
         user_ref = db.collection("users").document(user_id)
         doc = user_ref.get()
-        if doc.exists:
-            data = doc.to_dict()
+        data = overlay(user_ref.path, doc.to_dict() if doc.exists else None)
+        if data is not None:
             return User(**data)
         else:
             return None
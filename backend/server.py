@@ -0,0 +1,145 @@
+"""
+Production server entrypoint.
+
+The gunicorn master imports and warms the app once (tokenizer tables, SDK
+modules), freezes the GC and then forks uvicorn workers, so warmed memory is
+shared copy-on-write instead of loaded per worker.
+
+Usage (from backend/):
+    python server.py
+
+Graceful, warm rolling restarts:
+    kill -HUP <master pid>   # new workers fork from the warmed master, old ones drain
+    SERVER_MAX_REQUESTS      # workers are also recycled (with jitter) after this many requests
+"""
+import gc
+import math
+import os
+import sys
+from pathlib import Path
+from typing import Optional
+
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker
+
+# main.py uses package-relative imports, import it as backend.main
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from backend.core.config import settings
+
+
+def _has_module(name: str) -> bool:
+    try:
+        __import__(name)
+        return True
+    except ImportError:
+        return False
+
+
+def _read_cgroup(path: str) -> Optional[str]:
+    try:
+        return Path(path).read_text().strip()
+    except OSError:
+        return None
+
+
+def available_cpus() -> float:
+    """
+    CPUs this process may use: its affinity mask, capped by the cgroup CPU quota
+    (os.cpu_count() reports the host's CPUs inside a container).
+    """
+    try:
+        cpus = float(len(os.sched_getaffinity(0)))
+    except AttributeError:
+        cpus = float(os.cpu_count() or 1)
+
+    quota = period = None
+    cpu_max = _read_cgroup("/sys/fs/cgroup/cpu.max")  # cgroup v2: "<quota|max> <period>"
+    if cpu_max:
+        fields = cpu_max.split()
+        if fields[0] != "max" and len(fields) == 2:
+            quota, period = int(fields[0]), int(fields[1])
+    else:  # cgroup v1, quota -1 = unlimited
+        v1_quota = _read_cgroup("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+        v1_period = _read_cgroup("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        if v1_quota and v1_period and int(v1_quota) > 0:
+            quota, period = int(v1_quota), int(v1_period)
+    if quota and period:
+        cpus = min(cpus, quota / period)
+    return cpus
+
+
+def memory_limit_bytes() -> Optional[int]:
+    """The cgroup memory limit, or None when unlimited / not in a cgroup"""
+    limit = _read_cgroup("/sys/fs/cgroup/memory.max")  # cgroup v2
+    if limit is None:
+        limit = _read_cgroup("/sys/fs/cgroup/memory/memory.limit_in_bytes")  # cgroup v1
+    if not limit or limit == "max":
+        return None
+    limit = int(limit)
+    # cgroup v1 reports "unlimited" as a huge page-aligned number
+    return limit if limit < 1 << 60 else None
+
+
+def worker_count() -> int:
+    """
+    Workers from SERVER_WORKERS, or one per available CPU (LLM-bound, so 1 per core
+    is enough), as many as fit SERVER_WORKER_MEMORY_MB each into the memory limit,
+    at most SERVER_MAX_WORKERS.
+    """
+    if settings.SERVER_WORKERS > 0:
+        return settings.SERVER_WORKERS
+    workers = math.ceil(available_cpus())
+    memory = memory_limit_bytes()
+    if memory is not None and settings.SERVER_WORKER_MEMORY_MB > 0:
+        workers = min(workers, memory // (settings.SERVER_WORKER_MEMORY_MB * 1024 * 1024))
+    return max(1, min(workers, settings.SERVER_MAX_WORKERS))
+
+
+class TunedUvicornWorker(UvicornWorker):
+    CONFIG_KWARGS = {
+        "loop": "uvloop" if _has_module("uvloop") else "asyncio",
+        "http": "httptools" if _has_module("httptools") else "h11",
+        # no limit_concurrency: uvicorn counts every connection against it (live history
+        # WebSockets, idle keep-alives) and would answer 503 to cheap routes too; load is
+        # shed per route by services/admission.py, cheap routes are never limited
+    }
+
+
+class PreforkServer(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from backend.main import app
+        from backend.services.warmup import prefork_warmup
+
+        app.state.prefork_warmup = prefork_warmup()
+        # move everything allocated so far out of GC tracking, so collections in
+        # the workers don't touch (and un-share) the preloaded pages
+        gc.collect()
+        gc.freeze()
+        return app
+
+
+def server_options() -> dict:
+    return {
+        "bind": f"0.0.0.0:{os.getenv('PORT', '8000')}",
+        "workers": worker_count(),
+        "worker_class": TunedUvicornWorker,
+        "preload_app": True,
+        "max_requests": settings.SERVER_MAX_REQUESTS,
+        "max_requests_jitter": settings.SERVER_MAX_REQUESTS // 10,
+        "graceful_timeout": settings.SERVER_GRACEFUL_TIMEOUT,
+        # LLM calls can take a while, don't kill busy workers too early
+        "timeout": max(120, int(settings.LLM_EXPECTED_LATENCY_MS / 1000) * 10),
+        "keepalive": 5,
+    }
+
+
+if __name__ == "__main__":
+    PreforkServer(server_options()).run()
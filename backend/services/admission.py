@@ -0,0 +1,212 @@
+"""
+Admission control for the LLM-bound prompt routes.
+
+Each worker admits at most `limit` LLM-bound requests at a time. Excess requests
+wait in a short queue; when the queue is full, the wait would exceed
+ADMISSION_MAX_QUEUE_MS, or recent queueing delay is already above that, they
+are rejected right away with 503 + Retry-After. Cheap routes (history,
+feedback, ...) don't go through the controller and keep being served.
+
+The limit adapts AIMD-style to upstream latency: every LLM call that finishes
+within ADMISSION_LATENCY_TARGET_MS adds 1/limit (about +1 per limit's worth of
+calls), a slow or failed call multiplies it by ADMISSION_DECREASE_FACTOR (at
+most once per ADMISSION_DECREASE_INTERVAL_S).
+
+Admitted work runs in threads (run_with_deadline, fan-out), so the worker's
+default executor is sized from ADMISSION_MAX_LIMIT (see executor()): otherwise
+asyncio's min(32, cpu + 4) threads, not the limit, would bound concurrency and
+admitted requests would queue a second time, invisibly, inside the executor.
+"""
+import asyncio
+import math
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+
+try:
+    from ..core.config import settings
+    from .metrics import increment
+    from .deadline import current_scope, DeadlineExceeded
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+    from services.metrics import increment
+    from services.deadline import current_scope, DeadlineExceeded
+
+# weight of the newest sample in the queueing delay / latency moving averages
+EWMA_ALPHA = 0.2
+
+
+class Overloaded(HTTPException):
+    def __init__(self, retry_after_s: int, reason: str):
+        super().__init__(
+            status_code=503,
+            detail=f"Server is busy ({reason}), try again shortly",
+            headers={"Retry-After": str(retry_after_s)},
+        )
+
+
+class AdmissionController:
+    def __init__(self):
+        self.limit = float(settings.ADMISSION_INITIAL_LIMIT)
+        self.in_flight = 0
+        self.queue_delay_ms = 0.0
+        self.latency_ms = 0.0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self._last_decrease = 0.0
+
+    def _retry_after(self) -> int:
+        expected = self.latency_ms or settings.LLM_EXPECTED_LATENCY_MS
+        return max(1, math.ceil(max(expected, self.queue_delay_ms) / 1000))
+
+    def _reject(self, reason: str) -> None:
+        increment(f"admission.rejected.{reason.replace(' ', '_')}")
+        raise Overloaded(self._retry_after(), reason)
+
+    def _record_queue_delay(self, delay_ms: float) -> None:
+        self.queue_delay_ms += EWMA_ALPHA * (delay_ms - self.queue_delay_ms)
+
+    async def acquire(self, weight: int = 1) -> None:
+        """
+        Take `weight` slots (e.g. one per model for fan-out), waiting in the queue if needed.
+
+        Raises:
+            Overloaded: Queue full, or no slot within ADMISSION_MAX_QUEUE_MS
+            DeadlineExceeded: The request's deadline ran out while it was queued
+        """
+        if self.in_flight + weight <= self.limit and not self._waiters:
+            self.in_flight += weight
+            self._record_queue_delay(0)
+            return
+
+        if len(self._waiters) >= settings.ADMISSION_MAX_QUEUE:
+            self._reject("queue full")
+        if self.queue_delay_ms > settings.ADMISSION_MAX_QUEUE_MS:
+            # requests queued recently waited too long already, fail fast instead of piling up
+            self._reject("queueing delay")
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (weight, future)
+        self._waiters.append(waiter)
+        # nothing in flight: no release() would come to hand out the slots (e.g. weight > limit)
+        self._wake()
+        # the queue wait counts against the request's deadline (deadline.request_scope)
+        scope = current_scope()
+        max_wait_s = settings.ADMISSION_MAX_QUEUE_MS / 1000
+        if scope is not None:
+            max_wait_s = min(max_wait_s, scope.remaining_seconds())
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), max_wait_s)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            granted = future.done() and not future.cancelled()
+            if not granted:
+                self._waiters.remove(waiter)
+                future.cancel()
+            self._record_queue_delay((time.monotonic() - start) * 1000)
+            if isinstance(e, asyncio.CancelledError):
+                # client went away while queued: give back a slot granted in the meantime
+                if granted:
+                    self.release(weight)
+                raise
+            if not granted:
+                if scope is not None and scope.remaining_ms() <= 0:
+                    increment("requests.deadline_expired")
+                    raise DeadlineExceeded()
+                self._reject("queue timeout")
+            # granted right as the timeout fired: keep the slot
+            return
+        self._record_queue_delay((time.monotonic() - start) * 1000)
+
+    def release(self, weight: int = 1) -> None:
+        self.in_flight -= weight
+        self._wake()
+
+    def retain(self, weight: int, until: asyncio.Future) -> None:
+        """
+        Keep `weight` of the slots a request holds after its slot() exits, until
+        `until` is done: work the request left running (fan-out "first") still
+        counts against the limit.
+        """
+        if not settings.ADMISSION_ENABLED or weight <= 0:
+            return
+        self.in_flight += weight
+        until.add_done_callback(lambda _: self.release(weight))
+
+    def _wake(self) -> None:
+        while self._waiters:
+            weight, future = self._waiters[0]
+            if future.cancelled():
+                self._waiters.popleft()
+                continue
+            if self.in_flight + weight > self.limit and self.in_flight > 0:
+                return
+            self._waiters.popleft()
+            self.in_flight += weight
+            future.set_result(True)
+
+    def observe(self, latency_ms: float, ok: bool) -> None:
+        """AIMD update from one finished LLM call (thread-safe)"""
+        with self._lock:
+            self.latency_ms += EWMA_ALPHA * (latency_ms - self.latency_ms)
+            now = time.monotonic()
+            if ok and latency_ms <= settings.ADMISSION_LATENCY_TARGET_MS:
+                self.limit = min(self.limit + 1 / self.limit, settings.ADMISSION_MAX_LIMIT)
+            elif now - self._last_decrease >= settings.ADMISSION_DECREASE_INTERVAL_S:
+                self._last_decrease = now
+                self.limit = max(self.limit * settings.ADMISSION_DECREASE_FACTOR, settings.ADMISSION_MIN_LIMIT)
+                increment("admission.decreases")
+
+    @asynccontextmanager
+    async def slot(self, weight: int = 1, on_reject: Optional[Callable[[], None]] = None):
+        """
+        `async with controller.slot():` around the LLM-bound part of a route.
+
+        Args:
+            weight: Slots to take
+            on_reject: Called when the request gets no slot (shed, or its deadline ran
+                out while queued), e.g. to give back its quota charge
+        """
+        if not settings.ADMISSION_ENABLED:
+            yield
+            return
+        try:
+            await self.acquire(weight)
+        except (Overloaded, DeadlineExceeded):
+            if on_reject is not None:
+                on_reject()
+            raise
+        try:
+            yield
+        finally:
+            self.release(weight)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.ADMISSION_ENABLED,
+            "limit": round(self.limit, 2),
+            "inFlight": self.in_flight,
+            "queued": len(self._waiters),
+            "queueDelayMs": round(self.queue_delay_ms, 1),
+            "llmLatencyMs": round(self.latency_ms, 1),
+        }
+
+
+def executor() -> ThreadPoolExecutor:
+    """
+    Default executor for a worker's event loop: one thread per slot the limit can
+    grow to, plus ADMISSION_EXECUTOR_HEADROOM for threaded work outside admission.
+    """
+    workers = settings.ADMISSION_MAX_LIMIT + settings.ADMISSION_EXECUTOR_HEADROOM
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="worker")
+
+
+controller = AdmissionController()
@@ -0,0 +1,279 @@
+"""
+Incrementally maintained analytics aggregates.
+
+Each user has `analytics/{user_id}/shards/{n}` documents holding running sums
+and counts (overall, per project and per model) plus a log-bucket latency
+histogram. Writes pick a random shard and use Increment, so concurrent
+requests don't contend on one document; reads sum the shards.
+
+A rebuild never touches the shards. It reads the prompts and the shards at
+the same point in time and stores the difference in the `correction` map of
+`analytics/{user_id}`, which reads add to the shard sums. Increments written
+while it runs land after that point in time, so they stay counted.
+"""
+import math
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+try:
+    from ..core.config import settings
+    from .firebase_db import get_firestore_client
+    from .compression import decompress_prompt_fields
+    from .prompt_repository import repository
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+    from services.firebase_db import get_firestore_client
+    from services.compression import decompress_prompt_fields
+    from services.prompt_repository import repository
+
+# latency histogram: bucket i covers (GAMMA^(i-1), GAMMA^i] ms, ~2.5% relative error
+LATENCY_GAMMA = 1.05
+# rebuilds read this far in the past, so the read time is never ahead of the server's clock
+REBUILD_READ_LAG_S = 5
+
+
+def latency_bucket(latency_ms: float) -> int:
+    """Index of the histogram bucket for a latency"""
+    return max(0, math.ceil(math.log(max(latency_ms, 1.0)) / math.log(LATENCY_GAMMA)))
+
+
+def latency_percentile(buckets: dict, q: float) -> Optional[float]:
+    """
+    Approximate latency percentile from a (merged) bucket histogram.
+
+    Args:
+        buckets: Bucket index (str or int) -> count
+        q: Quantile between 0 and 1
+
+    Returns:
+        Latency in ms, or None if the histogram is empty
+    """
+    counts = sorted((int(index), count) for index, count in buckets.items() if count)
+    total = sum(count for _, count in counts)
+    if not total:
+        return None
+    rank = q * (total - 1)
+    seen = 0
+    for index, count in counts:
+        seen += count
+        if seen > rank:
+            # midpoint of the bucket
+            return 2 * LATENCY_GAMMA ** index / (LATENCY_GAMMA + 1)
+    return LATENCY_GAMMA ** counts[-1][0]
+
+
+def merge_counters(target: dict, source: dict) -> dict:
+    """Recursively add the numbers in source into target (maps are merged)"""
+    for key, value in source.items():
+        if isinstance(value, dict):
+            merge_counters(target.setdefault(key, {}), value)
+        else:
+            target[key] = target.get(key, 0) + value
+    return target
+
+
+def _is_zero(counters: dict) -> bool:
+    return all(_is_zero(value) if isinstance(value, dict) else not value for value in counters.values())
+
+
+def _negated(counters: dict) -> dict:
+    return {key: _negated(value) if isinstance(value, dict) else -value for key, value in counters.items()}
+
+
+def _scoped(counters: dict, project_id: str, models: Iterable[str] = ()) -> dict:
+    """Place the same counters under total, the project and each model"""
+    deltas = {"total": dict(counters), "projects": {project_id: dict(counters)}}
+    models = [model for model in models if model]
+    if models:
+        deltas["models"] = {model: dict(counters) for model in models}
+    return deltas
+
+
+def prompt_deltas(prompt: Any, variant_ids: Iterable[str] = (), new_prompt: bool = False) -> dict:
+    """
+    Aggregate deltas for a prompt write.
+
+    Args:
+        prompt: PromptDBModel (or anything with the same attributes)
+        variant_ids: Optimized variants added by this write
+        new_prompt: True when the prompt document itself is new (counts prompt and scores)
+
+    Returns:
+        Nested deltas: {"total": {...}, "projects": {pid: {...}}, "models": {model: {...}}}
+    """
+    deltas = {}
+    if new_prompt:
+        counters = {"prompts": 1, "initialTokens": prompt.initialTokenSize or 0}
+        if isinstance(prompt.overallScores, (int, float)):
+            counters["scoreSum"] = float(prompt.overallScores)
+            counters["scoreCount"] = 1
+        merge_counters(deltas, _scoped(counters, prompt.projectID))
+
+    for variant_id in variant_ids:
+        counters = {
+            "variants": 1,
+            "baselineTokens": prompt.initialTokenSize or 0,
+            "finalTokens": (prompt.finalTokenSizes or {}).get(variant_id, 0),
+        }
+        latency = (prompt.latencyMs or {}).get(variant_id)
+        if latency is not None:
+            counters["latencyCount"] = 1
+            counters["latencySumMs"] = float(latency)
+            counters["latencyBuckets"] = {str(latency_bucket(latency)): 1}
+        model = (prompt.usedLLMs or {}).get(variant_id)
+        merge_counters(deltas, _scoped(counters, prompt.projectID, [model]))
+    return deltas
+
+
+def rating_deltas(prompt_data: dict, rating: float, previous_rating: Optional[float] = None) -> dict:
+    """
+    Aggregate deltas for a (re-)rating. A changed rating replaces the old one
+    instead of being counted twice.
+
+    Args:
+        prompt_data: Prompt document dictionary (projectID, usedLLMs)
+        rating: New rating
+        previous_rating: Rating being replaced, if any
+    """
+    counters = {
+        "ratingSum": float(rating) - float(previous_rating or 0),
+        "ratingCount": 0 if previous_rating is not None else 1,
+    }
+    models = set((prompt_data.get("usedLLMs") or {}).values())
+    return _scoped(counters, prompt_data.get("projectID", "default-project"), models)
+
+
+def stored_prompt_deltas(prompt_data: dict) -> dict:
+    """
+    Everything a stored prompt contributes to the aggregates: the prompt, its
+    variants and its ratings.
+
+    Args:
+        prompt_data: Prompt document dictionary (compressed fields are fine)
+    """
+    # imported here to avoid a circular import (schemas.prompt writes through this module)
+    try:
+        from ..schemas.prompt import PromptDBModel
+    except ImportError:
+        from schemas.prompt import PromptDBModel
+
+    data = decompress_prompt_fields(dict(prompt_data))
+    prompt = PromptDBModel(**{k: v for k, v in data.items() if k != "parsedData"})
+    deltas = prompt_deltas(prompt, prompt.optimizedPrompts or {}, new_prompt=True)
+    for rating in (data.get("ratings") or {}).values():
+        merge_counters(deltas, rating_deltas(data, rating))
+    return deltas
+
+
+def delete_deltas(prompt_data: dict) -> dict:
+    """Aggregate deltas for deleting a stored prompt (its contribution, negated)"""
+    return _negated(stored_prompt_deltas(prompt_data))
+
+
+def _to_increments(deltas: dict) -> dict:
+    from firebase_admin import firestore
+
+    return {
+        key: _to_increments(value) if isinstance(value, dict) else firestore.Increment(value)
+        for key, value in deltas.items()
+    }
+
+
+def _user_ref(db, user_id: str):
+    return db.collection("analytics").document(user_id)
+
+
+def _shards_ref(db, user_id: str):
+    return _user_ref(db, user_id).collection("shards")
+
+
+def add_to_batch(db, batch, user_id: str, deltas: dict) -> None:
+    """
+    Add the increments for `deltas` to a Firestore write batch, on a random shard.
+    Committing the batch applies them atomically with the prompt write.
+    """
+    if not deltas:
+        return
+    shard_ref = _shards_ref(db, user_id).document(str(random.randrange(settings.ANALYTICS_SHARDS)))
+    batch.set(shard_ref, _to_increments(deltas), merge=True)
+
+
+def summarize(counters: dict) -> dict:
+    """Turn raw counters into dashboard numbers"""
+    baseline = counters.get("baselineTokens", 0)
+    final = counters.get("finalTokens", 0)
+    buckets = counters.get("latencyBuckets", {})
+    return {
+        "prompts": int(counters.get("prompts", 0)),
+        "variants": int(counters.get("variants", 0)),
+        "initialTokens": int(counters.get("initialTokens", 0)),
+        "tokensSaved": int(baseline - final),
+        "tokenSavingsRatio": (1 - final / baseline) if baseline else None,
+        "avgOverallScore": counters["scoreSum"] / counters["scoreCount"] if counters.get("scoreCount") else None,
+        "avgRating": counters["ratingSum"] / counters["ratingCount"] if counters.get("ratingCount") else None,
+        "ratingCount": int(counters.get("ratingCount", 0)),
+        "latencyMs": {
+            "avg": counters["latencySumMs"] / counters["latencyCount"] if counters.get("latencyCount") else None,
+            "p50": latency_percentile(buckets, 0.50),
+            "p90": latency_percentile(buckets, 0.90),
+            "p99": latency_percentile(buckets, 0.99),
+        },
+    }
+
+
+def read_user_analytics(user_id: str) -> dict:
+    """
+    Read and merge a user's aggregate shards and rebuild correction (at most
+    ANALYTICS_SHARDS + 1 documents, independent of history size).
+
+    Returns:
+        Summaries for total, each project and each model
+    """
+    db = get_firestore_client()
+    merged = {}
+    for doc in _shards_ref(db, user_id).stream():
+        merge_counters(merged, doc.to_dict() or {})
+    merge_counters(merged, (_user_ref(db, user_id).get().to_dict() or {}).get("correction", {}))
+
+    return {
+        "total": summarize(merged.get("total", {})),
+        "projects": {pid: summarize(c) for pid, c in merged.get("projects", {}).items() if not _is_zero(c)},
+        "models": {model: summarize(c) for model, c in merged.get("models", {}).items() if not _is_zero(c)},
+    }
+
+
+def rebuild_user_analytics(user_id: str) -> dict:
+    """
+    Recompute a user's aggregates from their prompt documents.
+    Fixes drift from writes that didn't maintain aggregates.
+
+    Prompts and shards are read at the same read_time, and the difference is
+    stored as the correction; the shards themselves are left alone, so
+    increments committed during the rebuild are kept.
+
+    Args:
+        user_id: The user to rebuild
+
+    Returns:
+        The rebuilt raw counters (as of the read time)
+    """
+    db = get_firestore_client()
+    read_time = datetime.now(timezone.utc) - timedelta(seconds=REBUILD_READ_LAG_S)
+
+    counters = {}
+    for query in repository.user_queries(db, user_id):
+        for doc in query.stream(read_time=read_time):
+            merge_counters(counters, stored_prompt_deltas(doc.to_dict()))
+
+    shard_sums = {}
+    for doc in _shards_ref(db, user_id).stream(read_time=read_time):
+        merge_counters(shard_sums, doc.to_dict() or {})
+
+    # replaced as a whole: merging would keep keys that dropped out of the counters
+    _user_ref(db, user_id).set({"correction": merge_counters(_negated(shard_sums), counters),
+                                "rebuiltAt": read_time})
+    return counters
@@ -0,0 +1,129 @@
+"""Split long prompts into token-bounded chunks on structural boundaries"""
+import re
+import sys
+from pathlib import Path
+
+try:
+    from .token_counter import count_tokens
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from services.token_counter import count_tokens
+
+# markdown headings and blank lines start a new block; fenced code blocks are taken out whole first
+_BLOCK_SPLIT = re.compile(r"\n(?=#{1,6}\s)|\n(?=```)|\n\s*\n")
+# same fences as prompt_reduction: a fenced block is never split between blocks
+_FENCE = re.compile(r"^(```|~~~)[^\n]*\n.*?^\1[ \t]*$", re.MULTILINE | re.DOTALL)
+# an oversized block is cut after a sentence (with its trailing spaces) or a line break
+_UNIT_END = re.compile(r"[.!?][ \t]+|\n")
+_LEADING_BLANK_LINES = re.compile(r"^(?:[ \t]*\n)+")
+
+
+def _trim(text: str) -> str:
+    """Drop blank lines around a block, but keep the indentation of its first line"""
+    return _LEADING_BLANK_LINES.sub("", text).rstrip()
+
+
+def _blocks(text: str) -> list[str]:
+    """Headings, paragraphs and whole fenced code blocks, in order"""
+    parts = []
+    position = 0
+    for match in _FENCE.finditer(text):
+        parts.extend(_BLOCK_SPLIT.split(text[position:match.start()]))
+        parts.append(match.group(0))
+        position = match.end()
+    parts.extend(_BLOCK_SPLIT.split(text[position:]))
+    return [block for block in map(_trim, parts) if block]
+
+
+def _pack(units: list[str], max_tokens: int) -> list[str]:
+    """
+    Concatenate consecutive units (each keeping its own separators) into pieces
+    of at most max_tokens, counting every unit once.
+    """
+    pieces = []
+    current = []
+    current_tokens = 0
+
+    def flush():
+        piece = _trim("".join(current))
+        if piece:
+            pieces.append(piece)
+        current.clear()
+
+    for unit in units:
+        tokens = count_tokens(unit)
+        if tokens > max_tokens and " " in unit.strip():
+            # a single sentence / line can still be too long (logs, minified code), fall back to words
+            flush()
+            current_tokens = 0
+            words = unit.split(" ")
+            pieces.extend(_pack([f"{word} " for word in words[:-1]] + words[-1:], max_tokens))
+            continue
+        if current and current_tokens + tokens > max_tokens:
+            flush()
+            current_tokens = 0
+        current.append(unit)
+        current_tokens += tokens
+    flush()
+    return pieces
+
+
+def _split_oversized(block: str, max_tokens: int) -> list[str]:
+    """
+    Break a single block that is too large into sentences and lines, then words.
+
+    A fenced code block is cut between lines and every piece is fenced again,
+    so each chunk still reads as code.
+    """
+    if _FENCE.fullmatch(block):
+        lines = block.split("\n")
+        opener, closer = lines[0], lines[-1]
+        budget = max(1, max_tokens - count_tokens(f"{opener}\n\n{closer}"))
+        return [f"{opener}\n{piece}\n{closer}" for piece in _pack([f"{line}\n" for line in lines[1:-1]], budget)]
+
+    units = []
+    position = 0
+    for match in _UNIT_END.finditer(block):
+        units.append(block[position:match.end()])
+        position = match.end()
+    units.append(block[position:])
+    return _pack(units, max_tokens)
+
+
+def split_prompt(text: str, max_tokens: int) -> list[str]:
+    """
+    Split a prompt into chunks of at most max_tokens tokens.
+    
+    Headings, code fences and paragraphs are kept together where possible;
+    neighbouring small blocks are packed into the same chunk.
+    
+    Args:
+        text: The prompt text
+        max_tokens: Upper bound for each chunk (approximate for oversized sentences)
+    
+    Returns:
+        List of chunk strings in original order
+    """
+    blocks = _blocks(text)
+    chunks = []
+    current = ""
+    current_tokens = 0
+
+    for block in blocks:
+        block_tokens = count_tokens(block)
+        if block_tokens > max_tokens:
+            if current:
+                chunks.append(current)
+                current, current_tokens = "", 0
+            chunks.extend(_split_oversized(block, max_tokens))
+            continue
+
+        if current and current_tokens + block_tokens > max_tokens:
+            chunks.append(current)
+            current, current_tokens = "", 0
+        current = f"{current}\n\n{block}" if current else block
+        current_tokens += block_tokens
+
+    if current:
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,207 @@
+"""
+Transparent zstd compression for large prompt text fields.
+
+New frames use the dictionary in PROMPT_COMPRESSION_DICT. Each frame records
+the ID of its dictionary, so frames written with an earlier dictionary stay
+readable as long as its file is listed in PROMPT_COMPRESSION_RETIRED_DICTS.
+A configured dictionary file that is missing or unreadable stops the worker at
+startup (warmup) instead of failing reads later.
+"""
+import sys
+from pathlib import Path
+from typing import Any, Optional
+
+try:
+    from ..core.config import settings
+    from .metrics import increment, snapshot
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+    from services.metrics import increment, snapshot
+
+try:
+    import zstandard
+except ImportError:  # compression is optional, text is stored as-is without it
+    zstandard = None
+
+# prompt document fields that hold user / LLM text
+COMPRESSED_TEXT_FIELDS = ("inputPrompt",)
+COMPRESSED_MAP_FIELDS = ("optimizedPrompts",)
+
+# every zstd frame starts with this magic number
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+_compressor = None
+# dictionary ID -> decompressor; 0 = frames written without a dictionary
+_decompressors: dict[int, "zstandard.ZstdDecompressor"] = {}
+_dictionaries: Optional[dict[int, "zstandard.ZstdCompressionDict"]] = None
+_current_dictionary = None
+
+
+def _read_dictionary(path: str) -> "zstandard.ZstdCompressionDict":
+    dict_path = Path(path)
+    if not dict_path.is_file():
+        raise RuntimeError(f"zstd dictionary {path} not found")
+    dict_data = zstandard.ZstdCompressionDict(dict_path.read_bytes())
+    if not dict_data.dict_id():
+        raise RuntimeError(f"{path} is not a trained zstd dictionary (no dictionary ID)")
+    return dict_data
+
+
+def load_dictionaries() -> list[int]:
+    """
+    Load the current and retired dictionaries.
+
+    Returns:
+        IDs of the loaded dictionaries
+
+    Raises:
+        RuntimeError: A configured dictionary file is missing or invalid
+    """
+    global _dictionaries, _current_dictionary
+    if zstandard is None:
+        return []
+    if _dictionaries is None:
+        current = _read_dictionary(settings.PROMPT_COMPRESSION_DICT) if settings.PROMPT_COMPRESSION_DICT else None
+        retired = [path.strip() for path in settings.PROMPT_COMPRESSION_RETIRED_DICTS.split(",") if path.strip()]
+        dictionaries = {dict_data.dict_id(): dict_data for dict_data in map(_read_dictionary, retired)}
+        if current is not None:
+            dictionaries[current.dict_id()] = current
+        _dictionaries, _current_dictionary = dictionaries, current
+    return list(_dictionaries)
+
+
+def _get_compressor() -> "zstandard.ZstdCompressor":
+    global _compressor
+    if _compressor is None:
+        load_dictionaries()
+        _compressor = zstandard.ZstdCompressor(level=settings.PROMPT_COMPRESSION_LEVEL, dict_data=_current_dictionary)
+    return _compressor
+
+
+def _get_decompressor(dict_id: int) -> "zstandard.ZstdDecompressor":
+    decompressor = _decompressors.get(dict_id)
+    if decompressor is None:
+        load_dictionaries()
+        if dict_id and dict_id not in _dictionaries:
+            raise RuntimeError(
+                f"Prompt field was compressed with zstd dictionary {dict_id}, which isn't loaded: "
+                "add its file to PROMPT_COMPRESSION_RETIRED_DICTS"
+            )
+        decompressor = zstandard.ZstdDecompressor(dict_data=_dictionaries.get(dict_id))
+        _decompressors[dict_id] = decompressor
+    return decompressor
+
+
+def is_available() -> bool:
+    """True when zstandard is installed and compression is enabled in settings"""
+    return zstandard is not None and settings.PROMPT_COMPRESSION_ENABLED
+
+
+def compress_text(text: Any) -> Any:
+    """
+    Compress a string if it is larger than the configured threshold.
+
+    Args:
+        text: Field value (non-strings are returned unchanged)
+
+    Returns:
+        zstd frame as bytes, or the original value if it is small,
+        compression is disabled, or compressing did not save space
+    """
+    if not isinstance(text, str) or not is_available():
+        return text
+
+    raw = text.encode("utf-8")
+    if len(raw) < settings.PROMPT_COMPRESSION_THRESHOLD:
+        return text
+
+    packed = _get_compressor().compress(raw)
+    if len(packed) >= len(raw):
+        return text
+
+    increment("compression.fields")
+    increment("compression.raw_bytes", len(raw))
+    increment("compression.stored_bytes", len(packed))
+    return packed
+
+
+def decompress_text(value: Any) -> Any:
+    """
+    Reverse compress_text. Plain strings (old or small documents) pass through.
+
+    Args:
+        value: Field value read from Firestore
+
+    Returns:
+        Decoded string, or the original value if it is not a zstd frame
+
+    Raises:
+        RuntimeError: The frame's dictionary isn't configured
+    """
+    if not isinstance(value, (bytes, bytearray)) or not bytes(value[:4]) == ZSTD_MAGIC:
+        return value
+    if zstandard is None:
+        raise RuntimeError("zstandard is required to read compressed prompt fields")
+
+    frame = bytes(value)
+    dict_id = zstandard.get_frame_parameters(frame).dict_id
+    return _get_decompressor(dict_id).decompress(frame).decode("utf-8")
+
+
+def compress_prompt_fields(data: dict) -> dict:
+    """
+    Compress the large text fields of a prompt document (or partial update) in place.
+
+    Args:
+        data: Firestore dictionary, e.g. from PromptDBModel.to_firestore_dict
+
+    Returns:
+        The same dictionary
+    """
+    for field in COMPRESSED_TEXT_FIELDS:
+        if field in data:
+            data[field] = compress_text(data[field])
+    for field in COMPRESSED_MAP_FIELDS:
+        if isinstance(data.get(field), dict):
+            data[field] = {key: compress_text(value) for key, value in data[field].items()}
+    return data
+
+
+def decompress_prompt_fields(data: dict) -> dict:
+    """
+    Decompress the text fields of a prompt document read from Firestore, in place.
+
+    Args:
+        data: Raw document dictionary (doc.to_dict())
+
+    Returns:
+        The same dictionary
+    """
+    for field in COMPRESSED_TEXT_FIELDS:
+        if field in data:
+            data[field] = decompress_text(data[field])
+    for field in COMPRESSED_MAP_FIELDS:
+        if isinstance(data.get(field), dict):
+            data[field] = {key: decompress_text(value) for key, value in data[field].items()}
+    return data
+
+
+def get_compression_stats() -> dict:
+    """
+    Byte savings of this worker since start.
+
+    Returns:
+        Dictionary with fields compressed, raw and stored bytes and saved ratio
+    """
+    stats = snapshot("compression.")
+    raw_bytes = stats.get("compression.raw_bytes", 0)
+    stored_bytes = stats.get("compression.stored_bytes", 0)
+    return {
+        "enabled": is_available(),
+        "fieldsCompressed": int(stats.get("compression.fields", 0)),
+        "rawBytes": int(raw_bytes),
+        "storedBytes": int(stored_bytes),
+        "savedBytes": int(raw_bytes - stored_bytes),
+        "savedRatio": (1 - stored_bytes / raw_bytes) if raw_bytes else 0.0,
+    }
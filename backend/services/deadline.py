@@ -0,0 +1,190 @@
+"""
+Per-request deadlines and client-disconnect cancellation.
+
+A RequestScope (deadline + cancel flag) is stored in a context variable while a
+route's blocking work runs in a worker thread. run_nebius_ai and the Firestore
+helpers check it before (and, for streamed completions, during) each call.
+Routes with several steps open one request_scope(), so all of them share the
+client's budget; the admission queue wait is bounded by it as well.
+"""
+import asyncio
+import sys
+import threading
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from time import monotonic
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import HTTPException, Request
+
+try:
+    from ..core.config import settings
+    from .metrics import increment
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+    from services.metrics import increment
+
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+
+# how often the route checks whether the client is still connected
+DISCONNECT_POLL_S = 0.25
+
+
+class DeadlineExceeded(HTTPException):
+    def __init__(self, detail: str = "Request deadline exceeded"):
+        super().__init__(status_code=504, detail=detail)
+
+
+class RequestCancelled(HTTPException):
+    def __init__(self):
+        # 499: client closed request (nginx convention), the client never sees it
+        super().__init__(status_code=499, detail="Client disconnected")
+
+
+class RequestScope:
+    def __init__(self, budget_ms: float):
+        self.budget_ms = budget_ms
+        self.expires_at = monotonic() + budget_ms / 1000
+        self.cancelled = threading.Event()
+
+    def remaining_ms(self) -> float:
+        return (self.expires_at - monotonic()) * 1000
+
+    def remaining_seconds(self) -> float:
+        return max(self.remaining_ms() / 1000, 0.001)
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    def check(self, expected_ms: float = 0) -> None:
+        """
+        Raise if the request was cancelled or the remaining budget is smaller than expected_ms.
+
+        Args:
+            expected_ms: Expected duration of the next step (e.g. LLM_EXPECTED_LATENCY_MS)
+        """
+        if self.cancelled.is_set():
+            raise RequestCancelled()
+        remaining = self.remaining_ms()
+        if remaining <= 0:
+            increment("requests.deadline_expired")
+            raise DeadlineExceeded()
+        if remaining < expected_ms:
+            increment("requests.deadline_early_abort")
+            raise DeadlineExceeded(f"Remaining budget ({remaining:.0f} ms) can't cover the expected latency ({expected_ms:.0f} ms)")
+
+
+_current_scope: ContextVar[Optional[RequestScope]] = ContextVar("request_scope", default=None)
+
+
+def current_scope() -> Optional[RequestScope]:
+    return _current_scope.get()
+
+
+def check_budget(expected_ms: float = 0) -> None:
+    """RequestScope.check on the current scope (no-op outside a scoped request)"""
+    scope = _current_scope.get()
+    if scope is not None:
+        scope.check(expected_ms)
+
+
+def remaining_seconds() -> Optional[float]:
+    """Timeout to pass to upstream calls, None outside a scoped request"""
+    scope = _current_scope.get()
+    return scope.remaining_seconds() if scope is not None else None
+
+
+def firestore_call_kwargs() -> dict:
+    """{"timeout": remaining seconds} for Firestore calls inside a scoped request, else {}"""
+    scope = _current_scope.get()
+    return {"timeout": scope.remaining_seconds()} if scope is not None else {}
+
+
+def request_budget_ms(http_request: Request) -> float:
+    """Deadline budget from the X-Request-Deadline-Ms header, or the Settings default"""
+    header = http_request.headers.get(DEADLINE_HEADER)
+    try:
+        budget = float(header) if header else settings.REQUEST_DEADLINE_MS
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{DEADLINE_HEADER} must be a number of milliseconds")
+    return min(budget, settings.REQUEST_DEADLINE_MAX_MS)
+
+
+@asynccontextmanager
+async def request_scope(http_request: Request):
+    """
+    `async with request_scope(http_request):` around a whole route: one RequestScope,
+    so every step inside (loading, queueing for an admission slot, the LLM call)
+    is counted against the same client deadline.
+    """
+    scope = RequestScope(request_budget_ms(http_request))
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+
+
+async def run_with_deadline(http_request: Request, func: Callable, *args, **kwargs) -> Any:
+    """
+    Run blocking route work in a thread under a RequestScope: the route's
+    request_scope(), or a new one for this call.
+
+    While it runs, the client connection and the deadline are polled; on disconnect
+    or expiry the scope is cancelled so the streamed LLM call is closed and no
+    further LLM or Firestore calls are made.
+
+    Returns:
+        Whatever func returns (its exceptions are re-raised)
+
+    Raises:
+        RequestCancelled: The client disconnected
+        DeadlineExceeded: The budget ran out, or can't cover the next LLM call
+    """
+    scope = _current_scope.get()
+    token = None
+    if scope is None:
+        scope = RequestScope(request_budget_ms(http_request))
+        token = _current_scope.set(scope)
+    try:
+        # to_thread copies the context, so the thread sees the scope
+        task = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+    finally:
+        if token is not None:
+            _current_scope.reset(token)
+    return await _watch(http_request, scope, task)
+
+
+async def wait_with_deadline(http_request: Request, awaitable: Awaitable) -> Any:
+    """
+    Await a coroutine inside request_scope() (e.g. a fan-out over several models),
+    cancelled like run_with_deadline on disconnect or expiry.
+
+    Raises:
+        RequestCancelled: The client disconnected
+        DeadlineExceeded: The budget ran out
+    """
+    return await _watch(http_request, _current_scope.get(), asyncio.ensure_future(awaitable))
+
+
+async def _watch(http_request: Request, scope: RequestScope, task: asyncio.Future) -> Any:
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_S)
+        if done:
+            return task.result()
+        if await http_request.is_disconnected():
+            increment("requests.cancelled")
+            error = RequestCancelled()
+        elif scope.remaining_ms() <= 0:
+            increment("requests.deadline_expired")
+            error = DeadlineExceeded()
+        else:
+            continue
+
+        # worker threads stop at their next check, coroutines at their next await; don't wait for them
+        scope.cancel()
+        task.cancel()
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        raise error
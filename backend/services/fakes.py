@@ -0,0 +1,475 @@
+"""
+In-process stand-ins for Firestore and the Nebius client.
+
+FIRESTORE_BACKEND=fake and LLM_BACKEND=fake swap them in behind
+get_firestore_client() / get_nebius_client(), so the app runs without
+credentials or network: local runs, tools/replay_traffic.py. They cover the
+subset of the APIs this code base uses and add a configurable latency per call
+so load tests still see realistic waits.
+
+FakeFirestore keeps everything in memory (per process): documents are dicts
+keyed by path, batches commit atomically, and SERVER_TIMESTAMP / Increment /
+DELETE_FIELD are applied like Firestore does. There are no snapshot listeners
+(history push has its own fake source).
+"""
+import copy
+import itertools
+import json
+import operator
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Optional
+
+try:
+    from ..core.config import settings
+    from .token_counter import count_tokens
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+    from services.token_counter import count_tokens
+
+_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def _firestore_wait() -> None:
+    if settings.FAKE_FIRESTORE_LATENCY_MS > 0:
+        time.sleep(settings.FAKE_FIRESTORE_LATENCY_MS / 1000)
+
+
+def _normalize(value: Any) -> Any:
+    # Firestore stores naive datetimes as UTC and returns them timezone-aware
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def _assign(target: dict, key: str, value: Any, now: Optional[datetime] = None) -> None:
+    from google.cloud.firestore_v1.transforms import DELETE_FIELD, SERVER_TIMESTAMP, Increment
+
+    if value is DELETE_FIELD:
+        target.pop(key, None)
+    elif value is SERVER_TIMESTAMP:
+        # like Firestore: one commit time for every server timestamp in a batch
+        target[key] = now or datetime.now(timezone.utc)
+    elif isinstance(value, Increment):
+        target[key] = (target.get(key) or 0) + value.value
+    elif isinstance(value, dict):
+        # a map written in full: sentinels inside it are resolved too
+        target[key] = {}
+        for inner_key, inner_value in value.items():
+            _assign(target[key], inner_key, inner_value, now)
+    else:
+        target[key] = _normalize(value)
+
+
+def _assign_path(target: dict, path: str, value: Any, now: Optional[datetime] = None) -> None:
+    """Assign a dotted field path ("ratings.user"), creating maps on the way like Firestore"""
+    *parents, key = path.split(".")
+    for parent in parents:
+        if not isinstance(target.get(parent), dict):
+            target[parent] = {}
+        target = target[parent]
+    _assign(target, key, value, now)
+
+
+def _lookup(data: dict, path: str) -> tuple[bool, Any]:
+    """(found, value) of a dotted field path in nested set() data"""
+    for key in path.split("."):
+        if not isinstance(data, dict) or key not in data:
+            return False, None
+        data = data[key]
+    return True, data
+
+
+def _merge(target: dict, data: dict, now: Optional[datetime] = None) -> dict:
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value, now)
+        else:
+            _assign(target, key, value, now)
+    return target
+
+
+class FakeSnapshot:
+    def __init__(self, reference: "FakeDocumentReference", data: Optional[dict]):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[dict]:
+        return copy.deepcopy(self._data)
+
+    def get(self, field: str) -> Any:
+        return (self._data or {}).get(field)
+
+
+class FakeDocumentReference:
+    def __init__(self, db: "FakeFirestore", path: str):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name: str) -> "FakeCollection":
+        return FakeCollection(self._db, f"{self.path}/{name}")
+
+    def get(self, **kwargs) -> FakeSnapshot:
+        _firestore_wait()
+        with self._db.lock:
+            return FakeSnapshot(self, copy.deepcopy(self._db.documents.get(self.path)))
+
+    def set(self, document_data: dict, merge=False, **kwargs) -> None:
+        batch = self._db.batch()
+        batch.set(self, document_data, merge=merge)
+        batch.commit()
+
+    def create(self, document_data: dict, **kwargs) -> None:
+        batch = self._db.batch()
+        batch.create(self, document_data)
+        batch.commit()
+
+    def update(self, field_updates: dict, **kwargs) -> None:
+        batch = self._db.batch()
+        batch.update(self, field_updates)
+        batch.commit()
+
+    def delete(self, **kwargs) -> None:
+        batch = self._db.batch()
+        batch.delete(self)
+        batch.commit()
+
+
+class FakeQuery:
+    def __init__(self, db: "FakeFirestore", collection: str, filters=(), orders=(), limit=None, start_after=None,
+                 all_descendants: bool = False):
+        self._db = db
+        self._collection = collection
+        # collection group: every collection with this ID, at any depth
+        self._all_descendants = all_descendants
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._start_after = start_after
+
+    def _copy(self, **changes) -> "FakeQuery":
+        fields = {
+            "filters": self._filters,
+            "orders": self._orders,
+            "limit": self._limit,
+            "start_after": self._start_after,
+            "all_descendants": self._all_descendants,
+            **changes,
+        }
+        return FakeQuery(self._db, self._collection, **fields)
+
+    def where(self, field_path: str, op_string: str, value: Any) -> "FakeQuery":
+        if op_string not in _OPERATORS:
+            raise ValueError(f"operator {op_string!r} is not supported by the fake Firestore")
+        return self._copy(filters=self._filters + ((field_path, _OPERATORS[op_string], _normalize(value)),))
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "FakeQuery":
+        return self._copy(orders=self._orders + ((field_path, direction == "DESCENDING"),))
+
+    def limit(self, count: int) -> "FakeQuery":
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields) -> "FakeQuery":
+        """A snapshot, or {field: value} for the order_by fields ("__name__": document ID) like Firestore"""
+        return self._copy(start_after=document_fields)
+
+    def select(self, field_paths) -> "FakeQuery":
+        return self
+
+    def _matches(self, data: dict) -> bool:
+        for field, compare, value in self._filters:
+            # like Firestore: documents without the field never match
+            if field not in data:
+                return False
+            try:
+                if not compare(data[field], value):
+                    return False
+            except TypeError:
+                return False
+        return True
+
+    def _sort_key(self, path: str, data: dict, field: str):
+        value = path if field == "__name__" else data.get(field)
+        # missing fields sort first, values of different types don't compare
+        return (value is not None, value)
+
+    def _is_after(self, path: str, data: dict, orders, cursor: dict) -> bool:
+        for field, descending in orders:
+            if field not in cursor:
+                break
+            value = cursor[field]
+            if field == "__name__":
+                value = value if "/" in value else f"{self._collection}/{value}"
+            row, bound = self._sort_key(path, data, field), (value is not None, _normalize(value))
+            if row != bound:
+                return row < bound if descending else row > bound
+        return False
+
+    def _in_scope(self, path: str) -> bool:
+        if self._all_descendants:
+            segments = path.split("/")
+            return len(segments) >= 2 and segments[-2] == self._collection
+        prefix = self._collection + "/"
+        return path.startswith(prefix) and "/" not in path[len(prefix):]
+
+    def stream(self, **kwargs):
+        _firestore_wait()
+        with self._db.lock:
+            rows = [
+                (path, copy.deepcopy(data))
+                for path, data in self._db.documents.items()
+                if self._in_scope(path) and self._matches(data)
+            ]
+        orders = self._orders or (("__name__", False),)
+        for field, descending in reversed(orders):
+            rows.sort(key=lambda row: self._sort_key(row[0], row[1], field), reverse=descending)
+        if isinstance(self._start_after, dict):
+            rows = [row for row in rows if self._is_after(row[0], row[1], orders, self._start_after)]
+        elif self._start_after is not None:
+            paths = [path for path, _ in rows]
+            if self._start_after.reference.path in paths:
+                rows = rows[paths.index(self._start_after.reference.path) + 1:]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        return iter([FakeSnapshot(FakeDocumentReference(self._db, path), data) for path, data in rows])
+
+    def get(self, **kwargs) -> list:
+        return list(self.stream())
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db: "FakeFirestore", path: str):
+        super().__init__(db, path)
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, document_id: Optional[str] = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self._db, f"{self._collection}/{document_id or uuid.uuid4().hex}")
+
+    def add(self, document_data: dict):
+        reference = self.document()
+        reference.set(document_data)
+        return datetime.now(timezone.utc), reference
+
+
+class FakeWriteBatch:
+    def __init__(self, db: "FakeFirestore"):
+        self._db = db
+        self._ops = []
+
+    def set(self, reference, document_data: dict, merge=False):
+        # merge: True (deep merge) or a list of field paths to replace
+        self._ops.append(("set", reference.path, document_data, merge))
+
+    def create(self, reference, document_data: dict):
+        self._ops.append(("create", reference.path, document_data, False))
+
+    def update(self, reference, field_updates: dict):
+        self._ops.append(("update", reference.path, field_updates, False))
+
+    def delete(self, reference):
+        self._ops.append(("delete", reference.path, None, False))
+
+    def commit(self, **kwargs) -> list:
+        from google.api_core.exceptions import AlreadyExists, NotFound
+
+        _firestore_wait()
+        with self._db.lock:
+            # all or nothing: apply to copies, publish only if every write succeeded
+            changed = {}
+            now = datetime.now(timezone.utc)
+            for op, path, data, merge in self._ops:
+                current = changed[path] if path in changed else copy.deepcopy(self._db.documents.get(path))
+                if op == "create":
+                    if current is not None:
+                        raise AlreadyExists(f"Document already exists: {path}")
+                    current = _merge({}, data, now)
+                elif op == "set" and isinstance(merge, (list, tuple)):
+                    current = current if current is not None else {}
+                    for key in merge:
+                        found, value = _lookup(data, key)
+                        if found:
+                            _assign_path(current, key, value, now)
+                elif op == "set":
+                    current = _merge(current if merge and current is not None else {}, data, now)
+                elif op == "update":
+                    if current is None:
+                        raise NotFound(f"No document to update: {path}")
+                    for key, value in data.items():
+                        _assign_path(current, key, value, now)
+                else:
+                    current = None
+                changed[path] = current
+            for path, data in changed.items():
+                if data is None:
+                    self._db.documents.pop(path, None)
+                else:
+                    self._db.documents[path] = data
+        return []
+
+
+class FakeFirestore:
+    """Subset of google.cloud.firestore.Client backed by a dict"""
+
+    def __init__(self):
+        self.documents: dict[str, dict] = {}
+        self.lock = threading.RLock()
+
+    def collection(self, name: str) -> FakeCollection:
+        return FakeCollection(self, name)
+
+    def document(self, path: str) -> FakeDocumentReference:
+        return FakeDocumentReference(self, path)
+
+    def collection_group(self, collection_id: str) -> FakeQuery:
+        return FakeQuery(self, collection_id, all_descendants=True)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def get_all(self, references, **kwargs):
+        _firestore_wait()
+        with self.lock:
+            snapshots = [FakeSnapshot(ref, copy.deepcopy(self.documents.get(ref.path))) for ref in references]
+        return iter(snapshots)
+
+
+_firestore = None
+_firestore_lock = threading.Lock()
+
+
+def get_fake_firestore() -> FakeFirestore:
+    global _firestore
+    with _firestore_lock:
+        if _firestore is None:
+            _firestore = FakeFirestore()
+    return _firestore
+
+
+# --- LLM ---
+
+PARSE_COMPONENTS = ("task", "role", "style", "output", "rules", "context")
+# simulated reasoning trace length per reasoning_effort (None: the model default, "medium")
+FAKE_REASONING_TOKENS = {"low": 64, "medium": 256, "high": 1024}
+
+
+def _completion_text(messages: list[dict]) -> str:
+    system_prompt = next((m["content"] for m in messages if m["role"] == "system"), "")
+    user_prompt = next((m["content"] for m in messages if m["role"] == "user"), "")
+    prompt = user_prompt.removeprefix("Given prompt:")
+    if "Return valid JSON only" in system_prompt:
+        # parse: spread the prompt's sentences over the components
+        sentences = [s.strip() for s in prompt.split(".") if s.strip()] or [prompt]
+        parsed = {}
+        for index, component in enumerate(PARSE_COMPONENTS):
+            parsed[component] = sentences[index] if index < len(sentences) else ""
+            parsed[f"{component}_score"] = 7 if parsed[component] else 0
+        return json.dumps(parsed)
+    # optimize: the rewrite is roughly as long as the input
+    return prompt
+
+
+class _FakeStream:
+    def __init__(self, chunks: list, delay_s: float):
+        self._chunks = chunks
+        self._delay_s = delay_s
+        self._closed = False
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            if self._closed:
+                return
+            time.sleep(self._delay_s)
+            yield chunk
+
+    def close(self) -> None:
+        self._closed = True
+
+
+class _FakeCompletions:
+    _ids = itertools.count()
+
+    def create(self, model: str, messages: list[dict], stream: bool = False, max_tokens: Optional[int] = None,
+               reasoning_effort: Optional[str] = None, **kwargs):
+        content = _completion_text(messages)
+        prompt_tokens = sum(count_tokens(m["content"]) for m in messages)
+        reasoning_tokens = FAKE_REASONING_TOKENS.get(reasoning_effort or "medium", 256)
+        answer_tokens = count_tokens(content)
+        finish_reason = "stop"
+        if max_tokens is not None and reasoning_tokens + answer_tokens > max_tokens:
+            # like the real model: reasoning first, the answer is cut off at the limit
+            reasoning_tokens = min(reasoning_tokens, max_tokens)
+            kept = max_tokens - reasoning_tokens
+            content = content[:len(content) * kept // max(answer_tokens, 1)]
+            answer_tokens = kept
+            finish_reason = "length"
+        completion_tokens = reasoning_tokens + answer_tokens
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+            completion_tokens_details=SimpleNamespace(reasoning_tokens=reasoning_tokens),
+        )
+        latency_s = (settings.FAKE_LLM_LATENCY_MS + completion_tokens * settings.FAKE_LLM_MS_PER_TOKEN) / 1000
+        completion_id = f"fake-{next(self._ids)}"
+
+        if not stream:
+            time.sleep(latency_s)
+            message = SimpleNamespace(content=content, reasoning_content=None)
+            return SimpleNamespace(
+                id=completion_id,
+                model=model,
+                choices=[SimpleNamespace(message=message, finish_reason=finish_reason)],
+                usage=usage,
+            )
+
+        pieces = [content[i:i + 200] for i in range(0, len(content), 200)] or [""]
+        chunks = [
+            SimpleNamespace(
+                id=completion_id,
+                model=model,
+                usage=None,
+                choices=[SimpleNamespace(
+                    delta=SimpleNamespace(content=piece, reasoning_content=None),
+                    finish_reason=finish_reason if index == len(pieces) - 1 else None,
+                )],
+            )
+            for index, piece in enumerate(pieces)
+        ]
+        chunks.append(SimpleNamespace(id=completion_id, model=model, usage=usage, choices=[]))
+        return _FakeStream(chunks, latency_s / len(chunks))
+
+
+class FakeLLMClient:
+    """Stands in for the OpenAI-compatible client: chat.completions.create and models.list"""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=_FakeCompletions())
+        self.models = SimpleNamespace(list=self._list_models)
+
+    @staticmethod
+    def _list_models():
+        time.sleep(settings.FAKE_FIRESTORE_LATENCY_MS / 1000)
+        return SimpleNamespace(data=[SimpleNamespace(id=settings.NEBIUS_MODEL)])
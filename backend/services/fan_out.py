@@ -0,0 +1,119 @@
+"""Run one optimization against several models at once (first / all / best)"""
+import asyncio
+import contextvars
+import sys
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+try:
+    from .metrics import increment
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from services.metrics import increment
+
+FAN_OUT_POLICIES = ("first", "all", "best")
+
+# strong references to "first" policy background tasks, so they aren't garbage collected
+_background_tasks = set()
+
+
+def _background_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    # nobody awaits the "first" background part: count a failed write instead of losing it silently
+    if not task.cancelled() and task.exception() is not None:
+        increment("fan_out.background_errors")
+
+
+def token_reduction_score(initial_tokens: int, variant: dict) -> float:
+    """
+    Cheap local score for ranking variants: relative token reduction vs. the input
+    (higher is better, negative if the variant is longer than the input).
+    """
+    if not initial_tokens:
+        return -float(variant["finalTokenSize"])
+    return (initial_tokens - variant["finalTokenSize"]) / initial_tokens
+
+
+async def fan_out_optimize(
+    prompt_model: Any,
+    models: list[str],
+    policy: str,
+    weights: Optional[dict],
+    persist: Callable[[list[dict]], Any],
+    target: Optional[str] = None,
+) -> dict:
+    """
+    Generate one optimized variant per model concurrently.
+
+    Every successful variant is added to the prompt and persisted with a single
+    persist(variants) call. With "first" the fastest result is returned right away
+    and the remaining models (and the write) finish in the background.
+
+    Args:
+        prompt_model: PromptDBModel with inputPrompt / initialTokenSize loaded
+        models: Model names to run
+        policy: "first", "all" or "best"
+        weights: Component weights, or None for the defaults
+        persist: Blocking function that writes the given variants (run in a thread)
+        target: Strict length for every variant ("shorter" or a token count)
+
+    Returns:
+        Dictionary with the selected variant(s) and per-model errors; with "first" also
+        the models still running ("pending") and the task finishing them ("background")
+    """
+    loop = asyncio.get_running_loop()
+
+    def generate(model: str) -> dict:
+        if weights:
+            return prompt_model.generate_optimized_variant(ai_model=model, weights=weights, target=target)
+        return prompt_model.generate_optimized_variant(ai_model=model, target=target)
+
+    # run_in_executor doesn't copy the context; copy it so quota/deadline context vars reach the threads
+    futures = {
+        asyncio.ensure_future(loop.run_in_executor(None, contextvars.copy_context().run, generate, model)): model
+        for model in models
+    }
+    variants = []
+    errors = {}
+
+    def collect(done) -> None:
+        for future in done:
+            if future.exception() is not None:
+                errors[futures[future]] = str(future.exception())
+            else:
+                variants.append(future.result())
+
+    async def finish(pending) -> None:
+        if pending:
+            collect((await asyncio.wait(pending))[0])
+        for variant in variants:
+            prompt_model.add_optimized_variant(variant)
+        if variants:
+            await loop.run_in_executor(None, persist, list(variants))
+
+    if policy == "first":
+        pending = set(futures)
+        while pending and not variants:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            collect(done)
+        if not variants:
+            return {"selected": None, "variants": [], "errors": errors}
+
+        selected = variants[0]
+        task = asyncio.create_task(finish(pending))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_done)
+        return {"selected": selected, "variants": [selected], "pending": [futures[f] for f in pending],
+                "background": task, "errors": errors}
+
+    await finish(set(futures))
+    if not variants:
+        return {"selected": None, "variants": [], "errors": errors}
+
+    if policy == "best":
+        for variant in variants:
+            variant["score"] = token_reduction_score(prompt_model.initialTokenSize, variant)
+        variants.sort(key=lambda v: (v["score"], -(v.get("llmLatencyMs") or 0)), reverse=True)
+    else:
+        variants.sort(key=lambda v: models.index(v["usedLLM"]))
+    return {"selected": variants[0], "variants": variants, "errors": errors}
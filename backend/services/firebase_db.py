@@ -1,14 +1,25 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
-
 import os
 import json
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 
+try:
+    from ..core.config import settings
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+
 load_dotenv()
 
+# firebase_admin (and grpc / google-cloud underneath) is imported on first use,
+# so importing the app stays fast and routes that never touch Firestore don't pay for it
+
 # starting firebase (singleton pattern)
 def initialize_firebase():
+    import firebase_admin
+    from firebase_admin import credentials
+
     if not firebase_admin._apps:
 
 
@@ -19,5 +30,12 @@ def initialize_firebase():
         firebase_admin.initialize_app(cred)
 
 def get_firestore_client():
+    if settings.FIRESTORE_BACKEND == "fake":
+        # in-memory stand-in, see services/fakes.py
+        from .fakes import get_fake_firestore
+        return get_fake_firestore()
+
+    from firebase_admin import firestore
+
     initialize_firebase()
     return firestore.client()
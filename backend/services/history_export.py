@@ -0,0 +1,142 @@
+"""Constant-memory export of a user's prompt history (NDJSON / CSV)"""
+import csv
+import heapq
+import io
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, Optional
+
+import orjson
+
+try:
+    from .firebase_db import get_firestore_client
+    from .compression import decompress_prompt_fields
+    from .prompt_repository import repository
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from services.firebase_db import get_firestore_client
+    from services.compression import decompress_prompt_fields
+    from services.prompt_repository import repository
+
+EXPORT_PAGE_SIZE = 500
+
+PROMPT_COLUMNS = [
+    "promptID", "projectID", "createdAt", "inputPrompt", "initialTokenSize",
+    "overallScores", "isFavorite", "copyCount",
+]
+VARIANT_COLUMNS = ["variantID", "optimizedPrompt", "usedLLM", "finalTokenSize", "latencyMs", "rating"]
+
+
+def iter_user_prompts(
+    user_id: str,
+    project_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    is_favorite: Optional[bool] = None,
+    page_size: int = EXPORT_PAGE_SIZE,
+) -> Iterator[dict]:
+    """
+    Yield a user's prompt documents ordered by createdAt, one Firestore page at a time.
+
+    Pages are fetched with start_after cursors, so only one page (per project in
+    the nested layout, merged by createdAt) is held in memory. Filtering on projectID / isFavorite together with the createdAt ordering needs
+    the matching composite index in Firestore.
+
+    Args:
+        user_id: Owner of the prompts
+        project_id: Only this project
+        start: createdAt >= start
+        end: createdAt < end
+        is_favorite: Only favorites (True) or non-favorites (False)
+        page_size: Documents per Firestore request
+
+    Yields:
+        Decompressed prompt document dictionaries
+    """
+    db = get_firestore_client()
+    streams = []
+    for query in repository.user_queries(db, user_id, project_id):
+        if is_favorite is not None:
+            query = query.where("isFavorite", "==", is_favorite)
+        if start:
+            query = query.where("createdAt", ">=", start)
+        if end:
+            query = query.where("createdAt", "<", end)
+        streams.append(_paged(query.order_by("createdAt"), page_size))
+    if len(streams) == 1:
+        yield from streams[0]
+        return
+    yield from heapq.merge(*streams, key=lambda data: _isoformat(data.get("createdAt")) or "")
+
+
+def _paged(query, page_size: int) -> Iterator[dict]:
+    last_doc = None
+    while True:
+        page = query.limit(page_size)
+        if last_doc is not None:
+            page = page.start_after(last_doc)
+        docs = list(page.stream())
+        for doc in docs:
+            yield decompress_prompt_fields(doc.to_dict())
+        if len(docs) < page_size:
+            return
+        last_doc = docs[-1]
+
+
+def _isoformat(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def _prompt_row(data: dict) -> dict:
+    row = {column: data.get(column) for column in PROMPT_COLUMNS}
+    row["createdAt"] = _isoformat(row["createdAt"])
+    return row
+
+
+def _variant_rows(data: dict) -> list[dict]:
+    ratings = data.get("ratings") or {}
+    return [
+        {
+            "variantID": variant_id,
+            "optimizedPrompt": text,
+            "usedLLM": (data.get("usedLLMs") or {}).get(variant_id),
+            "finalTokenSize": (data.get("finalTokenSizes") or {}).get(variant_id),
+            "latencyMs": (data.get("latencyMs") or {}).get(variant_id),
+            "rating": ratings.get(variant_id),
+        }
+        for variant_id, text in (data.get("optimizedPrompts") or {}).items()
+    ]
+
+
+def export_ndjson(prompts: Iterator[dict], include_variants: bool = False) -> Iterator[bytes]:
+    """One JSON object per prompt and line; variants are nested under "variants" """
+    for data in prompts:
+        row = _prompt_row(data)
+        if include_variants:
+            row["variants"] = _variant_rows(data)
+        yield orjson.dumps(row) + b"\n"
+
+
+def export_csv(prompts: Iterator[dict], include_variants: bool = False) -> Iterator[str]:
+    """CSV with a header row; with variants there is one row per (prompt, variant)"""
+    columns = PROMPT_COLUMNS + (VARIANT_COLUMNS if include_variants else [])
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns)
+
+    def flush() -> str:
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return text
+
+    writer.writeheader()
+    yield flush()
+    for data in prompts:
+        row = _prompt_row(data)
+        variants = _variant_rows(data) if include_variants else []
+        if not variants:
+            writer.writerow(row)
+        for variant in variants:
+            writer.writerow({**row, **variant})
+        yield flush()
@@ -0,0 +1,260 @@
+"""
+Live history push over WebSocket.
+
+Each connected user gets one UserFeed per worker, shared by all of that user's
+tabs. A feed holds two Firestore snapshot listeners: the user's prompts with
+`updatedAt` after the feed started, and their tombstones with `deletedAt`
+after it. The listened result sets only contain what changed during the
+session, so a listener stays cheap however long the history is. Listener
+callbacks run on Firestore's threads; diffs are handed to the event loop and
+fanned out to the feed's connections.
+
+A feed whose last connection closed is torn down after HISTORY_PUSH_IDLE_S, so
+a reloading tab reuses it. Connections and feeds are capped per worker.
+
+A client connecting with the cursor of its last /history load gets what
+changed since then through backfill() (delta sync) after its connection is
+registered, so nothing between the load and the connect is missed; diffs in
+both are sent twice, which applying them tolerates.
+
+FakeListenerSource (HISTORY_PUSH_SOURCE=fake) replaces Firestore for local
+runs and tools/bench_history_push.py.
+"""
+import asyncio
+import sys
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+try:
+    from ..core.config import settings
+    from .metrics import increment
+    from .firebase_db import get_firestore_client
+    from .compression import decompress_prompt_fields
+    from .history_sync import TOMBSTONE_COLLECTION, Cursor, history_item, encode_cursor, decode_cursor, changes_since
+    from .prompt_repository import repository
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+    from services.metrics import increment
+    from services.firebase_db import get_firestore_client
+    from services.compression import decompress_prompt_fields
+    from services.history_sync import TOMBSTONE_COLLECTION, Cursor, history_item, encode_cursor, decode_cursor, changes_since
+    from services.prompt_repository import repository
+
+# WebSocket close code: try again later
+CLOSE_TRY_AGAIN = 1013
+# delta sync pages sent on connect before the client is told to reload instead
+BACKFILL_MAX_PAGES = 4
+
+
+class PushLimitReached(Exception):
+    pass
+
+
+def _prompt_diff(data: dict) -> dict:
+    diff = {"type": "changed", "prompt": history_item(data)}
+    if isinstance(data.get("updatedAt"), datetime):
+        diff["cursor"] = encode_cursor(data["updatedAt"])
+    return diff
+
+
+def _deleted_diff(data: dict) -> dict:
+    diff = {"type": "deleted", "id": data.get("promptID")}
+    if isinstance(data.get("deletedAt"), datetime):
+        diff["cursor"] = encode_cursor(data["deletedAt"])
+    return diff
+
+
+def backfill(user_id: str, since: Cursor) -> list[dict]:
+    """
+    Diffs for changes after a /history cursor, sent before the live ones.
+    Only the last diff of each delta sync page carries a cursor: one taken
+    inside a page could skip prompts sharing its timestamp.
+
+    Returns:
+        "changed" / "deleted" diffs, or ending in {"type": "resync"} when there are
+        more than BACKFILL_MAX_PAGES pages or the cursor is past tombstone retention
+    """
+    diffs = []
+    for _ in range(BACKFILL_MAX_PAGES):
+        changes = changes_since(user_id, since)
+        if changes["fullResync"]:
+            break
+        page = [_prompt_diff(data) for data in changes["changed"]]
+        page += [{"type": "deleted", "id": prompt_id} for prompt_id in changes["deleted"]]
+        for diff in page:
+            diff.pop("cursor", None)
+        if page:
+            page[-1]["cursor"] = changes["cursor"]
+        diffs += page
+        if not changes["hasMore"]:
+            increment("push.backfilled", len(diffs))
+            return diffs
+        since = decode_cursor(changes["cursor"])
+    increment("push.backfill_resyncs")
+    return diffs + [{"type": "resync"}]
+
+
+class FirestoreListenerSource:
+    """Snapshot listeners on the user's recently changed prompts and tombstones"""
+
+    def subscribe(self, user_id: str, since: datetime, emit: Callable[[dict], None]) -> Callable[[], None]:
+        db = get_firestore_client()
+
+        def on_prompts(_docs, changes, _read_time):
+            for change in changes:
+                # a prompt leaving this query result was deleted; its tombstone reports that
+                if change.type.name in ("ADDED", "MODIFIED"):
+                    emit(_prompt_diff(decompress_prompt_fields(change.document.to_dict())))
+
+        def on_tombstones(_docs, changes, _read_time):
+            for change in changes:
+                if change.type.name == "ADDED":
+                    emit(_deleted_diff(change.document.to_dict()))
+
+        # one prompt listener per project in the nested layout
+        watches = [
+            query.where("updatedAt", ">", since).on_snapshot(on_prompts)
+            for query in repository.user_queries(db, user_id)
+        ]
+        watches.append(
+            db.collection(TOMBSTONE_COLLECTION).where("userID", "==", user_id).where("deletedAt", ">", since).on_snapshot(on_tombstones)
+        )
+
+        def unsubscribe():
+            for watch in watches:
+                watch.unsubscribe()
+        return unsubscribe
+
+
+class FakeListenerSource:
+    """In-process stand-in for Firestore listeners: call emit_prompt / emit_deleted to push"""
+
+    def __init__(self):
+        self._emitters = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: str, since: datetime, emit: Callable[[dict], None]) -> Callable[[], None]:
+        with self._lock:
+            self._emitters[user_id] = emit
+
+        def unsubscribe():
+            with self._lock:
+                if self._emitters.get(user_id) is emit:
+                    del self._emitters[user_id]
+        return unsubscribe
+
+    def listening(self, user_id: str) -> bool:
+        return user_id in self._emitters
+
+    def emit_prompt(self, user_id: str, data: dict) -> bool:
+        emit = self._emitters.get(user_id)
+        if emit is not None:
+            emit(_prompt_diff({"userID": user_id, "updatedAt": datetime.now(timezone.utc), **data}))
+        return emit is not None
+
+    def emit_deleted(self, user_id: str, prompt_id: str) -> bool:
+        emit = self._emitters.get(user_id)
+        if emit is not None:
+            emit(_deleted_diff({"promptID": prompt_id, "deletedAt": datetime.now(timezone.utc)}))
+        return emit is not None
+
+
+class UserFeed:
+    def __init__(self, hub: "PushHub", user_id: str):
+        self.hub = hub
+        self.user_id = user_id
+        self.queues: set[asyncio.Queue] = set()
+        self.idle_handle: Optional[asyncio.TimerHandle] = None
+        self._unsubscribe = None
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        def emit(diff: dict) -> None:
+            # called on a listener thread
+            loop.call_soon_threadsafe(self.publish, diff)
+        self._unsubscribe = self.hub.source.subscribe(self.user_id, datetime.now(timezone.utc), emit)
+        increment("push.listeners_started")
+
+    def publish(self, diff: dict) -> None:
+        increment("push.diffs")
+        for queue in list(self.queues):
+            try:
+                queue.put_nowait(diff)
+            except asyncio.QueueFull:
+                # slow client: tell it to resync over /history instead of buffering without bound
+                increment("push.slow_clients")
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync"})
+
+    def stop(self) -> None:
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+            increment("push.listeners_stopped")
+
+
+class PushHub:
+    """Per-worker registry of user feeds and their WebSocket connections"""
+
+    def __init__(self, source=None):
+        self.source = source or (FakeListenerSource() if settings.HISTORY_PUSH_SOURCE == "fake" else FirestoreListenerSource())
+        self.feeds: dict[str, UserFeed] = {}
+        self.connections = 0
+
+    def connect(self, user_id: str) -> asyncio.Queue:
+        """
+        Register a connection for user_id and return its diff queue.
+
+        Raises:
+            PushLimitReached: Worker connection / listener or per-user tab limit reached
+        """
+        if self.connections >= settings.HISTORY_PUSH_MAX_CONNECTIONS:
+            raise PushLimitReached("connection limit reached")
+        feed = self.feeds.get(user_id)
+        if feed is None:
+            if len(self.feeds) >= settings.HISTORY_PUSH_MAX_LISTENERS:
+                raise PushLimitReached("listener limit reached")
+            feed = self.feeds[user_id] = UserFeed(self, user_id)
+            feed.start(asyncio.get_running_loop())
+        elif len(feed.queues) >= settings.HISTORY_PUSH_MAX_TABS:
+            raise PushLimitReached("too many connections for this user")
+
+        if feed.idle_handle is not None:
+            feed.idle_handle.cancel()
+            feed.idle_handle = None
+        queue = asyncio.Queue(maxsize=settings.HISTORY_PUSH_QUEUE_SIZE)
+        feed.queues.add(queue)
+        self.connections += 1
+        return queue
+
+    def disconnect(self, user_id: str, queue: asyncio.Queue) -> None:
+        feed = self.feeds.get(user_id)
+        if feed is None or queue not in feed.queues:
+            return
+        feed.queues.discard(queue)
+        self.connections -= 1
+        if not feed.queues:
+            feed.idle_handle = asyncio.get_running_loop().call_later(
+                settings.HISTORY_PUSH_IDLE_S, self._teardown, user_id, feed
+            )
+
+    def _teardown(self, user_id: str, feed: UserFeed) -> None:
+        if self.feeds.get(user_id) is feed and not feed.queues:
+            del self.feeds[user_id]
+            feed.stop()
+
+    def close_all(self) -> None:
+        for feed in self.feeds.values():
+            if feed.idle_handle is not None:
+                feed.idle_handle.cancel()
+            feed.stop()
+        self.feeds.clear()
+
+    def stats(self) -> dict:
+        return {"connections": self.connections, "listeners": len(self.feeds)}
+
+
+hub = PushHub()
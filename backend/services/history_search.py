@@ -0,0 +1,306 @@
+"""
+Per-user full-text search over the prompt history (BM25).
+
+Each worker keeps an inverted index per user, built on the user's first
+search from their prompt documents (inputPrompt, optimized variants and
+parsed components, with lower weights for the latter two). After that it
+stays current two ways:
+
+- writes made by this worker are applied right away (upsert / remove)
+- before a search, changes from other workers are pulled with the history
+  delta sync (history_sync.changes_since), at most every HISTORY_SEARCH_SYNC_S
+
+Indexes are evicted least recently used once their estimated size passes
+HISTORY_SEARCH_MEMORY_MB.
+"""
+import heapq
+import math
+import re
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from operator import itemgetter
+from pathlib import Path
+from typing import Optional
+
+try:
+    from ..core.config import settings
+    from .firebase_db import get_firestore_client
+    from .compression import decompress_prompt_fields
+    from .prompt_repository import repository
+    from .metrics import increment
+    from . import history_sync
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+    from services.firebase_db import get_firestore_client
+    from services.compression import decompress_prompt_fields
+    from services.prompt_repository import repository
+    from services.metrics import increment
+    from services import history_sync
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# term frequency weight per field
+FIELD_WEIGHTS = {"input": 1.0, "optimized": 0.5, "parsed": 0.5}
+PARSED_FIELDS = ("role", "task", "context", "style", "output", "rules")
+SNIPPET_CHARS = 200
+REWEIGHT_DRIFT = 0.1
+# rough CPython cost of one posting (dict slot + float) and of one document's metadata
+POSTING_BYTES = 120
+DOCUMENT_BYTES = 600
+
+_TOKEN = re.compile(r"\w\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN.findall(text.lower()) if text else []
+
+
+def _weighted_terms(data: dict) -> dict[str, float]:
+    parsed = data.get("parsedData") or {}
+    fields = {
+        "input": [data.get("inputPrompt")],
+        "optimized": list((data.get("optimizedPrompts") or {}).values()),
+        "parsed": [parsed.get(name) for name in PARSED_FIELDS],
+    }
+    terms = {}
+    for field, texts in fields.items():
+        weight = FIELD_WEIGHTS[field]
+        # Counter over the whole field counts in C
+        counts = Counter(tokenize(" ".join(text for text in texts if isinstance(text, str))))
+        for term, count in counts.items():
+            terms[term] = terms.get(term, 0.0) + count * weight
+    return terms
+
+
+def _metadata(data: dict) -> dict:
+    item = history_sync.history_item(data)
+    prompt = item.get("prompt") or ""
+    return {
+        "id": item["id"],
+        "prompt": prompt[:SNIPPET_CHARS] + ("…" if len(prompt) > SNIPPET_CHARS else ""),
+        "timestamp": item.get("timestamp"),
+        "isFavorite": item.get("isFavorite", False),
+        "projectID": data.get("projectID"),
+    }
+
+
+class UserIndex:
+    """
+    Inverted index of one user's prompts; not thread-safe, callers hold `lock`.
+
+    Postings hold each document's BM25 term weight without the idf
+    (tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / average))), so a query
+    only multiplies and adds. They are recomputed when the average document
+    length has drifted by more than REWEIGHT_DRIFT.
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        self.postings: dict[str, dict[str, float]] = {}
+        self.doc_terms: dict[str, dict[str, float]] = {}
+        self.doc_length: dict[str, float] = {}
+        self.metadata: dict[str, dict] = {}
+        self.total_length = 0.0
+        self.posting_count = 0
+        # average document length the postings were weighted with
+        self.weighted_average = 0.0
+        self.cursor: Optional[str] = None
+        self.synced_at = 0.0
+
+    @property
+    def size_bytes(self) -> int:
+        return self.posting_count * POSTING_BYTES + len(self.metadata) * DOCUMENT_BYTES
+
+    @property
+    def average_length(self) -> float:
+        return self.total_length / len(self.doc_terms) if self.doc_terms else 0.0
+
+    def _weights(self, terms: dict[str, float], length: float) -> dict[str, float]:
+        norm = K1 * (1 - B + B * length / (self.weighted_average or length or 1.0))
+        return {term: tf * (K1 + 1) / (tf + norm) for term, tf in terms.items()}
+
+    def reweight(self) -> None:
+        """Recompute every posting for the current average document length"""
+        self.weighted_average = self.average_length
+        for prompt_id, terms in self.doc_terms.items():
+            for term, weight in self._weights(terms, self.doc_length[prompt_id]).items():
+                self.postings[term][prompt_id] = weight
+
+    def upsert(self, data: dict) -> None:
+        prompt_id = data.get("promptID")
+        if not prompt_id:
+            return
+        self.remove(prompt_id)
+        terms = _weighted_terms(data)
+        length = sum(terms.values())
+        for term, weight in self._weights(terms, length).items():
+            self.postings.setdefault(term, {})[prompt_id] = weight
+        self.doc_terms[prompt_id] = terms
+        self.doc_length[prompt_id] = length
+        self.metadata[prompt_id] = _metadata(data)
+        self.total_length += length
+        self.posting_count += len(terms)
+
+    def remove(self, prompt_id: str) -> None:
+        terms = self.doc_terms.pop(prompt_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(prompt_id, None)
+                if not docs:
+                    del self.postings[term]
+        self.total_length -= self.doc_length.pop(prompt_id, 0.0)
+        self.posting_count -= len(terms)
+        self.metadata.pop(prompt_id, None)
+
+    def set_favorite(self, prompt_id: str, is_favorite: bool) -> None:
+        if prompt_id in self.metadata:
+            self.metadata[prompt_id]["isFavorite"] = is_favorite
+
+    def search(self, query: str, limit: int, project_id: Optional[str] = None) -> tuple[list[dict], int]:
+        """(top `limit` results, number of matching prompts)"""
+        count = len(self.doc_terms)
+        if not count:
+            return [], 0
+        average = self.average_length
+        if not self.weighted_average or abs(average - self.weighted_average) > REWEIGHT_DRIFT * self.weighted_average:
+            self.reweight()
+
+        matched = [(term, self.postings[term]) for term in set(tokenize(query)) if term in self.postings]
+        # rarest term first: its postings seed the scores with one C-level dict build
+        matched.sort(key=lambda item: len(item[1]))
+        scores: dict[str, float] = {}
+        for position, (term, docs) in enumerate(matched):
+            idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            if position == 0:
+                scores = {prompt_id: idf * weight for prompt_id, weight in docs.items()}
+                continue
+            get = scores.get
+            for prompt_id, weight in docs.items():
+                scores[prompt_id] = get(prompt_id, 0.0) + idf * weight
+        if project_id:
+            scores = {pid: score for pid, score in scores.items() if self.metadata[pid].get("projectID") == project_id}
+        top = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+        return [{**self.metadata[pid], "score": round(score, 4)} for pid, score in top], len(scores)
+
+
+class SearchIndexes:
+    def __init__(self):
+        self._indexes: "OrderedDict[str, UserIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _loaded(self, user_id: str) -> Optional[UserIndex]:
+        with self._lock:
+            return self._indexes.get(user_id)
+
+    def _index(self, user_id: str) -> UserIndex:
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                index = self._indexes[user_id] = UserIndex(user_id)
+            self._indexes.move_to_end(user_id)
+            return index
+
+    def _evict(self, keep: str) -> None:
+        budget = settings.HISTORY_SEARCH_MEMORY_MB * 1024 * 1024
+        with self._lock:
+            total = sum(index.size_bytes for index in self._indexes.values())
+            for user_id in list(self._indexes):
+                if total <= budget:
+                    break
+                if user_id == keep:
+                    continue
+                total -= self._indexes.pop(user_id).size_bytes
+                increment("search.evictions")
+
+    def _build(self, index: UserIndex) -> None:
+        index.clear()
+        db = get_firestore_client()
+        documents = []
+        for query in repository.user_queries(db, index.user_id):
+            for doc in query.stream():
+                data = decompress_prompt_fields(doc.to_dict())
+                index.upsert(data)
+                documents.append({"updatedAt": data.get("updatedAt")})
+        index.reweight()
+        index.cursor = history_sync.cursor_for(documents)
+        index.synced_at = time.monotonic()
+        increment("search.builds")
+
+    def _catch_up(self, index: UserIndex) -> None:
+        """Apply changes made by other workers since the last sync"""
+        while True:
+            changes = history_sync.changes_since(index.user_id, history_sync.decode_cursor(index.cursor))
+            if changes["fullResync"]:
+                self._build(index)
+                return
+            for data in changes["changed"]:
+                index.upsert(data)
+            for prompt_id in changes["deleted"]:
+                index.remove(prompt_id)
+            index.cursor = changes["cursor"]
+            if not changes["hasMore"]:
+                break
+        index.synced_at = time.monotonic()
+
+    def search(self, user_id: str, query: str, limit: int = 20, project_id: Optional[str] = None) -> dict:
+        """
+        BM25-ranked prompts of a user matching `query`.
+
+        Returns:
+            {"results": [{"id", "prompt", "timestamp", "isFavorite", "projectID", "score"}],
+             "total": matching prompt count, "indexed": prompts in the index}
+        """
+        index = self._index(user_id)
+        with index.lock:
+            if index.cursor is None:
+                self._build(index)
+            elif time.monotonic() - index.synced_at >= settings.HISTORY_SEARCH_SYNC_S:
+                self._catch_up(index)
+            results, total = index.search(query, limit, project_id)
+            indexed = len(index.doc_terms)
+        self._evict(keep=user_id)
+        return {"results": results, "total": total, "indexed": indexed}
+
+    # --- local writes (no-ops for users without a loaded index) ---
+
+    def upsert(self, user_id: str, data: dict) -> None:
+        index = self._loaded(user_id)
+        if index is not None:
+            with index.lock:
+                if index.cursor is not None:
+                    index.upsert(decompress_prompt_fields(dict(data)))
+
+    def remove(self, user_id: str, prompt_id: str) -> None:
+        index = self._loaded(user_id)
+        if index is not None:
+            with index.lock:
+                index.remove(prompt_id)
+
+    def set_favorite(self, user_id: str, prompt_id: str, is_favorite: bool) -> None:
+        index = self._loaded(user_id)
+        if index is not None:
+            with index.lock:
+                index.set_favorite(prompt_id, is_favorite)
+
+    def stats(self) -> dict:
+        with self._lock:
+            indexes = list(self._indexes.values())
+        return {
+            "users": len(indexes),
+            "documents": sum(len(index.doc_terms) for index in indexes),
+            "estimatedBytes": sum(index.size_bytes for index in indexes),
+        }
+
+
+indexes = SearchIndexes()
@@ -0,0 +1,219 @@
+"""
+Delta sync for the prompt history.
+
+Every prompt write stamps `updatedAt` with the Firestore server timestamp and
+deleting a prompt leaves a tombstone in `prompt_tombstones`. A client keeps the
+cursor from its last sync and asks only for prompts changed / deleted after it.
+
+Cursors are the largest server timestamp the client has seen. Server
+timestamps are assigned at commit (for journaled writes: at replay), so a write
+that isn't visible to a sync yet always gets a timestamp after that sync's cursor.
+One batched commit (write-behind, journal replay) stamps many documents with the
+same timestamp, so a page cut off inside such a group ends in a cursor that also
+carries the last document ID ("<timestamp>~<id>"), and the next call resumes
+after (updatedAt, document ID) instead of skipping the rest of the group.
+"""
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from fastapi import HTTPException
+
+try:
+    from ..core.config import settings
+    from .firebase_db import get_firestore_client
+    from .compression import decompress_prompt_fields
+    from .prompt_repository import repository
+    from .write_journal import overlay
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+    from services.firebase_db import get_firestore_client
+    from services.compression import decompress_prompt_fields
+    from services.prompt_repository import repository
+    from services.write_journal import overlay
+
+TOMBSTONE_COLLECTION = "prompt_tombstones"
+SYNC_PAGE_SIZE = 500
+CURSOR_ID_SEPARATOR = "~"
+# cursor for a first sync that saw no timestamps: allow for clock skew vs. Firestore
+CLOCK_SKEW = timedelta(seconds=5)
+
+
+def touch(data: dict) -> dict:
+    """Copy of a prompt write with updatedAt set to the server timestamp"""
+    from firebase_admin import firestore
+
+    return {**data, "updatedAt": firestore.SERVER_TIMESTAMP}
+
+
+def add_tombstone(db, batch, prompt_id: str, user_id: str) -> None:
+    """Record a prompt deletion in the same batch that deletes the prompt"""
+    from firebase_admin import firestore
+
+    batch.set(db.collection(TOMBSTONE_COLLECTION).document(prompt_id), {
+        "promptID": prompt_id,
+        "userID": user_id,
+        "deletedAt": firestore.SERVER_TIMESTAMP,
+        # add a Firestore TTL policy on expireAt; older cursors need a full resync
+        "expireAt": datetime.now(timezone.utc) + timedelta(days=settings.HISTORY_TOMBSTONE_TTL_DAYS),
+    })
+
+
+def history_item(data: dict) -> dict:
+    """Prompt document -> the item shape /history returns"""
+    created_at = data.get("createdAt")
+    if hasattr(created_at, "isoformat"):
+        created_at = created_at.isoformat()
+    updated_at = data.get("updatedAt")
+    if hasattr(updated_at, "isoformat"):
+        updated_at = updated_at.isoformat()
+
+    return {
+        "id": data.get("promptID"),
+        "prompt": data.get("inputPrompt"),
+        "optimizedPrompt": data.get("optimizedPrompts", {}).get("default", ""),
+        "timestamp": created_at,
+        "updatedAt": updated_at,
+        "isFavorite": data.get("isFavorite", False),
+        "copyCount": data.get("copyCount", 0),
+        "tokenCount": data.get("initialTokenSize", 0),
+        "latency": data.get("latencyMs", {}).get("default", 0),
+    }
+
+
+class Cursor(NamedTuple):
+    """Everything up to `at` was seen; with `after_id`, only up to that document among those stamped `at`"""
+    at: datetime
+    after_id: Optional[str] = None
+
+
+def encode_cursor(value: datetime, after_id: Optional[str] = None) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.isoformat() + (f"{CURSOR_ID_SEPARATOR}{after_id}" if after_id else "")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    stamp, _, after_id = cursor.partition(CURSOR_ID_SEPARATOR)
+    try:
+        value = datetime.fromisoformat(stamp.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since must be a cursor returned by /history")
+    return Cursor(value if value.tzinfo else value.replace(tzinfo=timezone.utc), after_id or None)
+
+
+def _as_utc(value) -> Optional[datetime]:
+    if not isinstance(value, datetime):
+        return None
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def cursor_for(documents: list[dict]) -> str:
+    """Cursor after a full history load: the newest updatedAt among the documents"""
+    stamps = [stamp for stamp in (_as_utc(d.get("updatedAt")) for d in documents) if stamp]
+    return encode_cursor(max(stamps) if stamps else datetime.now(timezone.utc) - CLOCK_SKEW)
+
+
+def latest(user_id: str, limit: int, project_id: Optional[str] = None) -> dict:
+    """
+    A full history load: the user's `limit` most recently changed prompts, with
+    acknowledged writes still waiting in the write journal applied (prompts
+    Firestore doesn't have yet included).
+
+    Returns:
+        {"documents": [prompt dicts, most recently changed first], "cursor": str}
+        The cursor comes from what Firestore returned: journaled writes are stamped
+        when they are replayed, after it, so the next sync sends them again.
+        Everything changed up to the cursor was sent or is older than the `limit`
+        newest changes; prompts without updatedAt need tools/backfill_updated_at.py.
+    """
+    db = get_firestore_client()
+    stored = {}
+    # flat layout: composite index (userID, updatedAt descending)
+    for query in repository.user_queries(db, user_id, project_id):
+        for doc in query.order_by("updatedAt", direction="DESCENDING").limit(limit).stream():
+            stored[doc.reference.path] = doc.to_dict()
+
+    kept = []
+    for path in list(stored) + [path for path in repository.journaled(user_id, project_id) if path not in stored]:
+        # overlay updates in place; the stored updatedAt is kept for the cursor
+        data = overlay(path, dict(stored[path]) if path in stored else None)
+        if data is None or data.get("userID") != user_id or (project_id and data.get("projectID") != project_id):
+            continue
+        kept.append((path, data))
+    # overlay stamps journaled writes with the local time, so they come first
+    oldest = datetime.min.replace(tzinfo=timezone.utc)
+    kept.sort(key=lambda item: _as_utc(item[1].get("updatedAt")) or oldest, reverse=True)
+    kept = kept[:limit]
+    return {
+        "documents": [decompress_prompt_fields(data) for _, data in kept],
+        "cursor": cursor_for([stored[path] for path, _ in kept if path in stored]),
+    }
+
+
+def _after(query, field: str, since: Cursor):
+    """`query` ordered by (field, document ID), resumed after the cursor"""
+    query = query.order_by(field).order_by("__name__")
+    if since.after_id:
+        return query.start_after({field: since.at, "__name__": since.after_id})
+    return query.where(field, ">", since.at)
+
+
+def changes_since(user_id: str, since: Cursor, page_size: int = SYNC_PAGE_SIZE,
+                  project_id: Optional[str] = None) -> dict:
+    """
+    Prompts created / modified and prompts deleted after `since`.
+
+    Args:
+        user_id: Owner of the history
+        since: Decoded client cursor
+        page_size: Maximum prompts and tombstones per call
+        project_id: Only prompts of this project (tombstones are per user)
+
+    Returns:
+        {"changed": [prompt dicts], "deleted": [prompt IDs], "cursor": str,
+         "hasMore": bool, "fullResync": bool}
+        With hasMore the client calls again with the new cursor. With
+        fullResync the cursor is older than tombstone retention and the
+        client has to reload the whole history.
+    """
+    if since.at < datetime.now(timezone.utc) - timedelta(days=settings.HISTORY_TOMBSTONE_TTL_DAYS):
+        return {"changed": [], "deleted": [], "cursor": None, "hasMore": False, "fullResync": True}
+
+    db = get_firestore_client()
+    # flat layout: both queries need a composite index (userID, updatedAt / deletedAt)
+    pages = [
+        [(doc.id, decompress_prompt_fields(doc.to_dict()))
+         for doc in _after(query, "updatedAt", since).limit(page_size).stream()]
+        for query in repository.user_queries(db, user_id, project_id)
+    ]
+    tombstones = [
+        (doc.id, doc.to_dict())
+        for doc in _after(db.collection(TOMBSTONE_COLLECTION).where("userID", "==", user_id), "deletedAt", since)
+        .limit(page_size)
+        .stream()
+    ]
+    changed = sorted((data for page in pages for _, data in page),
+                     key=lambda d: _as_utc(d.get("updatedAt")) or since.at)
+
+    # a truncated stream is resumed after its last (timestamp, document ID),
+    # entries of the other streams beyond that are sent again
+    ends = [(_as_utc(page[-1][1].get("updatedAt")), page[-1][0]) for page in pages if len(page) == page_size]
+    if len(tombstones) == page_size:
+        ends.append((_as_utc(tombstones[-1][1].get("deletedAt")), tombstones[-1][0]))
+    if ends:
+        cursor = encode_cursor(*min(ends))
+    else:
+        # everything after `since` was returned
+        stamps = [_as_utc(d.get("updatedAt")) for d in changed] + [_as_utc(t.get("deletedAt")) for _, t in tombstones]
+        cursor = encode_cursor(max([since.at] + [stamp for stamp in stamps if stamp]))
+
+    return {
+        "changed": changed,
+        "deleted": [t.get("promptID") for _, t in tombstones],
+        "cursor": cursor,
+        "hasMore": bool(ends),
+        "fullResync": False,
+    }
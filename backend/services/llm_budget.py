@@ -0,0 +1,148 @@
+"""
+Per-call completion budgets: max_tokens and reasoning effort for parse / optimize.
+
+gpt-oss spends completion tokens on its reasoning trace before the answer, so
+max_tokens = answer budget + a reasoning allowance for the chosen effort.
+Answer budgets follow the input size:
+
+- parse:    input tokens (the JSON quotes the prompt) + key / score overhead
+- optimize: input tokens * LLM_OPTIMIZE_EXPANSION_RATIO, or a strict target
+            ("shorter" than the input, or a token count) that is also put in
+            the system prompt
+
+check() flags results cut off by max_tokens (finish_reason "length") and
+answers over a strict target.
+"""
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException
+
+try:
+    from ..core.config import settings
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+
+REASONING_EFFORTS = ("low", "medium", "high")
+# completion tokens reserved for the reasoning trace, on top of the answer
+REASONING_ALLOWANCE_TOKENS = {"low": 1024, "medium": 4096, "high": 16384}
+PARSE_ANSWER_OVERHEAD_TOKENS = 200
+
+
+class InvalidTarget(HTTPException):
+    def __init__(self, target: str):
+        super().__init__(status_code=400, detail=f"target must be 'shorter' or a positive token count, got {target!r}")
+
+
+class CompletionTruncated(HTTPException):
+    """The model ran out of max_tokens before finishing an answer the caller can't use partially"""
+
+    def __init__(self, step: str, budget: "CompletionBudget"):
+        super().__init__(
+            status_code=502,
+            detail=f"{step}: the model hit its completion budget ({budget.max_tokens} tokens) before finishing",
+        )
+
+
+@dataclass(frozen=True)
+class CompletionBudget:
+    answer_tokens: Optional[int] = None
+    reasoning_effort: Optional[str] = None
+    # strict answer length: asked for in the prompt, flagged when exceeded
+    target_tokens: Optional[int] = None
+
+    @property
+    def max_tokens(self) -> Optional[int]:
+        if self.answer_tokens is None:
+            return None
+        reasoning = REASONING_ALLOWANCE_TOKENS.get(self.reasoning_effort, 0)
+        return min(self.answer_tokens + reasoning, settings.LLM_MAX_COMPLETION_TOKENS)
+
+    def request_kwargs(self) -> dict:
+        """Extra chat.completions.create arguments"""
+        kwargs = {}
+        if self.max_tokens is not None:
+            kwargs["max_tokens"] = self.max_tokens
+        if self.reasoning_effort:
+            kwargs["reasoning_effort"] = self.reasoning_effort
+        return kwargs
+
+    def system_prompt(self, system_prompt: str, reserved_tokens: int = 0) -> str:
+        """
+        System prompt with the length target added.
+
+        Args:
+            reserved_tokens: Part of the target the model doesn't write itself
+                (elided blocks restored into its answer afterwards)
+        """
+        if self.target_tokens is None:
+            return system_prompt
+        limit = max(1, self.target_tokens - reserved_tokens)
+        return f"{system_prompt}\n\nThe optimized prompt must be shorter than {limit} tokens."
+
+    def check(self, finish_reason: Optional[str], answer_tokens: int) -> dict:
+        return {
+            "truncated": finish_reason == "length",
+            "overBudget": self.target_tokens is not None and answer_tokens > self.target_tokens,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "maxTokens": self.max_tokens,
+            "reasoningEffort": self.reasoning_effort,
+            "targetTokens": self.target_tokens,
+        }
+
+
+def _effort(value: str) -> Optional[str]:
+    return value if value in REASONING_EFFORTS else None
+
+
+def parse_target(target: Optional[str], input_tokens: int) -> Optional[int]:
+    """
+    Strict answer length from the `target` request parameter.
+
+    Raises:
+        InvalidTarget: Neither "shorter" nor a positive integer
+    """
+    if target is None or target in ("", "none"):
+        return None
+    if target == "shorter":
+        return max(1, input_tokens - 1)
+    try:
+        tokens = int(target)
+    except ValueError:
+        raise InvalidTarget(target)
+    if tokens < 1:
+        raise InvalidTarget(target)
+    return tokens
+
+
+def parse_budget(input_tokens: int) -> CompletionBudget:
+    if not settings.LLM_BUDGETS_ENABLED:
+        return CompletionBudget()
+    answer = max(settings.LLM_MIN_ANSWER_TOKENS, input_tokens + PARSE_ANSWER_OVERHEAD_TOKENS)
+    return CompletionBudget(answer_tokens=answer, reasoning_effort=_effort(settings.LLM_PARSE_REASONING_EFFORT))
+
+
+def optimize_budget(input_tokens: int, target_tokens: Optional[int] = None, reserved_tokens: int = 0) -> CompletionBudget:
+    """
+    Args:
+        input_tokens: Tokens of the prompt the model sees
+        target_tokens: Strict length of the final optimized prompt, if any
+        reserved_tokens: Part of the final prompt the model doesn't write (restored blocks)
+    """
+    if not settings.LLM_BUDGETS_ENABLED:
+        return CompletionBudget(target_tokens=target_tokens)
+    answer = int(input_tokens * settings.LLM_OPTIMIZE_EXPANSION_RATIO)
+    if target_tokens is not None:
+        # some slack over the target, so an answer just over it is flagged rather than cut off
+        answer = min(answer, int(max(1, target_tokens - reserved_tokens) * 1.25))
+    return CompletionBudget(
+        answer_tokens=max(settings.LLM_MIN_ANSWER_TOKENS, answer),
+        reasoning_effort=_effort(settings.LLM_OPTIMIZE_REASONING_EFFORT),
+        target_tokens=target_tokens,
+    )
@@ -0,0 +1,44 @@
+"""Small in-process metrics registry (counters only, per worker)"""
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+
+
+def increment(name: str, value: float = 1) -> None:
+    """
+    Add value to a named counter.
+    
+    Args:
+        name: Dotted metric name, e.g. "compression.fields"
+        value: Amount to add (default: 1)
+    """
+    with _lock:
+        _counters[name] += value
+
+
+def get_counter(name: str) -> float:
+    """Return the current value of a counter (0 if never incremented)"""
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot(prefix: str = "") -> dict:
+    """
+    Get a copy of all counters, optionally filtered by name prefix.
+    
+    Args:
+        prefix: Only return counters whose name starts with this
+    
+    Returns:
+        Dictionary of metric name -> value
+    """
+    with _lock:
+        return {k: v for k, v in _counters.items() if k.startswith(prefix)}
+
+
+def reset() -> None:
+    """Clear all counters"""
+    with _lock:
+        _counters.clear()
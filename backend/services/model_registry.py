@@ -0,0 +1,132 @@
+"""
+Per-model tokenizer and pricing registry, plus pre-flight cost estimates.
+
+Prices are USD per 1M tokens (Nebius AI Studio list prices at the time of
+writing). MODEL_REGISTRY_JSON can add models or override fields, e.g.
+'{"openai/gpt-oss-20b": {"input_price": 0.06}}'. Models whose tokenizer isn't
+a tiktoken encoding are counted with the closest one and marked approximate.
+"""
+import json
+import sys
+from dataclasses import dataclass, asdict, replace
+from pathlib import Path
+
+try:
+    from ..core.config import settings
+    from .token_counter import count_tokens
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+    from services.token_counter import count_tokens
+
+# chat format overhead: tokens per message plus the reply primer
+TOKENS_PER_MESSAGE = 4
+REPLY_PRIMER_TOKENS = 3
+
+
+@dataclass(frozen=True, slots=True)
+class ModelInfo:
+    encoding: str
+    input_price: float   # USD per 1M prompt tokens
+    output_price: float  # USD per 1M completion tokens
+    reasoning_tokens: int = 0  # expected hidden reasoning tokens per call (billed as output)
+    approximate: bool = False  # tokenizer isn't the model's own
+
+    def cost(self, prompt_tokens: int, completion_tokens: int) -> float:
+        return (prompt_tokens * self.input_price + completion_tokens * self.output_price) / 1_000_000
+
+
+DEFAULT_MODEL = "openai/gpt-oss-20b"
+
+_BUILTIN = {
+    "openai/gpt-oss-20b": ModelInfo("o200k_harmony", 0.05, 0.20, reasoning_tokens=400),
+    "openai/gpt-oss-120b": ModelInfo("o200k_harmony", 0.15, 0.60, reasoning_tokens=400),
+    # Llama 3 uses its own 128k tiktoken-style vocabulary, cl100k_base is the closest shipped encoding
+    "meta-llama/Llama-3.3-70B-Instruct": ModelInfo("cl100k_base", 0.13, 0.40, approximate=True),
+    "meta-llama/Meta-Llama-3.1-8B-Instruct": ModelInfo("cl100k_base", 0.02, 0.06, approximate=True),
+}
+# unknown models: counted with cl100k_base, priced like the default model
+_FALLBACK = ModelInfo("cl100k_base", 0.05, 0.20, approximate=True)
+
+_registry = None
+
+
+def _load() -> dict:
+    global _registry
+    if _registry is None:
+        registry = dict(_BUILTIN)
+        overrides = json.loads(settings.MODEL_REGISTRY_JSON) if settings.MODEL_REGISTRY_JSON else {}
+        for model, fields in overrides.items():
+            registry[model] = replace(registry.get(model, _FALLBACK), **fields)
+        _registry = registry
+    return _registry
+
+
+def get_model(model: str) -> ModelInfo:
+    return _load().get(model, _FALLBACK)
+
+
+def known_models() -> dict:
+    """Model name -> registry fields (for the model picker)"""
+    return {model: asdict(info) for model, info in _load().items()}
+
+
+def encoding_for(model: str) -> str:
+    return get_model(model).encoding
+
+
+def model_encodings() -> tuple:
+    """Distinct encodings of the registered models (what warmup should load)"""
+    return tuple(dict.fromkeys(info.encoding for info in _load().values()))
+
+
+def count_model_tokens(text: str, model: str) -> int:
+    return count_tokens(text, encoding_for(model))
+
+
+def estimate_call(
+    model: str,
+    system_prompt: str,
+    user_prompt: str,
+    expected_completion_tokens: int,
+    calls: int = 1,
+) -> dict:
+    """
+    Predict tokens and cost of chat completion calls before making them.
+
+    Args:
+        model: Model name
+        system_prompt: System message text
+        user_prompt: User message text (total over all calls)
+        expected_completion_tokens: Visible output tokens expected (total over all calls)
+        calls: Number of calls (e.g. parse chunks); each repeats the system prompt
+
+    Returns:
+        {"model", "promptTokens", "completionTokens", "costUsd", "approximate"}
+    """
+    info = get_model(model)
+    prompt_tokens = (
+        calls * (count_tokens(system_prompt, info.encoding) + 2 * TOKENS_PER_MESSAGE + REPLY_PRIMER_TOKENS)
+        + count_tokens(user_prompt, info.encoding)
+    )
+    completion_tokens = expected_completion_tokens + calls * info.reasoning_tokens
+    return {
+        "model": model,
+        "promptTokens": prompt_tokens,
+        "completionTokens": completion_tokens,
+        "costUsd": info.cost(prompt_tokens, completion_tokens),
+        "approximate": info.approximate,
+    }
+
+
+def combine_estimates(steps: dict) -> dict:
+    """Sum named estimate_call results into one estimate (steps kept for detail)"""
+    return {
+        "promptTokens": sum(step["promptTokens"] for step in steps.values()),
+        "completionTokens": sum(step["completionTokens"] for step in steps.values()),
+        "totalTokens": sum(step["promptTokens"] + step["completionTokens"] for step in steps.values()),
+        "costUsd": sum(step["costUsd"] for step in steps.values()),
+        "approximate": any(step["approximate"] for step in steps.values()),
+        "steps": steps,
+    }
+
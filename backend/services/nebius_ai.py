@@ -1,15 +1,126 @@
-from openai import OpenAI
-import json
-from core.config import settings
-import json
-
-client = OpenAI(
-    base_url="https://api.studio.nebius.ai/v1",
-    api_key=settings.NEBIUS_API_KEY,
-)
-
-def test_nebius_api(prompt :str, ai_model: str = "openai/gpt-oss-20b") -> str: 
-    response = client.chat.completions.create(
+import sys
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from time import perf_counter
+from typing import Optional
+
+from fastapi import HTTPException
+
+try:
+    from ..core.config import settings
+    from .deadline import current_scope
+    from .quota import record_llm_usage
+    from .profiling import span
+    from .admission import controller as admission
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+    from services.deadline import current_scope
+    from services.quota import record_llm_usage
+    from services.profiling import span
+    from services.admission import controller as admission
+
+_client = None
+
+
+def get_nebius_client():
+    """OpenAI-compatible Nebius client, created (and openai imported) on first use"""
+    global _client
+    if _client is None and settings.LLM_BACKEND == "fake":
+        # canned completions with simulated latency, see services/fakes.py
+        from .fakes import FakeLLMClient
+        _client = FakeLLMClient()
+    if _client is None:
+        import httpx
+        from openai import OpenAI, DefaultHttpxClient
+
+        _client = OpenAI(
+            base_url="https://api.studio.nebius.ai/v1",
+            api_key=settings.NEBIUS_API_KEY,
+            # idle connections stay pooled longer than the keepalive interval (httpx default: 5 s)
+            http_client=DefaultHttpxClient(limits=httpx.Limits(
+                max_connections=1000,
+                max_keepalive_connections=100,
+                keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY_S,
+            )),
+        )
+    return _client
+
+
+def _usage_dict(usage) -> dict:
+    if not usage:
+        return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "reasoning_tokens": 0}
+    details = getattr(usage, "completion_tokens_details", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+        # part of completion_tokens spent on the reasoning trace
+        "reasoning_tokens": (getattr(details, "reasoning_tokens", None) or 0) if details else 0,
+    }
+
+
+@dataclass(slots=True)
+class LLMResult:
+    """Completion fields the app actually uses, read straight from the SDK object"""
+    content: Optional[str]
+    model: str
+    latency_ms: float
+    usage: dict = field(default_factory=dict)
+    finish_reason: Optional[str] = None
+    reasoning_content: Optional[str] = None
+
+    @classmethod
+    def from_completion(cls, response, latency_ms: float) -> "LLMResult":
+        choice = response.choices[0]
+        return cls(
+            content=choice.message.content,
+            model=response.model,
+            latency_ms=latency_ms,
+            usage=_usage_dict(response.usage),
+            finish_reason=choice.finish_reason,
+            # nebius returns the gpt-oss reasoning trace as an extra message field
+            reasoning_content=getattr(choice.message, "reasoning_content", None),
+        )
+
+    @classmethod
+    def from_stream(cls, stream, scope, start_time: float) -> "LLMResult":
+        """
+        Assemble a streamed completion, checking the request scope between chunks.
+        Closing the stream on cancel drops the upstream connection, which stops generation.
+        """
+        content = []
+        reasoning = []
+        result = cls(content=None, model="", latency_ms=0.0)
+        try:
+            for chunk in stream:
+                scope.check()
+                result.model = chunk.model or result.model
+                if chunk.usage:
+                    result.usage = _usage_dict(chunk.usage)
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.delta.content:
+                    content.append(choice.delta.content)
+                if getattr(choice.delta, "reasoning_content", None):
+                    reasoning.append(choice.delta.reasoning_content)
+                result.finish_reason = choice.finish_reason or result.finish_reason
+        finally:
+            stream.close()
+
+        result.content = "".join(content)
+        result.reasoning_content = "".join(reasoning) or None
+        result.latency_ms = (perf_counter() - start_time) * 1000
+        return result
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def test_nebius_api(prompt :str, ai_model: str = "openai/gpt-oss-20b") -> LLMResult: 
+    start_time = perf_counter()
+    response = get_nebius_client().chat.completions.create(
         model= ai_model,
         messages=[
             {
@@ -19,21 +130,70 @@ def test_nebius_api(prompt :str, ai_model: str = "openai/gpt-oss-20b") -> str:
         ]
     )
 
-    return json.loads(response.to_json())
+    return LLMResult.from_completion(response, (perf_counter() - start_time) * 1000)
+
+def run_nebius_ai(prompt: str, system_prompt: str, ai_model: str = "openai/gpt-oss-20b",
+                  max_tokens: Optional[int] = None, reasoning_effort: Optional[str] = None) -> LLMResult:
+    """
+    Run one chat completion.
+
+    Args:
+        max_tokens: Completion limit including reasoning tokens (None: model default)
+        reasoning_effort: "low" | "medium" | "high" for reasoning models (None: model default)
+    """
+    start_time = perf_counter()
+    options = {}
+    if max_tokens is not None:
+        options["max_tokens"] = max_tokens
+    if reasoning_effort:
+        options["reasoning_effort"] = reasoning_effort
+    with span(f"llm {ai_model}"):
+        try:
+            result = _run_nebius_ai(prompt, system_prompt, ai_model, options)
+        except HTTPException:
+            # our own deadline / cancellation, says nothing about upstream health
+            raise
+        except Exception:
+            admission.observe((perf_counter() - start_time) * 1000, ok=False)
+            raise
+    # feeds the adaptive concurrency limit
+    admission.observe(result.latency_ms, ok=True)
+    return result
+
+
+def _run_nebius_ai(prompt: str, system_prompt: str, ai_model: str = "openai/gpt-oss-20b",
+                   options: Optional[dict] = None) -> LLMResult:
+    options = options or {}
+    messages = [
+        {
+            "role" : "system",
+            "content" : system_prompt
+        },
+        {
+            "role" : "user",
+            "content" : f"Given prompt:{prompt}"
+        },
+    ]
+    start_time = perf_counter()
+    scope = current_scope()
+    if scope is None:
+        response = get_nebius_client().chat.completions.create(model= ai_model, messages=messages, **options)
+        result = LLMResult.from_completion(response, (perf_counter() - start_time) * 1000)
+        # charge the tokens to the request's quota account, if any
+        record_llm_usage(result.usage)
+        return result
 
-def run_nebius_ai(prompt: str, system_prompt: str, ai_model: str = "openai/gpt-oss-20b") -> str:
-    response = client.chat.completions.create(
+    # inside a request with a deadline: abort early if the budget can't cover the call,
+    # and stream so a client disconnect can close the upstream request mid-generation
+    scope.check(settings.LLM_EXPECTED_LATENCY_MS)
+    stream = get_nebius_client().chat.completions.create(
         model= ai_model,
-        messages=[
-            {
-                "role" : "system",
-                "content" : system_prompt
-            },
-            {
-                "role" : "user",
-                "content" : f"Given prompt:{prompt}"
-            },
-        ]
+        messages=messages,
+        stream=True,
+        stream_options={"include_usage": True},
+        timeout=scope.remaining_seconds(),
+        **options,
     )
-
-    return json.loads(response.to_json())
+    result = LLMResult.from_stream(stream, scope, start_time)
+    record_llm_usage(result.usage)
+    return result
@@ -0,0 +1,288 @@
+"""
+On-demand request profiling.
+
+A request is profiled when it carries `X-Profile: <PROFILING_ADMIN_TOKEN>` or is
+picked by PROFILING_SAMPLE_RATE. Profiled requests record a span tree (LLM calls,
+Firestore / journal calls, token counting, validation, serialization), optionally
+a statistical stack sampler, and are written as speedscope files
+(https://www.speedscope.app) to PROFILING_DIR. Unprofiled requests only pay for
+one context variable lookup per instrumented call.
+"""
+import functools
+import hmac
+import random
+import sys
+import threading
+import time
+import traceback
+import uuid
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Optional
+
+import orjson
+
+try:
+    from ..core.config import settings
+    from .metrics import increment
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+    from services.metrics import increment
+
+PROFILE_HEADER = "x-profile"
+SAMPLER_HEADER = "x-profile-sampler"
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+
+class Span:
+    __slots__ = ("name", "start", "end", "thread", "parent", "children")
+
+    def __init__(self, name: str, parent: Optional["Span"]):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.thread = threading.get_ident()
+        self.parent = parent
+        self.children = []
+
+    def to_dict(self, origin: float) -> dict:
+        return {
+            "name": self.name,
+            "startMs": (self.start - origin) * 1000,
+            "durationMs": ((self.end or time.perf_counter()) - self.start) * 1000,
+            "children": [child.to_dict(origin) for child in self.children],
+        }
+
+
+class Profile:
+    def __init__(self, name: str, sampler: bool = False):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.root = Span(name, None)
+        self.lock = threading.Lock()
+        self.threads = {self.root.thread}
+        self.samples = []  # (thread id, stack tuple, timestamp)
+        self._sampler = _Sampler(self) if sampler else None
+
+    def start(self) -> None:
+        if self._sampler is not None:
+            self._sampler.start()
+
+    def finish(self) -> None:
+        self.root.end = time.perf_counter()
+        if self._sampler is not None:
+            self._sampler.stop()
+
+    def open(self, name: str, parent: Span) -> Span:
+        span = Span(name, parent)
+        with self.lock:
+            parent.children.append(span)
+            self.threads.add(span.thread)
+        return span
+
+    def to_speedscope(self) -> dict:
+        """Evented profile per thread from the spans, plus a sampled profile per thread if sampling"""
+        frames, index = [], {}
+
+        def frame(name: str) -> int:
+            if name not in index:
+                index[name] = len(frames)
+                frames.append({"name": name})
+            return index[name]
+
+        origin = self.root.start
+        end = ((self.root.end or time.perf_counter()) - origin) * 1000
+        events_by_thread = {}
+
+        def walk(span: Span) -> None:
+            events = events_by_thread.setdefault(span.thread, [])
+            events.append({"type": "O", "frame": frame(span.name), "at": (span.start - origin) * 1000})
+            for child in sorted(span.children, key=lambda s: s.start):
+                walk(child)
+            close = min(((span.end or self.root.end or time.perf_counter()) - origin) * 1000, end)
+            events_by_thread.setdefault(span.thread, []).append({"type": "C", "frame": frame(span.name), "at": close})
+
+        walk(self.root)
+        profiles = []
+        for thread, events in events_by_thread.items():
+            # spans opened in another thread show up as roots of that thread's timeline
+            events.sort(key=lambda e: (e["at"], e["type"] == "O"))
+            profiles.append({
+                "type": "evented",
+                "name": f"{self.name} spans (thread {thread})",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": end,
+                "events": events,
+            })
+
+        by_thread = {}
+        for thread, stack, _ in self.samples:
+            by_thread.setdefault(thread, []).append([frame(name) for name in stack])
+        interval = settings.PROFILING_SAMPLER_INTERVAL_MS
+        for thread, samples in by_thread.items():
+            profiles.append({
+                "type": "sampled",
+                "name": f"{self.name} samples (thread {thread})",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": len(samples) * interval,
+                "samples": samples,
+                "weights": [interval] * len(samples),
+            })
+
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": self.name,
+            "exporter": "prompt-refiner profiling",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+            "spans": self.root.to_dict(origin),
+        }
+
+    def write(self) -> Path:
+        directory = Path(settings.PROFILING_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{time.strftime('%Y%m%dT%H%M%S')}-{self.id}.speedscope.json"
+        path.write_bytes(orjson.dumps(self.to_speedscope()))
+        return path
+
+
+class _Sampler(threading.Thread):
+    """Samples the stacks of the threads the profile has seen every PROFILING_SAMPLER_INTERVAL_MS"""
+
+    def __init__(self, profile: Profile):
+        super().__init__(name=f"profile-sampler-{profile.id}", daemon=True)
+        self.profile = profile
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        interval = settings.PROFILING_SAMPLER_INTERVAL_MS / 1000
+        while not self._stop_event.wait(interval):
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            with self.profile.lock:
+                threads = list(self.profile.threads)
+            for thread in threads:
+                top = frames.get(thread)
+                if top is None:
+                    continue
+                stack = tuple(
+                    f"{entry.name} ({Path(entry.filename).name}:{entry.lineno})"
+                    for entry in traceback.extract_stack(top)
+                )
+                self.profile.samples.append((thread, stack, now))
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join(timeout=1)
+
+
+_current_profile: ContextVar[Optional[Profile]] = ContextVar("profile", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("profile_span", default=None)
+
+
+class _SpanContext:
+    __slots__ = ("profile", "name", "span", "token")
+
+    def __init__(self, profile: Profile, name: str):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        parent = _current_span.get() or self.profile.root
+        self.span = self.profile.open(self.name, parent)
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, *exc):
+        self.span.end = time.perf_counter()
+        _current_span.reset(self.token)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str):
+    """Context manager timing a stage of the current profiled request (no-op otherwise)"""
+    profile = _current_profile.get()
+    if profile is None:
+        return _NO_SPAN
+    return _SpanContext(profile, name)
+
+
+def profiled(name: str) -> Callable:
+    """Decorator form of span()"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = _current_profile.get()
+            if profile is None:
+                return func(*args, **kwargs)
+            with _SpanContext(profile, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _should_profile(headers: dict) -> tuple[bool, bool]:
+    token = headers.get(PROFILE_HEADER.encode())
+    # constant-time, so response timing doesn't leak how much of a guessed token matched
+    forced = (bool(settings.PROFILING_ADMIN_TOKEN) and token is not None
+              and hmac.compare_digest(token, settings.PROFILING_ADMIN_TOKEN.encode()))
+    if not forced and not (settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE):
+        return False, False
+    sampler = settings.PROFILING_SAMPLER or (forced and headers.get(SAMPLER_HEADER.encode()) == b"1")
+    return True, sampler
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles selected requests and adds `X-Profile-Id` to their
+    response. The speedscope file is written after the response has been sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (settings.PROFILING_ADMIN_TOKEN or settings.PROFILING_SAMPLE_RATE):
+            return await self.app(scope, receive, send)
+
+        enabled, sampler = _should_profile(dict(scope["headers"]))
+        if not enabled:
+            return await self.app(scope, receive, send)
+
+        profile = Profile(f"{scope['method']} {scope['path']}", sampler=sampler)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        profile_token = _current_profile.set(profile)
+        span_token = _current_span.set(profile.root)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.finish()
+            _current_span.reset(span_token)
+            _current_profile.reset(profile_token)
+            try:
+                profile.write()
+                increment("profiling.written")
+            except OSError:
+                increment("profiling.write_errors")
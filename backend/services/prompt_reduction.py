@@ -0,0 +1,274 @@
+"""
+Deterministic local clean-up of a prompt before it is sent to the model.
+
+Levels (PROMPT_REDUCTION_LEVEL):
+- "off":        the prompt is sent as is
+- "light":      whitespace only (trailing spaces, runs of spaces, blank line runs);
+                code blocks keep their indentation
+- "standard":   + duplicate / near-identical sentences are dropped and literal
+                blocks (fenced code, log runs) over PROMPT_REDUCTION_BLOCK_TOKENS
+                are replaced with {{BLOCK_n: ...}} placeholders
+- "aggressive": as standard with a lower near-duplicate threshold and a quarter
+                of the block size limit
+
+Placeholders are put back into the model's output with restore_blocks(), so an
+optimized prompt still contains the user's code and logs verbatim.
+"""
+import re
+import sys
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+try:
+    from ..core.config import settings
+    from .token_counter import count_tokens, DEFAULT_ENCODING
+    from .metrics import increment
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+    from services.token_counter import count_tokens, DEFAULT_ENCODING
+    from services.metrics import increment
+
+LEVELS = ("off", "light", "standard", "aggressive")
+# word-set Jaccard similarity from which two sentences count as the same
+NEAR_DUPLICATE_SIMILARITY = {"standard": 0.9, "aggressive": 0.75}
+# shorter sentences ("Yes.", list items) are never dropped
+MIN_DEDUPE_WORDS = 5
+# near-duplicates are looked for among this many previously kept sentences
+DEDUPE_WINDOW = 500
+MIN_LOG_LINES = 8
+
+PLACEHOLDER_INSTRUCTION = (
+    "Markers like {{BLOCK_1: ...}} stand for code or log blocks left out of this prompt. "
+    "Keep every marker unchanged, exactly once, where the block belongs."
+)
+
+_FENCE = re.compile(r"^(```|~~~)[^\n]*\n.*?^\1[ \t]*$", re.MULTILINE | re.DOTALL)
+_PLACEHOLDER = re.compile(r"\{\{BLOCK_(\d+)(?::[^}]*)?\}\}")
+_LOG_LINE = re.compile(
+    r"^\s*("
+    r"\[?\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}"          # 2024-05-01 12:00 / [2024-05-01T12:00
+    r"|\d{2}:\d{2}:\d{2}"                            # 12:00:01
+    r"|(DEBUG|INFO|WARN|WARNING|ERROR|FATAL|TRACE)\b"
+    r"|at [\w$.<>]+\(.*\)$"                          # java / js stack frames
+    r'|File ".*", line \d+'                          # python tracebacks
+    r"|Traceback \(most recent call last\)"
+    r")"
+)
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+_WORDS = re.compile(r"\w+")
+_SPACES = re.compile(r"[ \t\u00a0]+")
+
+
+@dataclass(frozen=True)
+class ReducedPrompt:
+    """A prompt after reduction, with what is needed to undo placeholders"""
+    text: str
+    level: str
+    blocks: tuple[str, ...] = ()
+    original_tokens: int = 0
+    reduced_tokens: int = 0
+    dropped_sentences: int = 0
+    # tokens of the elided blocks, which restore() adds back to the model's answer
+    block_tokens: int = 0
+
+    @property
+    def tokens_removed(self) -> int:
+        return max(0, self.original_tokens - self.reduced_tokens)
+
+    def stats(self) -> dict:
+        return {
+            "level": self.level,
+            "originalTokens": self.original_tokens,
+            "reducedTokens": self.reduced_tokens,
+            "tokensRemoved": self.tokens_removed,
+            "droppedSentences": self.dropped_sentences,
+            "elidedBlocks": len(self.blocks),
+        }
+
+    def system_prompt(self, system_prompt: str) -> str:
+        """System prompt with the placeholder instruction added when blocks were elided"""
+        return f"{system_prompt}\n\n{PLACEHOLDER_INSTRUCTION}" if self.blocks else system_prompt
+
+    def restore(self, text: Optional[str], append_missing: bool = True) -> Optional[str]:
+        return restore_blocks(text, self.blocks, append_missing)
+
+
+def restore_blocks(text: Optional[str], blocks: tuple[str, ...], append_missing: bool = True) -> Optional[str]:
+    """
+    Put elided blocks back in place of their placeholders.
+    Blocks whose placeholder the model dropped are appended, so nothing is lost,
+    unless append_missing is False (text that only quotes part of the prompt).
+    """
+    if not blocks or text is None:
+        return text
+    used = set()
+
+    def replace(match):
+        index = int(match.group(1)) - 1
+        if not 0 <= index < len(blocks):
+            return match.group(0)
+        if index in used:
+            # the model repeated a marker: the block is restored once
+            return ""
+        used.add(index)
+        return blocks[index]
+
+    restored = _PLACEHOLDER.sub(replace, text)
+    missing = [block for index, block in enumerate(blocks) if index not in used]
+    if missing and append_missing:
+        increment("reduction.blocks_appended", len(missing))
+        restored = "\n\n".join([restored.rstrip()] + missing)
+    return restored
+
+
+def _collapse_whitespace(prose: str) -> str:
+    lines = []
+    for line in prose.split("\n"):
+        stripped = line.rstrip()
+        indent = stripped[:len(stripped) - len(stripped.lstrip())]
+        lines.append(indent + _SPACES.sub(" ", stripped.lstrip()))
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+
+def _fence_label(block: str) -> str:
+    language = block.split("\n", 1)[0].lstrip("`~").strip()
+    return f"{language} code" if language else "code"
+
+
+class _Deduplicator:
+    def __init__(self, similarity: float):
+        self.similarity = similarity
+        self.seen = set()
+        self.recent = []
+        self.dropped = 0
+
+    def keep(self, sentence: str) -> bool:
+        if _PLACEHOLDER.fullmatch(sentence):
+            return True
+        words = _WORDS.findall(sentence.lower())
+        if len(words) < MIN_DEDUPE_WORDS:
+            return True
+        key = " ".join(words)
+        if key in self.seen:
+            self.dropped += 1
+            return False
+        word_set = frozenset(words)
+        if self.similarity < 1:
+            for other in self.recent:
+                # Jaccard can't reach the threshold when the sizes are too different
+                if min(len(word_set), len(other)) < self.similarity * max(len(word_set), len(other)):
+                    continue
+                if len(word_set & other) >= self.similarity * len(word_set | other):
+                    self.dropped += 1
+                    return False
+        self.seen.add(key)
+        self.recent.append(word_set)
+        if len(self.recent) > DEDUPE_WINDOW:
+            self.recent.pop(0)
+        return True
+
+    def prose(self, prose: str) -> str:
+        lines = []
+        for line in prose.split("\n"):
+            if not line.strip():
+                lines.append(line)
+                continue
+            indent = line[:len(line) - len(line.lstrip())]
+            kept = [s for s in _SENTENCE_SPLIT.split(line.strip()) if self.keep(s)]
+            if kept:
+                lines.append(indent + " ".join(kept))
+        return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+
+def _split_log_runs(prose: str, max_tokens: int, elide) -> str:
+    """Replace runs of at least MIN_LOG_LINES log-looking lines over max_tokens with placeholders"""
+    lines = prose.split("\n")
+    out = []
+    run = []
+
+    def flush():
+        block = "\n".join(run)
+        if len(run) >= MIN_LOG_LINES and count_tokens(block) > max_tokens:
+            out.append(elide(block, f"log, {len(run)} lines"))
+        else:
+            out.extend(run)
+        run.clear()
+
+    for line in lines:
+        # continuation lines of a stack trace are indented
+        if _LOG_LINE.match(line) or (run and line.startswith((" ", "\t")) and line.strip()):
+            run.append(line)
+            continue
+        if run:
+            flush()
+        out.append(line)
+    if run:
+        flush()
+    return "\n".join(out)
+
+
+@lru_cache(maxsize=256)
+def reduce_prompt(text: str, level: Optional[str] = None, encoding: Optional[str] = None) -> ReducedPrompt:
+    """
+    Reduce a prompt for sending to the model (see module docstring for the levels).
+
+    Args:
+        text: The user's prompt
+        level: Reduction level (default: PROMPT_REDUCTION_LEVEL)
+        encoding: tiktoken encoding the token savings are measured with
+
+    Returns:
+        ReducedPrompt; `text` is what the model should see
+    """
+    level = level or settings.PROMPT_REDUCTION_LEVEL
+    if level not in LEVELS:
+        raise ValueError(f"unknown prompt reduction level {level!r}, expected one of {LEVELS}")
+    encoding = encoding or DEFAULT_ENCODING
+    original_tokens = count_tokens(text, encoding)
+    if level == "off" or not text:
+        return ReducedPrompt(text=text, level=level, original_tokens=original_tokens, reduced_tokens=original_tokens)
+
+    block_tokens = settings.PROMPT_REDUCTION_BLOCK_TOKENS // (4 if level == "aggressive" else 1)
+    blocks = []
+    deduplicator = _Deduplicator(NEAR_DUPLICATE_SIMILARITY.get(level, 1))
+
+    def elide(block: str, label: str) -> str:
+        blocks.append(block)
+        return f"{{{{BLOCK_{len(blocks)}: {label}}}}}"
+
+    def prose(segment: str) -> str:
+        segment = _collapse_whitespace(segment)
+        if level == "light":
+            return segment
+        segment = _split_log_runs(segment, block_tokens, elide)
+        return deduplicator.prose(segment)
+
+    # fenced blocks are literal: never re-spaced or deduplicated, only elided when large
+    parts = []
+    position = 0
+    for match in _FENCE.finditer(text):
+        parts.append(prose(text[position:match.start()]))
+        fence = match.group(0)
+        if level != "light" and count_tokens(fence) > block_tokens:
+            lines = fence.count("\n") - 1
+            parts.append(elide(fence, f"{_fence_label(fence)}, {lines} lines"))
+        else:
+            parts.append(fence)
+        position = match.end()
+    parts.append(prose(text[position:]))
+
+    reduced = "".join(parts).strip()
+    reduced_tokens = count_tokens(reduced, encoding)
+    result = ReducedPrompt(
+        text=reduced,
+        level=level,
+        blocks=tuple(blocks),
+        original_tokens=original_tokens,
+        reduced_tokens=reduced_tokens,
+        dropped_sentences=deduplicator.dropped,
+        block_tokens=sum(count_tokens(block, encoding) for block in blocks),
+    )
+    return result
@@ -0,0 +1,247 @@
+"""
+Where prompt documents live, behind one interface.
+
+Two layouts (PROMPT_LAYOUT):
+
+- "flat":   prompts/{promptID}, user history = prompts where userID == uid
+- "nested": users/{uid}/projects/{pid}/prompts/{promptID}; queries are scoped
+            to one user's project, so their cost doesn't grow with other tenants
+
+Nested needs the owner to build a document path. Routes that only get a
+prompt ID resolve it through prompt_locations/{promptID} ({userID, projectID},
+written with the prompt and cached per process; locations never change).
+users/{uid}/projects/{pid} marker documents list a user's projects for
+user-wide queries.
+
+During cutover PROMPT_DUAL_WRITE writes both layouts; reads use PROMPT_LAYOUT
+only. tools/migrate_prompt_layout.py copies and verifies existing documents.
+"""
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException
+
+try:
+    from ..core.config import settings
+    from .write_journal import overlay, pending_paths
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+    from services.write_journal import overlay, pending_paths
+
+FLAT_COLLECTION = "prompts"
+LOCATION_COLLECTION = "prompt_locations"
+DEFAULT_PROJECT = "default-project"
+LAYOUTS = ("flat", "nested")
+LOCATION_CACHE_SIZE = 10000
+
+
+class PromptNotFound(HTTPException):
+    def __init__(self, prompt_id: str):
+        super().__init__(status_code=404, detail=f"Prompt {prompt_id} not found")
+
+
+def nested_collection(db, user_id: str, project_id: str):
+    return db.collection("users").document(user_id).collection("projects").document(project_id).collection("prompts")
+
+
+def project_marker(db, user_id: str, project_id: str):
+    return db.collection("users").document(user_id).collection("projects").document(project_id)
+
+
+def _nest(fields: dict) -> dict:
+    """Update fields with dotted paths ("ratings.user") as the nested maps set() expects"""
+    nested = {}
+    for path, value in fields.items():
+        *parents, key = path.split(".")
+        target = nested
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[key] = value
+    return nested
+
+
+class PromptRepository:
+    def __init__(self, layout: Optional[str] = None, dual_write: Optional[bool] = None):
+        # None: follow settings (read on every call, so tests / tools can switch them)
+        self._layout = layout
+        self._dual_write = dual_write
+        self._locations = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def layout(self) -> str:
+        return self._layout or settings.PROMPT_LAYOUT
+
+    @property
+    def dual_write(self) -> bool:
+        return settings.PROMPT_DUAL_WRITE if self._dual_write is None else self._dual_write
+
+    def write_layouts(self) -> list[str]:
+        """Layouts every write goes to, the read layout first"""
+        if not self.dual_write:
+            return [self.layout]
+        return [self.layout] + [layout for layout in LAYOUTS if layout != self.layout]
+
+    # --- locating ---
+
+    def _remember(self, prompt_id: str, location: tuple[str, str]) -> None:
+        with self._lock:
+            self._locations[prompt_id] = location
+            self._locations.move_to_end(prompt_id)
+            while len(self._locations) > LOCATION_CACHE_SIZE:
+                self._locations.popitem(last=False)
+
+    def _forget(self, prompt_id: str) -> None:
+        with self._lock:
+            self._locations.pop(prompt_id, None)
+
+    def locate(self, db, prompt_id: str) -> Optional[tuple[str, str]]:
+        """(userID, projectID) of a prompt from its location document, None if unknown"""
+        with self._lock:
+            location = self._locations.get(prompt_id)
+        if location is not None:
+            return location
+        ref = db.collection(LOCATION_COLLECTION).document(prompt_id)
+        doc = ref.get()
+        data = overlay(ref.path, doc.to_dict() if doc.exists else None)
+        if not data or not data.get("userID"):
+            return None
+        location = (data["userID"], data.get("projectID") or DEFAULT_PROJECT)
+        self._remember(prompt_id, location)
+        return location
+
+    def _reference(self, db, layout: str, prompt_id: str, user_id: Optional[str], project_id: Optional[str]):
+        if layout == "flat":
+            return db.collection(FLAT_COLLECTION).document(prompt_id)
+        if not user_id:
+            location = self.locate(db, prompt_id)
+            if location is None:
+                return None
+            user_id, project_id = location
+        return nested_collection(db, user_id, project_id or DEFAULT_PROJECT).document(prompt_id)
+
+    def reference(self, db, prompt_id: str, user_id: Optional[str] = None, project_id: Optional[str] = None):
+        """Document reference in the read layout, None if a nested prompt can't be located"""
+        return self._reference(db, self.layout, prompt_id, user_id, project_id)
+
+    def get(self, db, prompt_id: str, user_id: Optional[str] = None, project_id: Optional[str] = None,
+            **call_kwargs) -> Optional[dict]:
+        """Raw stored document (journaled writes applied), None if missing"""
+        ref = self.reference(db, prompt_id, user_id, project_id)
+        if ref is None:
+            return None
+        doc = ref.get(**call_kwargs)
+        # include acknowledged writes that are still waiting in the journal
+        return overlay(ref.path, doc.to_dict() if doc.exists else None)
+
+    def get_many(self, db, prompt_ids: list[str]) -> dict[str, dict]:
+        """Raw stored documents of several prompts in one round trip; missing ones are left out"""
+        refs = {}
+        for prompt_id in prompt_ids:
+            ref = self.reference(db, prompt_id)
+            if ref is not None:
+                refs[ref.path] = (prompt_id, ref)
+        if not refs:
+            return {}
+        documents = {}
+        for doc in db.get_all([ref for _, ref in refs.values()]):
+            prompt_id, ref = refs[doc.reference.path]
+            data = overlay(ref.path, doc.to_dict() if doc.exists else None)
+            if data is not None:
+                documents[prompt_id] = data
+        return documents
+
+    # --- writes (added to the caller's batch) ---
+
+    def set(self, db, batch, data: dict) -> None:
+        """Write a whole prompt document; data must carry promptID, userID and projectID"""
+        from firebase_admin import firestore
+
+        prompt_id = data["promptID"]
+        user_id = data.get("userID") or ""
+        project_id = data.get("projectID") or DEFAULT_PROJECT
+        for layout in self.write_layouts():
+            batch.set(self._reference(db, layout, prompt_id, user_id, project_id), data)
+            if layout == "nested":
+                batch.set(db.collection(LOCATION_COLLECTION).document(prompt_id),
+                          {"userID": user_id, "projectID": project_id})
+                batch.set(project_marker(db, user_id, project_id),
+                          {"projectID": project_id, "updatedAt": firestore.SERVER_TIMESTAMP}, merge=True)
+                self._remember(prompt_id, (user_id, project_id))
+
+    def update(self, db, batch, prompt_id: str, fields: dict,
+               user_id: Optional[str] = None, project_id: Optional[str] = None) -> None:
+        """
+        Replace fields of an existing prompt (top-level names or dotted field paths).
+
+        Raises:
+            PromptNotFound: Nested layout and the prompt can't be located
+        """
+        primary, *secondaries = self.write_layouts()
+        ref = self._reference(db, primary, prompt_id, user_id, project_id)
+        if ref is None:
+            raise PromptNotFound(prompt_id)
+        batch.update(ref, fields)
+        for layout in secondaries:
+            # nested copies exist once they have a location (copied or created since
+            # dual-write started); the migration brings the rest up to date
+            ref = self._reference(db, layout, prompt_id, None, None)
+            if ref is not None:
+                # set with field paths: the same fields replaced, without failing the batch if missing
+                batch.set(ref, _nest(fields), merge=list(fields))
+
+    def delete(self, db, batch, prompt_id: str, user_id: Optional[str] = None, project_id: Optional[str] = None) -> None:
+        for layout in self.write_layouts():
+            ref = self._reference(db, layout, prompt_id, user_id, project_id)
+            if ref is not None:
+                batch.delete(ref)
+            if layout == "nested":
+                batch.delete(db.collection(LOCATION_COLLECTION).document(prompt_id))
+        self._forget(prompt_id)
+
+    # --- queries ---
+
+    def projects(self, db, user_id: str) -> list[str]:
+        """Project IDs a user has prompts in (nested layout)"""
+        markers = db.collection("users").document(user_id).collection("projects").stream()
+        return [doc.id for doc in markers] or [DEFAULT_PROJECT]
+
+    def user_queries(self, db, user_id: str, project_id: Optional[str] = None) -> list:
+        """
+        Queries that together cover a user's prompts (optionally one project).
+        Callers add their own filters / ordering / limits to each.
+        """
+        if self.layout == "flat":
+            query = db.collection(FLAT_COLLECTION).where("userID", "==", user_id)
+            if project_id:
+                query = query.where("projectID", "==", project_id)
+            return [query]
+        project_ids = [project_id] if project_id else self.projects(db, user_id)
+        return [nested_collection(db, user_id, pid) for pid in project_ids]
+
+    def journaled(self, user_id: str, project_id: Optional[str] = None) -> list[str]:
+        """
+        Paths of prompt documents with journaled writes not replayed yet that may
+        belong to the user (flat layout: every user's, filter on the overlaid data)
+        """
+        if self.layout == "flat":
+            return [path for path in pending_paths(f"{FLAT_COLLECTION}/") if path.count("/") == 1]
+        prefix = f"users/{user_id}/projects/" + (f"{project_id}/prompts/" if project_id else "")
+        return [path for path in pending_paths(prefix)
+                if path.count("/") == 5 and path.split("/")[4] == "prompts"]
+
+    def all_prompts(self, db):
+        """
+        Every prompt document, for admin scans. Nested: a collection group query,
+        which also matches the flat `prompts` collection until that is deleted.
+        """
+        if self.layout == "flat":
+            return db.collection(FLAT_COLLECTION)
+        return db.collection_group("prompts")
+
+
+repository = PromptRepository()
@@ -0,0 +1,313 @@
+"""
+Per-user and per-project quotas on requests and LLM tokens.
+
+Usage is counted in in-memory sliding windows (QUOTA_WINDOW_S split into
+QUOTA_WINDOW_BUCKETS buckets), so admission checks never wait on Firestore.
+A background syncer periodically adds each worker's unsynced counts to
+`quotas/{scope}:{id}` (projects: `project:{user}:{project}`) with Increment and reads back the totals of all
+workers; between syncs a worker only sees the other workers' usage as of
+the last sync.
+"""
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException
+
+try:
+    from ..core.config import settings
+    from .metrics import increment
+    from .firebase_db import get_firestore_client
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+    from services.metrics import increment
+    from services.firebase_db import get_firestore_client
+
+QUOTA_COLLECTION = "quotas"
+METRICS = ("requests", "tokens")
+
+
+class QuotaExceeded(HTTPException):
+    def __init__(self, scope: str, metric: str, limit: int, retry_after_s: int, headers: dict):
+        super().__init__(
+            status_code=429,
+            detail=f"{scope.capitalize()} {metric} quota exceeded ({limit} per {settings.QUOTA_WINDOW_S} s)",
+            headers={**headers, "Retry-After": str(retry_after_s)},
+        )
+
+
+def _bucket_seconds() -> float:
+    return settings.QUOTA_WINDOW_S / settings.QUOTA_WINDOW_BUCKETS
+
+
+def _current_bucket(now: Optional[float] = None) -> int:
+    return int((now or time.time()) // _bucket_seconds())
+
+
+class SlidingWindow:
+    """Bucketed counts for one key: synced totals (all workers) + local unsynced deltas"""
+
+    def __init__(self):
+        self.synced = {}   # bucket -> {"requests": n, "tokens": n}
+        self.pending = {}  # bucket -> {"requests": n, "tokens": n}
+
+    def add(self, metric: str, amount: float, bucket: int) -> None:
+        counts = self.pending.setdefault(bucket, {})
+        counts[metric] = counts.get(metric, 0) + amount
+
+    def prune(self, oldest: int) -> None:
+        for buckets in (self.synced, self.pending):
+            for bucket in [b for b in buckets if b < oldest]:
+                del buckets[bucket]
+
+    def usage(self, oldest: int) -> dict:
+        totals = dict.fromkeys(METRICS, 0)
+        for buckets in (self.synced, self.pending):
+            for bucket, counts in buckets.items():
+                if bucket >= oldest:
+                    for metric, value in counts.items():
+                        totals[metric] = totals.get(metric, 0) + value
+        return totals
+
+    def oldest_bucket(self) -> Optional[int]:
+        buckets = [b for b, c in list(self.synced.items()) + list(self.pending.items()) if any(c.values())]
+        return min(buckets) if buckets else None
+
+
+_windows: dict[str, SlidingWindow] = {}
+# buckets that fell out of the window, deleted from the Firestore documents on the next sync
+_stale: dict[str, list[int]] = {}
+_lock = threading.Lock()
+
+
+def _limits(scope: str) -> dict:
+    if scope == "user":
+        return {"requests": settings.QUOTA_USER_REQUESTS, "tokens": settings.QUOTA_USER_TOKENS}
+    return {"requests": settings.QUOTA_PROJECT_REQUESTS, "tokens": settings.QUOTA_PROJECT_TOKENS}
+
+
+class QuotaAccount:
+    """The quota keys a request is charged to"""
+
+    def __init__(self, keys: list[str]):
+        self.keys = keys
+        self.admitted_bucket = None  # bucket the admitted request was counted in
+
+    def charge(self, metric: str, amount: float) -> None:
+        if not amount:
+            return
+        bucket = _current_bucket()
+        with _lock:
+            for key in self.keys:
+                _windows.setdefault(key, SlidingWindow()).add(metric, amount, bucket)
+
+    def refund(self) -> None:
+        """Give back the request charged by admit() (e.g. the request was shed with 503)"""
+        if self.admitted_bucket is None:
+            return
+        with _lock:
+            for key in self.keys:
+                _windows.setdefault(key, SlidingWindow()).add("requests", -1, self.admitted_bucket)
+        self.admitted_bucket = None
+        increment("quota.refunded")
+
+    def headers(self) -> dict:
+        """X-Quota-* headers for the tightest scope of each metric (0 limit = unlimited)"""
+        now = time.time()
+        oldest = _current_bucket(now) - settings.QUOTA_WINDOW_BUCKETS + 1
+        headers = {}
+        with _lock:
+            for metric in METRICS:
+                tightest = None
+                for key in self.keys:
+                    limit = _limits(key.split(":", 1)[0])[metric]
+                    if not limit:
+                        continue
+                    remaining = max(limit - _windows.setdefault(key, SlidingWindow()).usage(oldest)[metric], 0)
+                    if tightest is None or remaining < tightest[1]:
+                        tightest = (limit, remaining)
+                if tightest is not None:
+                    name = metric.capitalize()
+                    headers[f"X-Quota-{name}-Limit"] = str(tightest[0])
+                    headers[f"X-Quota-{name}-Remaining"] = str(int(tightest[1]))
+        if headers:
+            headers["X-Quota-Window"] = str(settings.QUOTA_WINDOW_S)
+        return headers
+
+
+_current_account: ContextVar[Optional[QuotaAccount]] = ContextVar("quota_account", default=None)
+
+
+def _retry_after(window: SlidingWindow, now: float) -> int:
+    oldest = window.oldest_bucket()
+    if oldest is None:
+        return 1
+    # the oldest bucket leaves the window at (oldest + buckets) * bucket_seconds
+    expires = (oldest + settings.QUOTA_WINDOW_BUCKETS) * _bucket_seconds()
+    return max(int(expires - now) + 1, 1)
+
+
+def admit(user_id: str, project_id: Optional[str] = None, estimated_tokens: int = 0) -> Optional[QuotaAccount]:
+    """
+    Check the user's (and project's) quotas and charge one request.
+
+    The account becomes current for this context, so LLM usage recorded by
+    run_nebius_ai (also in threads started with a copied context) is charged to it.
+    Call it on the route's event loop, not in a worker thread: a context variable
+    set in a thread's copied context doesn't reach the route's later threads.
+
+    Args:
+        user_id: Requesting user
+        project_id: Project the work belongs to
+        estimated_tokens: Pre-flight token estimate (e.g. count_tokens of the input)
+
+    Returns:
+        The QuotaAccount, or None when quotas are disabled
+
+    Raises:
+        QuotaExceeded: A request or token limit would be exceeded (429)
+    """
+    if not settings.QUOTA_ENABLED or not user_id:
+        return None
+
+    # project IDs are only unique per user ("default-project")
+    keys = [f"user:{user_id}"] + ([f"project:{user_id}:{project_id}"] if project_id else [])
+    account = QuotaAccount(keys)
+    now = time.time()
+    oldest = _current_bucket(now) - settings.QUOTA_WINDOW_BUCKETS + 1
+    exceeded = None
+    with _lock:
+        for key in keys:
+            scope = key.split(":", 1)[0]
+            window = _windows.setdefault(key, SlidingWindow())
+            window.prune(oldest)
+            used = window.usage(oldest)
+            for metric, needed in (("requests", 1), ("tokens", estimated_tokens)):
+                limit = _limits(scope)[metric]
+                if limit and used[metric] + needed > limit:
+                    exceeded = (scope, metric, limit, _retry_after(window, now))
+                    break
+            if exceeded:
+                break
+        else:
+            # charge under the same lock, so concurrent requests can't all pass the check
+            account.admitted_bucket = _current_bucket(now)
+            for key in keys:
+                _windows[key].add("requests", 1, account.admitted_bucket)
+
+    if exceeded:
+        increment(f"quota.rejected.{exceeded[0]}.{exceeded[1]}")
+        raise QuotaExceeded(*exceeded, account.headers())
+
+    _current_account.set(account)
+    return account
+
+
+def record_llm_usage(usage: Optional[dict]) -> None:
+    """Charge an LLM call's total tokens to the current account (no-op outside one)"""
+    account = _current_account.get()
+    if account is not None and usage:
+        account.charge("tokens", usage.get("total_tokens") or 0)
+
+
+def sync_once() -> int:
+    """
+    Push local unsynced counts to Firestore and refresh the synced totals.
+
+    Returns:
+        Number of keys synced
+    """
+    from firebase_admin import firestore
+
+    now_bucket = _current_bucket()
+    oldest = now_bucket - settings.QUOTA_WINDOW_BUCKETS + 1
+    with _lock:
+        keys = list(_windows)
+        pending = {key: _windows[key].pending for key in keys}
+        for key in keys:
+            _windows[key].pending = {}
+        stale = dict(_stale)
+        _stale.clear()
+    if not keys:
+        return 0
+
+    db = get_firestore_client()
+    refs = {key: db.collection(QUOTA_COLLECTION).document(key) for key in keys}
+    try:
+        batch = db.batch()
+        for key, buckets in pending.items():
+            update = {
+                str(bucket): {metric: firestore.Increment(value) for metric, value in counts.items()}
+                for bucket, counts in buckets.items() if bucket >= oldest
+            }
+            for bucket in stale.get(key, []):
+                update[str(bucket)] = firestore.DELETE_FIELD
+            if update:
+                batch.set(refs[key], {"buckets": update, "updatedAt": firestore.SERVER_TIMESTAMP}, merge=True)
+        batch.commit()
+    except Exception:
+        # keep the counts for the next attempt
+        with _lock:
+            for key, buckets in pending.items():
+                window = _windows.setdefault(key, SlidingWindow())
+                for bucket, counts in buckets.items():
+                    for metric, value in counts.items():
+                        window.add(metric, value, bucket)
+        raise
+
+    synced = {}
+    for doc in db.get_all(list(refs.values())):
+        if doc.exists:
+            buckets = (doc.to_dict() or {}).get("buckets", {})
+            synced[doc.id] = {int(b): c for b, c in buckets.items() if int(b) >= oldest}
+            expired = [int(b) for b in buckets if int(b) < oldest]
+            if expired:
+                with _lock:
+                    _stale[doc.id] = expired
+
+    with _lock:
+        for key in keys:
+            window = _windows[key]
+            window.synced = synced.get(key, {})
+            window.prune(oldest)
+            # forget keys with no usage left in the window
+            if not window.synced and not window.pending:
+                del _windows[key]
+    return len(keys)
+
+
+class QuotaSyncer:
+    """Background thread running sync_once every QUOTA_SYNC_INTERVAL_S"""
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is None and settings.QUOTA_ENABLED:
+            self._thread = threading.Thread(target=self._run, name="quota-syncer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(settings.QUOTA_SYNC_INTERVAL_S):
+            try:
+                sync_once()
+            except Exception:
+                increment("quota.sync_errors")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        try:
+            sync_once()
+        except Exception:
+            increment("quota.sync_errors")
+
+
+syncer = QuotaSyncer()
@@ -1,8 +1,72 @@
 """Token counting service using tiktoken"""
-import tiktoken
+import os
+import sys
+import time
+from pathlib import Path
+
+try:
+    from .profiling import profiled
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from services.profiling import profiled
 
 DEFAULT_ENCODING = "cl100k_base"
 
+# BPE files are vendored here at build time (tools/vendor_tiktoken.py) so the
+# first count doesn't download them from openaipublic.blob.core.windows.net
+TIKTOKEN_CACHE_DIR = Path(__file__).resolve().parent.parent / "tiktoken_cache"
+os.environ.setdefault("TIKTOKEN_CACHE_DIR", str(TIKTOKEN_CACHE_DIR))
+
+_encodings = {}
+# encoding -> time of the last failed load; counts fall back to an estimate until the retry
+_load_failures = {}
+LOAD_RETRY_S = 60
+
+
+def get_encoding(encoding: str = DEFAULT_ENCODING):
+    """
+    Load a tiktoken encoding once per process (tiktoken itself is imported lazily).
+    
+    Args:
+        encoding: The encoding name
+    
+    Returns:
+        tiktoken.Encoding instance
+    """
+    enc = _encodings.get(encoding)
+    if enc is None:
+        # a failed load (e.g. BPE file not vendored and no network) isn't retried on every
+        # count: it blocks on the download under tiktoken's global lock
+        failed_at = _load_failures.get(encoding)
+        if failed_at is not None and time.monotonic() - failed_at < LOAD_RETRY_S:
+            raise RuntimeError(f"encoding {encoding} failed to load, retrying later")
+        import tiktoken
+        try:
+            enc = _encodings[encoding] = tiktoken.get_encoding(encoding)
+        except Exception:
+            _load_failures[encoding] = time.monotonic()
+            raise
+    return enc
+
+
+def warmup_encodings(encodings: tuple = (DEFAULT_ENCODING,)) -> dict:
+    """
+    Preload encodings before the worker accepts traffic.
+    
+    Returns:
+        Dictionary of encoding name -> True if loaded, error string otherwise
+    """
+    status = {}
+    for name in encodings:
+        try:
+            get_encoding(name).encode("warmup")
+            status[name] = True
+        except Exception as e:
+            status[name] = str(e)
+    return status
+
+
+@profiled("count_tokens")
 def count_tokens(text: str, encoding: str = DEFAULT_ENCODING) -> int:
     """
     Count the number of tokens in a text string.
@@ -15,7 +79,7 @@ def count_tokens(text: str, encoding: str = DEFAULT_ENCODING) -> int:
         Number of tokens in the text
     """
     try:
-        enc = tiktoken.get_encoding(encoding)
+        enc = get_encoding(encoding)
         return len(enc.encode(text))
     except Exception as e:
         # Fallback to rough estimation if tiktoken fails
@@ -33,7 +97,7 @@ def count_tokens_detailed(text: str, encoding: str = DEFAULT_ENCODING) -> dict:
         Dictionary with token_count, tokens list, and original text
     """
     try:
-        enc = tiktoken.get_encoding(encoding)
+        enc = get_encoding(encoding)
         token_ids = enc.encode(text)
         
         token_list = [enc.decode([t]) for t in token_ids]
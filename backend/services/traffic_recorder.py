@@ -0,0 +1,208 @@
+"""
+Opt-in recording of anonymized request shapes, for tools/replay_traffic.py.
+
+With TRAFFIC_RECORD_PATH set, every (or every TRAFFIC_RECORD_SAMPLE_RATE-th)
+HTTP request appends one JSON line: route template, method, arrival time
+(wall clock, so lines from several workers share one timeline), duration, status, request / response sizes and the *shape* of the query and
+JSON body. No prompt text is kept:
+
+- strings become {"$text": <token count>}
+- IDs (userID, promptID, path parameters, ...) become {"$id": <salted hash>},
+  stable within one recording so the replay can rebuild sessions such as
+  /parse -> /optimizeExisting on the prompt it created
+- timestamps (history cursors) become {"$age_s": <seconds before the request>}
+- numbers, booleans and a few enum-like fields (ai_model, models, format, ...) are kept
+
+The salt is drawn at import and lives only in process memory, so hashes can't
+be linked across restarts or back to real IDs. server.py imports the app in the
+gunicorn master, so its workers share it; servers that import the app in every
+worker (uvicorn --workers N) need TRAFFIC_RECORD_SALT set to one random hex
+value for the whole recording. Lines are written after the response is sent.
+"""
+import hashlib
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+import orjson
+
+try:
+    from ..core.config import settings
+    from .metrics import increment
+    from .token_counter import count_tokens
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+    from services.metrics import increment
+    from services.token_counter import count_tokens
+
+ID_FIELDS = {"id", "uid", "userID", "user_id", "promptID", "prompt_id", "projectID", "project_id", "email", "username"}
+VERBATIM_FIELDS = {"ai_model", "model", "models", "policy", "format", "dryRun", "mode"}
+TIME_FIELDS = {"since", "start", "end"}
+
+_salt = bytes.fromhex(settings.TRAFFIC_RECORD_SALT) if settings.TRAFFIC_RECORD_SALT else os.urandom(16)
+
+
+def anonymize_id(value: str) -> str:
+    return hashlib.blake2b(str(value).encode(), key=_salt, digest_size=8).hexdigest()
+
+
+def _age_s(value: str, now: datetime) -> Optional[float]:
+    try:
+        stamp = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if stamp.tzinfo is None:
+        stamp = stamp.replace(tzinfo=timezone.utc)
+    return round((now - stamp).total_seconds(), 3)
+
+
+def shape_of(value: Any, key: Optional[str] = None, now: Optional[datetime] = None) -> Any:
+    """Anonymized stand-in for a query / body value (see module docstring)"""
+    if isinstance(value, dict):
+        return {k: shape_of(v, k, now) for k, v in value.items()}
+    if isinstance(value, list):
+        return [shape_of(v, key, now) for v in value]
+    if not isinstance(value, str):
+        return value
+    if key in ID_FIELDS:
+        return {"$id": anonymize_id(value)}
+    if key in VERBATIM_FIELDS:
+        return value
+    if key in TIME_FIELDS:
+        age = _age_s(value, now or datetime.now(timezone.utc))
+        if age is not None:
+            return {"$age_s": age}
+    return {"$text": count_tokens(value)}
+
+
+def _route_template(scope) -> str:
+    """Request path with path parameter values put back as {name}"""
+    names = {str(value): name for name, value in (scope.get("path_params") or {}).items()}
+    return "/".join("{" + names[segment] + "}" if segment in names else segment for segment in scope["path"].split("/"))
+
+
+def _query(scope) -> dict:
+    from urllib.parse import parse_qsl
+
+    return dict(parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True))
+
+
+class _Writer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._file = None
+
+    def write(self, record: dict) -> None:
+        line = orjson.dumps(record) + b"\n"
+        with self._lock:
+            if self._file is None:
+                path = Path(settings.TRAFFIC_RECORD_PATH)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(path, "ab")
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+writer = _Writer()
+
+
+class TrafficRecorderMiddleware:
+    """ASGI middleware appending one anonymized record per HTTP request to TRAFFIC_RECORD_PATH"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.TRAFFIC_RECORD_PATH:
+            return await self.app(scope, receive, send)
+        if settings.TRAFFIC_RECORD_SAMPLE_RATE < 1 and random.random() >= settings.TRAFFIC_RECORD_SAMPLE_RATE:
+            return await self.app(scope, receive, send)
+
+        arrival = time.time()
+        start = time.perf_counter()
+        request_body = bytearray()
+        response_body = bytearray()
+        request_bytes = 0
+        response_bytes = 0
+        status = None
+        response_json = False
+
+        async def receive_recorded():
+            nonlocal request_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                request_bytes += len(chunk)
+                if len(request_body) + len(chunk) <= settings.TRAFFIC_RECORD_MAX_BODY_BYTES:
+                    request_body.extend(chunk)
+            return message
+
+        async def send_recorded(message):
+            nonlocal response_bytes, status, response_json
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                content_type = dict(message.get("headers", [])).get(b"content-type", b"")
+                response_json = content_type.startswith(b"application/json")
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                response_bytes += len(chunk)
+                # only needed to map created prompt IDs, small JSON responses only
+                if response_json and len(response_body) + len(chunk) <= settings.TRAFFIC_RECORD_MAX_BODY_BYTES:
+                    response_body.extend(chunk)
+            await send(message)
+
+        try:
+            await self.app(scope, receive_recorded, send_recorded)
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            try:
+                writer.write(self._record(
+                    scope, arrival, duration_ms, status, request_body, request_bytes, response_body, response_bytes,
+                ))
+                increment("traffic.recorded")
+            except (OSError, ValueError, TypeError):
+                increment("traffic.record_errors")
+
+    @staticmethod
+    def _record(scope, arrival, duration_ms, status, request_body, request_bytes, response_body, response_bytes) -> dict:
+        now = datetime.now(timezone.utc)
+        path_params = {name: {"$id": anonymize_id(value)} for name, value in (scope.get("path_params") or {}).items()}
+        record = {
+            "t": round(arrival, 4),
+            "method": scope["method"],
+            "route": _route_template(scope),
+            "pathParams": path_params,
+            "query": shape_of(_query(scope), now=now),
+            "status": status or 500,
+            "durationMs": round(duration_ms, 2),
+            "requestBytes": request_bytes,
+            "responseBytes": response_bytes,
+        }
+        if request_body:
+            try:
+                record["body"] = shape_of(orjson.loads(request_body), now=now)
+            except orjson.JSONDecodeError:
+                record["body"] = None
+        if response_body:
+            try:
+                created = orjson.loads(response_body)
+            except orjson.JSONDecodeError:
+                created = None
+            if isinstance(created, dict) and isinstance(created.get("promptID"), str):
+                created_id = anonymize_id(created["promptID"])
+                # a new prompt, not the one the request was about
+                if created_id not in orjson.dumps([path_params, record.get("body")]).decode():
+                    record["createdPromptID"] = created_id
+        return record
@@ -0,0 +1,209 @@
+"""
+Startup warmup and upstream readiness.
+
+warmup() loads local tables (tokenizer encodings) and is also run by the
+gunicorn master before it forks. Network clients are not fork-safe, so each
+worker warms its upstreams itself in readiness.warm(), before it accepts
+traffic:
+
+- firestore: credentials, the gRPC channel and one document read
+- llm:<model>: WARMUP_LLM_CONNECTIONS concurrent one-line completions per
+  model in WARMUP_MODELS, which leaves that many TLS connections in the pool
+
+Dependencies that don't answer within WARMUP_TIMEOUT_S keep warming in the
+background, and /ready reports 503 until they do. After that, a keepalive
+thread probes every KEEPALIVE_INTERVAL_S (a Firestore read and a GET of the
+model list), so pooled connections of a quiet instance don't expire and the
+next real request doesn't pay the handshake.
+"""
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from time import perf_counter
+from typing import Callable
+
+try:
+    from ..core.config import settings
+    from .token_counter import warmup_encodings
+    from .compression import load_dictionaries
+    from .model_registry import model_encodings
+    from .firebase_db import get_firestore_client
+    from .nebius_ai import get_nebius_client
+    from .metrics import increment
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+    from services.token_counter import warmup_encodings
+    from services.compression import load_dictionaries
+    from services.model_registry import model_encodings
+    from services.firebase_db import get_firestore_client
+    from services.nebius_ai import get_nebius_client
+    from services.metrics import increment
+
+# read by the Firestore probe; the document doesn't need to exist
+WARMUP_DOCUMENT = "_warmup/ping"
+WARMUP_MESSAGES = [{"role": "user", "content": "Reply with OK."}]
+WARMUP_MAX_TOKENS = 16
+
+
+def warmup() -> dict:
+    """
+    Preload everything the first request would otherwise pay for.
+
+    Returns:
+        Dictionary with per-step status and total warmup time
+
+    Raises:
+        RuntimeError: A configured compression dictionary is missing
+    """
+    start_time = perf_counter()
+    status = {"encodings": warmup_encodings(model_encodings()), "compressionDicts": load_dictionaries()}
+    status["warmupMs"] = (perf_counter() - start_time) * 1000
+    return status
+
+
+def prefork_warmup() -> dict:
+    """
+    Warmup for the gunicorn master before it forks workers.
+
+    Loads tokenizer tables and imports the heavy SDK modules so their memory is
+    shared copy-on-write. Network clients (Firestore gRPC channel, Nebius HTTP
+    pool) are not fork-safe and are still created inside each worker.
+
+    Returns:
+        Same status dictionary as warmup(), plus the preloaded modules
+    """
+    status = warmup()
+    status["modules"] = {}
+    for module in ("openai", "firebase_admin.firestore", "firebase_admin.auth"):
+        try:
+            __import__(module)
+            status["modules"][module] = True
+        except Exception as e:
+            status["modules"][module] = str(e)
+    return status
+
+
+def warmup_models() -> list[str]:
+    models = [model.strip() for model in settings.WARMUP_MODELS.split(",") if model.strip()]
+    return models or [settings.NEBIUS_MODEL]
+
+
+def _touch_firestore() -> None:
+    get_firestore_client().document(WARMUP_DOCUMENT).get()
+
+
+def _complete(model: str) -> None:
+    get_nebius_client().chat.completions.create(model=model, messages=WARMUP_MESSAGES, max_tokens=WARMUP_MAX_TOKENS)
+
+
+def _list_models() -> None:
+    get_nebius_client().models.list()
+
+
+def _on_connections(call: Callable[[], None]) -> Callable[[], None]:
+    """Run `call` WARMUP_LLM_CONNECTIONS times at once: concurrent calls can't share a
+    connection, so each one opens (or keeps alive) its own in the pool"""
+    def run():
+        connections = max(1, settings.WARMUP_LLM_CONNECTIONS)
+        if connections == 1:
+            call()
+            return
+        with ThreadPoolExecutor(max_workers=connections) as pool:
+            for future in [pool.submit(call) for _ in range(connections)]:
+                future.result()
+    return run
+
+
+class Readiness:
+    """Warm state and probe latency per upstream dependency"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state: dict[str, dict] = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _probes(self) -> dict[str, tuple[Callable[[], None], Callable[[], None]]]:
+        """Dependency -> (warm, keepalive probe)"""
+        probes = {"firestore": (_touch_firestore, _touch_firestore)}
+        for model in warmup_models():
+            probes[f"llm:{model}"] = (_on_connections(lambda model=model: _complete(model)),
+                                      _on_connections(_list_models))
+        with self._lock:
+            for name in probes:
+                self._state.setdefault(name, {"warm": False, "coldMs": None, "latencyMs": None,
+                                              "error": None, "lastProbeAt": None})
+        return probes
+
+    def _run(self, name: str, probe: Callable[[], None]) -> None:
+        start_time = perf_counter()
+        try:
+            probe()
+        except Exception as e:
+            increment("warmup.probe_errors")
+            with self._lock:
+                self._state[name].update(error=str(e), lastProbeAt=time.time())
+            return
+        latency_ms = round((perf_counter() - start_time) * 1000, 1)
+        with self._lock:
+            state = self._state[name]
+            if not state["warm"]:
+                # the first successful call pays for credentials, DNS and the handshake
+                state["coldMs"] = latency_ms
+            state.update(warm=True, latencyMs=latency_ms, error=None, lastProbeAt=time.time())
+
+    def warm(self, timeout_s: float = None) -> dict:
+        """
+        Warm every upstream concurrently, waiting up to timeout_s (default WARMUP_TIMEOUT_S).
+        Slower ones finish in the background.
+
+        Returns:
+            report()
+        """
+        probes = self._probes()
+        pool = ThreadPoolExecutor(max_workers=len(probes), thread_name_prefix="warmup")
+        futures = [pool.submit(self._run, name, warm) for name, (warm, _) in probes.items()]
+        wait(futures, timeout=settings.WARMUP_TIMEOUT_S if timeout_s is None else timeout_s)
+        pool.shutdown(wait=False)
+        return self.report()
+
+    def probe(self) -> None:
+        """One keepalive round; dependencies that never warmed up get their warmup call instead"""
+        for name, (warm, keepalive) in self._probes().items():
+            with self._lock:
+                is_warm = self._state[name]["warm"]
+            self._run(name, keepalive if is_warm else warm)
+
+    def start(self) -> None:
+        if self._thread is None and settings.KEEPALIVE_INTERVAL_S > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._keepalive, name="upstream-keepalive", daemon=True)
+            self._thread.start()
+
+    def _keepalive(self) -> None:
+        while not self._stop.wait(settings.KEEPALIVE_INTERVAL_S):
+            self.probe()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def report(self) -> dict:
+        """
+        {"ready": every dependency warmed up, "dependencies": {name: state}}
+
+        A failing keepalive probe shows up in `error` without making the worker
+        unready: all instances share the upstreams, so taking them all out of the
+        load balancer wouldn't help.
+        """
+        with self._lock:
+            dependencies = {name: dict(state) for name, state in self._state.items()}
+        return {"ready": all(state["warm"] for state in dependencies.values()), "dependencies": dependencies}
+
+
+readiness = Readiness()
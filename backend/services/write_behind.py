@@ -0,0 +1,211 @@
+"""
+Write-behind buffer for UI interactions: ratings, favorites and copy counts.
+
+These come in bursts (clicking through the stars, toggling a favorite back and
+forth, copying a prompt a few times) and nothing on the request path needs
+them stored, so they are acknowledged once buffered. Updates to the same
+prompt are coalesced until the next flush:
+
+- rating / favorite: last writer wins; the rating is written as the
+  `ratings.user` field path, so the rest of the ratings map is left alone
+- copies: summed into one Increment of copyCount
+
+A background thread flushes every WRITE_BEHIND_INTERVAL_S, or as soon as
+WRITE_BEHIND_MAX_PENDING prompts are buffered, with one read of the affected
+prompts (owner, previous rating) and batched commits that go through the write
+journal when it is enabled. Shutdown flushes what is left. Updates buffered by
+a worker that dies before its next flush are lost.
+
+With WRITE_BEHIND_ENABLED=false every update is written before the response.
+"""
+import sys
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+try:
+    from ..core.config import settings
+    from .firebase_db import get_firestore_client
+    from .write_journal import get_write_batch
+    from .prompt_repository import repository, PromptNotFound
+    from .metrics import increment
+    from . import analytics, history_sync
+    from .history_search import indexes as search_indexes
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+    from services.firebase_db import get_firestore_client
+    from services.write_journal import get_write_batch
+    from services.prompt_repository import repository, PromptNotFound
+    from services.metrics import increment
+    from services import analytics, history_sync
+    from services.history_search import indexes as search_indexes
+
+# up to three writes per prompt (document, dual-write copy, analytics shard) under the 500-write batch limit
+PROMPTS_PER_BATCH = 150
+
+
+@dataclass
+class PendingUpdate:
+    rating: Optional[int] = None
+    is_favorite: Optional[bool] = None
+    copies: int = 0
+
+    def absorb(self, newer: "PendingUpdate") -> None:
+        """Coalesce a later update of the same prompt into this one"""
+        if newer.rating is not None:
+            self.rating = newer.rating
+        if newer.is_favorite is not None:
+            self.is_favorite = newer.is_favorite
+        self.copies += newer.copies
+
+    def fields(self) -> dict:
+        from firebase_admin import firestore
+
+        fields = {}
+        if self.rating is not None:
+            fields["ratings.user"] = self.rating
+        if self.is_favorite is not None:
+            fields["isFavorite"] = self.is_favorite
+        if self.copies:
+            fields["copyCount"] = firestore.Increment(self.copies)
+        return history_sync.touch(fields)
+
+
+def _write(db, updates: dict[str, PendingUpdate]) -> list[str]:
+    """
+    Commit coalesced updates in batches.
+
+    Returns:
+        IDs of prompts that no longer exist (their updates are dropped)
+    """
+    stored = repository.get_many(db, list(updates))
+    missing = [prompt_id for prompt_id in updates if prompt_id not in stored]
+    prompt_ids = [prompt_id for prompt_id in updates if prompt_id in stored]
+    for start in range(0, len(prompt_ids), PROMPTS_PER_BATCH):
+        chunk = prompt_ids[start:start + PROMPTS_PER_BATCH]
+        batch = get_write_batch(db)
+        for prompt_id in chunk:
+            data, update = stored[prompt_id], updates[prompt_id]
+            repository.update(db, batch, prompt_id, update.fields(), data.get("userID"), data.get("projectID"))
+            if update.rating is not None:
+                previous_rating = (data.get("ratings") or {}).get("user")
+                analytics.add_to_batch(db, batch, data.get("userID", ""),
+                                       analytics.rating_deltas(data, update.rating, previous_rating))
+        batch.commit()
+        for prompt_id in chunk:
+            if updates[prompt_id].is_favorite is not None:
+                search_indexes.set_favorite(stored[prompt_id].get("userID", ""), prompt_id, updates[prompt_id].is_favorite)
+    return missing
+
+
+class WriteBehindBuffer:
+    def __init__(self):
+        self._pending: dict[str, PendingUpdate] = {}
+        self._lock = threading.Lock()
+        # serializes flushes, so a prompt's updates are committed in order
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, prompt_id: str, update: PendingUpdate) -> None:
+        """
+        Buffer an update (written right away when write-behind is disabled).
+
+        Raises:
+            PromptNotFound: Write-behind disabled and the prompt doesn't exist
+        """
+        if not settings.WRITE_BEHIND_ENABLED:
+            if _write(get_firestore_client(), {prompt_id: update}):
+                raise PromptNotFound(prompt_id)
+            return
+        with self._lock:
+            current = self._pending.get(prompt_id)
+            if current is None:
+                self._pending[prompt_id] = update
+            else:
+                current.absorb(update)
+                increment("write_behind.coalesced")
+            full = len(self._pending) >= settings.WRITE_BEHIND_MAX_PENDING
+        increment("write_behind.buffered")
+        if full:
+            self._wake.set()
+
+    def rate(self, prompt_id: str, rating: int) -> None:
+        self.record(prompt_id, PendingUpdate(rating=rating))
+
+    def favorite(self, prompt_id: str, is_favorite: bool) -> None:
+        self.record(prompt_id, PendingUpdate(is_favorite=is_favorite))
+
+    def copied(self, prompt_id: str) -> None:
+        self.record(prompt_id, PendingUpdate(copies=1))
+
+    def flush(self) -> int:
+        """
+        Write everything buffered so far.
+
+        Returns:
+            Number of prompts written
+
+        Raises:
+            Exception: The write failed; the updates are buffered again under any newer ones
+        """
+        with self._flush_lock:
+            with self._lock:
+                updates, self._pending = self._pending, {}
+            if not updates:
+                return 0
+            try:
+                missing = _write(get_firestore_client(), updates)
+            except Exception:
+                with self._lock:
+                    for prompt_id, update in updates.items():
+                        newer = self._pending.get(prompt_id)
+                        if newer is not None:
+                            update.absorb(newer)
+                        self._pending[prompt_id] = update
+                increment("write_behind.flush_errors")
+                raise
+        if missing:
+            increment("write_behind.dropped", len(missing))
+        increment("write_behind.flushed", len(updates) - len(missing))
+        return len(updates) - len(missing)
+
+    def start(self) -> None:
+        if self._thread is None and settings.WRITE_BEHIND_ENABLED:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="write-behind-flusher", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        delay = settings.WRITE_BEHIND_INTERVAL_S
+        while not self._stop.is_set():
+            self._wake.wait(delay)
+            self._wake.clear()
+            try:
+                self.flush()
+                delay = settings.WRITE_BEHIND_INTERVAL_S
+            except Exception:
+                delay = min(delay * 2, 30)
+
+    def stop(self, timeout_s: float = 10) -> None:
+        """Stop the flusher, then write what is left"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout_s)
+            self._thread = None
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {"enabled": settings.WRITE_BEHIND_ENABLED, "pending": pending}
+
+
+buffer = WriteBehindBuffer()
@@ -0,0 +1,622 @@
+"""
+Local write-ahead journal for Firestore writes.
+
+Prompt and user writes are recorded in a SQLite (WAL mode) file and acknowledged
+once that local commit is durable. A background replayer pushes journal entries
+to Firestore in batches. Every entry carries an idempotency key: the replay batch
+also creates `_journal/{key}`, so an entry that was already applied (e.g. the
+process died before removing it from the journal) fails with AlreadyExists and is
+dropped instead of being applied twice.
+
+The journal file is shared by all workers on the instance; entries are claimed
+with a lease so only one worker replays each entry, and a restarted instance
+replays whatever is left. Writes to one document are replayed in journal order:
+an entry is only claimed once every earlier entry touching one of its document
+paths is gone or claimed in the same round (entry_paths indexes them), and a
+round stops applying a path at its first failed entry.
+
+Entry ops are stored as JSON; values JSON can't carry (datetimes, bytes,
+Firestore sentinels and transforms) are tagged {"$t": type, "v": value}.
+"""
+import base64
+import io
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+import orjson
+from fastapi import HTTPException
+
+try:
+    from ..core.config import settings
+    from .metrics import increment
+    from .firebase_db import get_firestore_client
+    from .profiling import span
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from core.config import settings
+    from services.metrics import increment
+    from services.firebase_db import get_firestore_client
+    from services.profiling import span
+
+# replay markers, add a Firestore TTL policy on `expireAt` to clean them up
+MARKER_COLLECTION = "_journal"
+MARKER_TTL = timedelta(days=7)
+# Firestore allows 500 writes per batch
+MAX_BATCH_WRITES = 500
+CLAIM_LEASE_S = 60
+
+_local = threading.local()
+
+# Firestore sentinels (SERVER_TIMESTAMP, DELETE_FIELD, ...) are compared by identity,
+# so they are stored by name and resolved back to the module singletons
+_SENTINELS = ("SERVER_TIMESTAMP", "DELETE_FIELD")
+_TAG = "$t"
+
+
+def _encode(value: Any) -> Any:
+    from google.cloud.firestore_v1 import transforms
+
+    if isinstance(value, dict):
+        encoded = {key: _encode(item) for key, item in value.items()}
+        # a stored dict that happens to use the tag key
+        return {_TAG: "map", "v": encoded} if _TAG in value else encoded
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    if isinstance(value, datetime):
+        return {_TAG: "datetime", "v": value.isoformat()}
+    if isinstance(value, bytes):
+        return {_TAG: "bytes", "v": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, transforms.Increment):
+        return {_TAG: "increment", "v": value.value}
+    if isinstance(value, transforms.Sentinel):
+        for name in _SENTINELS:
+            if value is getattr(transforms, name):
+                return {_TAG: "sentinel", "v": name}
+        raise TypeError(f"Unsupported Firestore sentinel in journal entry: {value!r}")
+    return value
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    tag = value.get(_TAG)
+    if tag is None:
+        return {key: _decode(item) for key, item in value.items()}
+    if tag == "map":
+        return {key: _decode(item) for key, item in value["v"].items()}
+    if tag == "datetime":
+        return datetime.fromisoformat(value["v"])
+    if tag == "bytes":
+        return base64.b64decode(value["v"])
+
+    from google.cloud.firestore_v1 import transforms
+
+    if tag == "increment":
+        return transforms.Increment(value["v"])
+    if tag == "sentinel":
+        return getattr(transforms, value["v"])
+    raise ValueError(f"Unknown journal value tag: {tag}")
+
+
+def _dumps(ops: list) -> str:
+    return orjson.dumps(_encode(ops)).decode()
+
+
+def _loads(text: str) -> list:
+    return _decode(orjson.loads(text))
+
+
+class _LegacyUnpickler(pickle.Unpickler):
+    """Reads entries journaled before the JSON format, restricted to the types ops held"""
+
+    _ALLOWED = {
+        ("datetime", "datetime"), ("datetime", "timezone"), ("datetime", "timedelta"),
+        ("google.api_core.datetime_helpers", "DatetimeWithNanoseconds"),
+        ("google.cloud.firestore_v1.transforms", "Increment"),
+    }
+
+    def find_class(self, module, name):
+        if (module, name) not in self._ALLOWED:
+            raise pickle.UnpicklingError(f"{module}.{name} is not allowed in a journal entry")
+        return super().find_class(module, name)
+
+    def persistent_load(self, pid):
+        from google.cloud.firestore_v1 import transforms
+
+        if pid not in _SENTINELS:
+            raise pickle.UnpicklingError(f"Unknown sentinel {pid!r}")
+        return getattr(transforms, pid)
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    """Rewrite pickled entries as JSON and index their paths"""
+    legacy = conn.execute("SELECT id, ops FROM entries WHERE typeof(ops) = 'blob'").fetchall()
+    for entry_id, blob in legacy:
+        conn.execute("UPDATE entries SET ops = ? WHERE id = ?",
+                     (_dumps(_LegacyUnpickler(io.BytesIO(blob)).load()), entry_id))
+    unindexed = conn.execute(
+        "SELECT id, ops FROM entries WHERE id NOT IN (SELECT entry_id FROM entry_paths)"
+    ).fetchall()
+    conn.executemany(
+        "INSERT OR IGNORE INTO entry_paths (path, entry_id) VALUES (?, ?)",
+        [(path, entry_id) for entry_id, text in unindexed for path in _paths(_loads(text))],
+    )
+
+
+class JournalBackpressure(HTTPException):
+    def __init__(self, pending: int):
+        super().__init__(
+            status_code=503,
+            detail=f"Write journal is full ({pending} pending writes), try again shortly",
+            headers={"Retry-After": "5"},
+        )
+
+
+def _paths(ops: list[dict]) -> set[str]:
+    return {op["path"] for op in ops}
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(settings.WRITE_JOURNAL_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # FULL: the commit is on disk before enqueue returns
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL UNIQUE,
+                ops TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                claimed_at REAL
+            )"""
+        )
+        # document paths each entry writes, for per-document ordering
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS entry_paths (
+                path TEXT NOT NULL,
+                entry_id INTEGER NOT NULL,
+                PRIMARY KEY (path, entry_id)
+            ) WITHOUT ROWID"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS entry_paths_entry ON entry_paths (entry_id)")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _migrate(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        _local.conn = conn
+    return conn
+
+
+def is_enabled() -> bool:
+    return settings.WRITE_JOURNAL_ENABLED
+
+
+def pending_count() -> int:
+    return _connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+def enqueue(ops: list[dict], key: Optional[str] = None) -> str:
+    """
+    Durably record a group of writes that must be applied together.
+
+    Args:
+        ops: [{"op": "set" | "update" | "delete", "path": "prompts/<id>", "data": {...}, "merge": bool | [fields]}]
+        key: Idempotency key (default: random UUID)
+
+    Returns:
+        The entry key
+
+    Raises:
+        JournalBackpressure: Too many entries are waiting for replay
+    """
+    pending = pending_count()
+    if pending >= settings.WRITE_JOURNAL_MAX_PENDING:
+        increment("journal.rejected")
+        raise JournalBackpressure(pending)
+
+    key = key or str(uuid.uuid4())
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO entries (key, ops, created_at) VALUES (?, ?, ?)",
+            (key, _dumps(ops), time.time()),
+        )
+        if cursor.rowcount:
+            conn.executemany(
+                "INSERT INTO entry_paths (path, entry_id) VALUES (?, ?)",
+                [(path, cursor.lastrowid) for path in _paths(ops)],
+            )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    increment("journal.enqueued")
+    return key
+
+
+class JournalBatch:
+    """
+    Drop-in for a Firestore WriteBatch that records to the journal on commit.
+    Only the document path of each reference is kept.
+    """
+
+    def __init__(self):
+        self.ops = []
+
+    def set(self, reference, document_data: dict, merge=False):
+        self.ops.append({"op": "set", "path": reference.path, "data": document_data, "merge": merge})
+
+    def update(self, reference, field_updates: dict):
+        self.ops.append({"op": "update", "path": reference.path, "data": field_updates})
+
+    def delete(self, reference):
+        self.ops.append({"op": "delete", "path": reference.path})
+
+    def commit(self, **kwargs) -> str:
+        with span("journal.enqueue"):
+            return enqueue(self.ops)
+
+
+def get_write_batch(db):
+    """JournalBatch when the journal is enabled, otherwise a regular Firestore batch"""
+    return JournalBatch() if is_enabled() else db.batch()
+
+
+def _apply_value(current: Any, value: Any) -> Any:
+    from google.cloud.firestore_v1.transforms import Increment, SERVER_TIMESTAMP
+
+    if isinstance(value, Increment):
+        return (current or 0) + value.value
+    if value is SERVER_TIMESTAMP:
+        # replay assigns the real server time; now is the best local guess
+        return datetime.now(timezone.utc)
+    return value
+
+
+def _assign(target: dict, key: str, value: Any) -> None:
+    from google.cloud.firestore_v1.transforms import DELETE_FIELD
+
+    if value is DELETE_FIELD:
+        target.pop(key, None)
+    else:
+        target[key] = _apply_value(target.get(key), value)
+
+
+def _assign_path(target: dict, path: str, value: Any) -> None:
+    """Assign a dotted field path ("ratings.user") like an update / merge field path does"""
+    *parents, key = path.split(".")
+    for parent in parents:
+        if not isinstance(target.get(parent), dict):
+            target[parent] = {}
+        target = target[parent]
+    _assign(target, key, value)
+
+
+def _lookup(data: dict, path: str) -> tuple[bool, Any]:
+    for key in path.split("."):
+        if not isinstance(data, dict) or key not in data:
+            return False, None
+        data = data[key]
+    return True, data
+
+
+def _merge(target: dict, data: dict) -> dict:
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            _assign(target, key, value)
+    return target
+
+
+def overlay(path: str, document: Optional[dict]) -> Optional[dict]:
+    """
+    Apply writes for `path` that are still waiting in the journal on top of what
+    Firestore returned, so reads see the caller's own acknowledged writes.
+
+    Args:
+        path: Document path, e.g. "prompts/<id>"
+        document: Firestore data (None if the document doesn't exist there)
+
+    Returns:
+        The document as it will be after replay (None if deleted / missing)
+    """
+    if not is_enabled():
+        return document
+
+    with span("journal.overlay"):
+        rows = _connect().execute(
+            """SELECT e.ops FROM entry_paths p JOIN entries e ON e.id = p.entry_id
+               WHERE p.path = ? ORDER BY p.entry_id""",
+            (path,),
+        ).fetchall()
+    for (text,) in rows:
+        for op in _loads(text):
+            if op["path"] != path:
+                continue
+            if op["op"] == "delete":
+                document = None
+            elif op["op"] == "set" and not op.get("merge"):
+                document = _merge({}, op["data"])
+            elif op["op"] == "set" and isinstance(op["merge"], list):
+                # merge with field paths: those fields are replaced
+                document = document or {}
+                for key in op["merge"]:
+                    found, value = _lookup(op["data"], key)
+                    if found:
+                        _assign_path(document, key, value)
+            elif op["op"] == "set":
+                document = _merge(document or {}, op["data"])
+            elif document is not None:
+                # update: fields (dotted paths for nested ones) are replaced
+                for key, value in op["data"].items():
+                    _assign_path(document, key, value)
+    return document
+
+
+def pending_paths(prefix: str) -> list[str]:
+    """
+    Document paths starting with `prefix` that have writes waiting in the journal,
+    so queries can add documents (e.g. new prompts) Firestore doesn't return yet.
+    """
+    if not is_enabled() or not prefix:
+        return []
+    # range scan on the entry_paths primary key instead of LIKE
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    rows = _connect().execute(
+        "SELECT DISTINCT path FROM entry_paths WHERE path >= ? AND path < ?", (prefix, upper)
+    ).fetchall()
+    return [path for (path,) in rows]
+
+
+def _claim(limit: int) -> list[tuple[int, str, list]]:
+    """
+    Claim up to `limit` entries in journal order, skipping entries with an earlier
+    entry on one of their paths that another worker holds or that can't be claimed.
+    """
+    now = time.time()
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute(
+            """SELECT e.id, e.claimed_at, p.path FROM entries e
+               JOIN entry_paths p ON p.entry_id = e.id
+               ORDER BY e.id"""
+        )
+        blocked = set()
+        taken = []
+
+        def consider(entry_id, claimed_at, paths):
+            free = claimed_at is None or claimed_at < now - CLAIM_LEASE_S
+            if free and not paths & blocked:
+                # later entries on these paths may follow in this round: they are committed after it
+                taken.append(entry_id)
+            else:
+                blocked.update(paths)
+
+        current, claimed_at, paths = None, None, set()
+        for entry_id, entry_claimed_at, path in rows:
+            if entry_id != current:
+                if current is not None:
+                    consider(current, claimed_at, paths)
+                    if len(taken) >= limit:
+                        break
+                current, claimed_at, paths = entry_id, entry_claimed_at, set()
+            paths.add(path)
+        else:
+            if current is not None and len(taken) < limit:
+                consider(current, claimed_at, paths)
+
+        if not taken:
+            conn.execute("COMMIT")
+            return []
+        marks = ",".join("?" * len(taken))
+        conn.execute(f"UPDATE entries SET claimed_at = ? WHERE id IN ({marks})", (now, *taken))
+        claimed = conn.execute(f"SELECT id, key, ops FROM entries WHERE id IN ({marks})", taken).fetchall()
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return sorted((row[0], row[1], _loads(row[2])) for row in claimed)
+
+
+def _release(entry_ids: list[int]) -> None:
+    _connect().executemany("UPDATE entries SET claimed_at = NULL WHERE id = ?", [(i,) for i in entry_ids])
+
+
+def _remove(entry_ids: list[int]) -> None:
+    conn = _connect()
+    conn.executemany("DELETE FROM entry_paths WHERE entry_id = ?", [(i,) for i in entry_ids])
+    conn.executemany("DELETE FROM entries WHERE id = ?", [(i,) for i in entry_ids])
+
+
+def _has_earlier(entry_id: int, paths: set[str]) -> bool:
+    """True while an earlier entry for one of `paths` is still in the journal"""
+    marks = ",".join("?" * len(paths))
+    return _connect().execute(
+        f"SELECT 1 FROM entry_paths WHERE path IN ({marks}) AND entry_id < ? LIMIT 1", (*paths, entry_id)
+    ).fetchone() is not None
+
+
+def _commit_entries(db, entries: list) -> None:
+    batch = db.batch()
+    expire_at = datetime.now(timezone.utc) + MARKER_TTL
+    for _, key, ops in entries:
+        batch.create(db.collection(MARKER_COLLECTION).document(key), {"expireAt": expire_at})
+        for op in ops:
+            reference = db.document(op["path"])
+            if op["op"] == "set":
+                batch.set(reference, op["data"], merge=op.get("merge", False))
+            elif op["op"] == "update":
+                batch.update(reference, op["data"])
+            else:
+                batch.delete(reference)
+    batch.commit()
+
+
+def _commit_one(db, entry) -> str:
+    """Commit a single entry: "applied", "duplicate", "dropped" or "failed" """
+    from google.api_core.exceptions import AlreadyExists, Conflict, InvalidArgument, NotFound
+
+    try:
+        _commit_entries(db, [entry])
+        return "applied"
+    except (AlreadyExists, Conflict):
+        return "duplicate"
+    except NotFound:
+        # an update whose document an earlier, still pending entry creates: retry later
+        if _has_earlier(entry[0], _paths(entry[2])):
+            return "failed"
+        # the document is gone for good, don't block the queue
+        return "dropped"
+    except InvalidArgument:
+        # can never succeed, don't block the queue
+        return "dropped"
+    except Exception:
+        return "failed"
+
+
+def replay_once(limit: Optional[int] = None) -> int:
+    """
+    Push one round of claimed journal entries to Firestore.
+
+    A failed batch is retried entry by entry: entries already applied earlier are
+    skipped, entries Firestore rejects permanently are dropped, the rest stay queued.
+    Once an entry stays queued, later claimed entries for its paths are released
+    untried, so no document sees its writes out of order.
+
+    Returns:
+        Number of entries removed from the journal
+
+    Raises:
+        RuntimeError: Nothing could be applied (Firestore unavailable), entries stay queued
+    """
+    entries = _claim(limit or settings.WRITE_JOURNAL_BATCH_SIZE)
+    if not entries:
+        return 0
+
+    db = get_firestore_client()
+    # group entries into Firestore batches of at most MAX_BATCH_WRITES writes
+    groups, group, writes = [], [], 0
+    for entry in entries:
+        size = len(entry[2]) + 1
+        if group and writes + size > MAX_BATCH_WRITES:
+            groups.append(group)
+            group, writes = [], 0
+        group.append(entry)
+        writes += size
+    groups.append(group)
+
+    applied = 0
+    failed = 0
+    # paths with an entry left queued this round
+    stuck = set()
+
+    def hold_back(group: list) -> list:
+        ready = []
+        for entry in group:
+            if _paths(entry[2]) & stuck:
+                stuck.update(_paths(entry[2]))
+                _release([entry[0]])
+            else:
+                ready.append(entry)
+        return ready
+
+    for group in groups:
+        group = hold_back(group)
+        if not group:
+            continue
+        try:
+            _commit_entries(db, group)
+            done = group
+        except Exception:
+            done = []
+            for entry in group:
+                if not hold_back([entry]):
+                    continue
+                outcome = _commit_one(db, entry)
+                if outcome == "failed":
+                    stuck.update(_paths(entry[2]))
+                    _release([entry[0]])
+                    failed += 1
+                    continue
+                if outcome != "applied":
+                    increment(f"journal.{outcome}")
+                done.append(entry)
+                # removed right away, so a later NotFound doesn't see it as pending
+                _remove([entry[0]])
+            applied += len(done)
+            continue
+        _remove([entry[0] for entry in done])
+        applied += len(done)
+
+    increment("journal.replayed", applied)
+    if failed:
+        increment("journal.replay_errors", failed)
+    if failed and not applied:
+        raise RuntimeError(f"journal replay failed for {failed} entries")
+    return applied
+
+
+class JournalReplayer:
+    """Background thread that drains the journal; backs off while Firestore is failing"""
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is None and is_enabled():
+            self._thread = threading.Thread(target=self._run, name="write-journal-replayer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        delay = settings.WRITE_JOURNAL_INTERVAL_S
+        while not self._stop.is_set():
+            try:
+                applied = replay_once()
+                delay = settings.WRITE_JOURNAL_INTERVAL_S
+                if applied:
+                    # keep draining without sleeping while there is a backlog
+                    continue
+            except Exception:
+                delay = min(delay * 2, 30)
+            self._stop.wait(delay)
+
+    def stop(self, drain_timeout_s: float = 10) -> None:
+        """Stop the thread, then try to flush what is left for up to drain_timeout_s"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=drain_timeout_s)
+            self._thread = None
+        deadline = time.monotonic() + drain_timeout_s
+        while is_enabled() and time.monotonic() < deadline:
+            try:
+                if not replay_once():
+                    break
+            except Exception:
+                break
+
+
+def get_journal_stats() -> dict:
+    if not is_enabled():
+        return {"enabled": False}
+    return {"enabled": True, "pending": pending_count(), "path": str(settings.WRITE_JOURNAL_PATH)}
+
+
+replayer = JournalReplayer()
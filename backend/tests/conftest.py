@@ -0,0 +1,17 @@
+"""
+Tests run against the in-process fakes (services/fakes.py): no credentials or network.
+
+Run from the repository root or backend/:
+    python -m pytest -q backend/tests
+"""
+import os
+import sys
+from pathlib import Path
+
+# before core.config is imported, so the settings pick the fakes up
+os.environ.setdefault("FIRESTORE_BACKEND", "fake")
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("FAKE_FIRESTORE_LATENCY_MS", "0")
+os.environ.setdefault("FAKE_LLM_LATENCY_MS", "0")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
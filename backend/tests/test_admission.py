@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from core.config import settings
+from services import admission
+from services.admission import AdmissionController, Overloaded
+
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMISSION_INITIAL_LIMIT", 2)
+    monkeypatch.setattr(settings, "ADMISSION_MIN_LIMIT", 1)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_LIMIT", 8)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_QUEUE", 1)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_QUEUE_MS", 200)
+    monkeypatch.setattr(settings, "ADMISSION_LATENCY_TARGET_MS", 1000)
+    monkeypatch.setattr(settings, "ADMISSION_DECREASE_FACTOR", 0.5)
+    monkeypatch.setattr(settings, "ADMISSION_DECREASE_INTERVAL_S", 60)
+
+
+def test_rejects_with_503_when_the_queue_is_full():
+    async def scenario():
+        controller = AdmissionController()
+        await controller.acquire()
+        await controller.acquire()
+        queued = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        assert controller.stats()["queued"] == 1
+
+        with pytest.raises(Overloaded) as error:
+            await controller.acquire()
+        assert error.value.status_code == 503
+        assert int(error.value.headers["Retry-After"]) >= 1
+
+        controller.release()
+        await queued
+
+    asyncio.run(scenario())
+
+
+def test_rejects_when_no_slot_frees_up_within_the_queue_wait():
+    async def scenario():
+        controller = AdmissionController()
+        await controller.acquire(2)
+        with pytest.raises(Overloaded) as error:
+            await controller.acquire()
+        assert "queue timeout" in error.value.detail
+        assert controller.stats()["queued"] == 0
+        assert controller.in_flight == 2
+
+    asyncio.run(scenario())
+
+
+def test_release_grants_the_slot_to_the_oldest_waiter():
+    async def scenario():
+        controller = AdmissionController()
+        await controller.acquire(2)
+        first = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        assert not first.done()
+
+        controller.release()
+        await asyncio.wait_for(first, 0.1)
+        assert controller.in_flight == 2
+        assert controller.stats()["queued"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_slot_gives_back_its_slots_and_reports_rejection():
+    async def scenario():
+        controller = AdmissionController()
+        rejected = []
+        async with controller.slot(weight=2):
+            assert controller.in_flight == 2
+            with pytest.raises(Overloaded):
+                async with controller.slot(on_reject=lambda: rejected.append(True)):
+                    pass
+        assert controller.in_flight == 0
+        assert rejected == [True]
+
+    asyncio.run(scenario())
+
+
+def test_fast_calls_raise_the_limit_by_one_per_limit_calls():
+    controller = AdmissionController()
+    controller.observe(100, ok=True)
+    assert controller.limit == pytest.approx(2.5)
+    controller.observe(100, ok=True)
+    assert controller.limit == pytest.approx(2.9)
+
+    for _ in range(200):
+        controller.observe(100, ok=True)
+    assert controller.limit == settings.ADMISSION_MAX_LIMIT
+
+
+def test_slow_or_failed_calls_cut_the_limit_at_most_once_per_interval():
+    controller = AdmissionController()
+    controller.limit = 8.0
+    controller._last_decrease -= settings.ADMISSION_DECREASE_INTERVAL_S
+    controller.observe(5000, ok=True)
+    assert controller.limit == 4.0
+    # a burst of failures inside the same interval counts once
+    controller.observe(100, ok=False)
+    assert controller.limit == 4.0
+
+    controller._last_decrease -= settings.ADMISSION_DECREASE_INTERVAL_S
+    controller.observe(100, ok=False)
+    assert controller.limit == 2.0
+    controller._last_decrease -= settings.ADMISSION_DECREASE_INTERVAL_S
+    controller.observe(100, ok=False)
+    controller._last_decrease -= settings.ADMISSION_DECREASE_INTERVAL_S
+    controller.observe(100, ok=False)
+    assert controller.limit == settings.ADMISSION_MIN_LIMIT
+
+
+def test_executor_has_a_thread_for_every_slot():
+    pool = admission.executor()
+    try:
+        assert pool._max_workers == settings.ADMISSION_MAX_LIMIT + settings.ADMISSION_EXECUTOR_HEADROOM
+    finally:
+        pool.shutdown()
@@ -0,0 +1,178 @@
+import time
+
+import pytest
+from google.cloud.firestore_v1.transforms import DELETE_FIELD, Increment
+
+from core.config import settings
+from services import fakes, write_journal
+from services.firebase_db import get_firestore_client
+
+
+def _reconnect() -> None:
+    """Drop this thread's journal connection, like a restarted process"""
+    conn = getattr(write_journal._local, "conn", None)
+    if conn is not None:
+        conn.close()
+        del write_journal._local.conn
+
+
+@pytest.fixture(autouse=True)
+def journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "FIRESTORE_BACKEND", "fake")
+    monkeypatch.setattr(settings, "WRITE_JOURNAL_ENABLED", True)
+    monkeypatch.setattr(settings, "WRITE_JOURNAL_PATH", str(tmp_path / "journal.db"))
+    monkeypatch.setattr(settings, "WRITE_JOURNAL_MAX_PENDING", 100)
+    monkeypatch.setattr(settings, "WRITE_JOURNAL_BATCH_SIZE", 100)
+    monkeypatch.setattr(fakes, "_firestore", None)
+    _reconnect()
+    yield
+    _reconnect()
+
+
+def _write(db, *ops) -> str:
+    """Journal one batch: ops are ("set" | "update" | "delete", path, data)"""
+    batch = write_journal.JournalBatch()
+    for op, path, data in ops:
+        if op == "set":
+            batch.set(db.document(path), data)
+        elif op == "update":
+            batch.update(db.document(path), data)
+        else:
+            batch.delete(db.document(path))
+    return batch.commit()
+
+
+def _stored(db, path: str):
+    return db.document(path).get().to_dict()
+
+
+def test_replay_applies_writes_to_a_document_in_journal_order():
+    db = get_firestore_client()
+    _write(db, ("set", "prompts/a", {"n": 1}))
+    _write(db, ("update", "prompts/a", {"n": 2}))
+    _write(db, ("update", "prompts/a", {"n": 3}), ("set", "prompts/b", {"n": 1}))
+
+    # one entry per round, and all at once, end in the same state
+    while write_journal.replay_once(limit=1):
+        pass
+    assert _stored(db, "prompts/a") == {"n": 3}
+    assert _stored(db, "prompts/b") == {"n": 1}
+    assert write_journal.pending_count() == 0
+
+
+def test_entries_after_a_failed_entry_wait_for_it(monkeypatch):
+    db = get_firestore_client()
+    first = _write(db, ("set", "prompts/a", {"n": 1}))
+    # would succeed on its own, and then be overwritten by the retried first entry
+    _write(db, ("set", "prompts/a", {"n": 2}))
+    _write(db, ("set", "prompts/b", {"n": 1}))
+
+    commit = write_journal._commit_entries
+
+    def fail_first(db, entries):
+        if any(key == first for _, key, _ in entries):
+            raise RuntimeError("unavailable")
+        commit(db, entries)
+
+    monkeypatch.setattr(write_journal, "_commit_entries", fail_first)
+    assert write_journal.replay_once() == 1
+    assert _stored(db, "prompts/a") is None
+    assert _stored(db, "prompts/b") == {"n": 1}
+    assert write_journal.pending_count() == 2
+
+    monkeypatch.setattr(write_journal, "_commit_entries", commit)
+    assert write_journal.replay_once() == 2
+    assert _stored(db, "prompts/a") == {"n": 2}
+
+
+def test_update_of_a_missing_document_is_dropped():
+    db = get_firestore_client()
+    _write(db, ("update", "prompts/gone", {"n": 1}))
+    _write(db, ("set", "prompts/b", {"n": 1}))
+    assert write_journal.replay_once() == 2
+    assert _stored(db, "prompts/gone") is None
+    assert write_journal.pending_count() == 0
+
+
+def test_pending_entries_survive_a_restart():
+    db = get_firestore_client()
+    _write(db, ("set", "prompts/a", {"n": 1, "count": Increment(2)}))
+    _write(db, ("update", "prompts/a", {"count": Increment(3), "n": DELETE_FIELD}))
+    _reconnect()
+
+    assert write_journal.pending_count() == 2
+    assert write_journal.replay_once() == 2
+    assert _stored(db, "prompts/a") == {"count": 5}
+
+
+def test_entries_claimed_by_a_dead_worker_are_replayed_after_the_lease():
+    db = get_firestore_client()
+    _write(db, ("set", "prompts/a", {"n": 1}))
+    # claimed, then the process died before committing
+    assert len(write_journal._claim(10)) == 1
+    _reconnect()
+
+    assert write_journal.replay_once() == 0
+    expired = time.time() - write_journal.CLAIM_LEASE_S - 1
+    write_journal._connect().execute("UPDATE entries SET claimed_at = ?", (expired,))
+    assert write_journal.replay_once() == 1
+    assert _stored(db, "prompts/a") == {"n": 1}
+
+
+def test_entry_applied_before_a_crash_is_not_applied_twice():
+    db = get_firestore_client()
+    _write(db, ("set", "prompts/a", {"count": 1}))
+    _write(db, ("update", "prompts/a", {"count": Increment(1)}))
+    # committed to Firestore, but the process died before removing the entries
+    write_journal._commit_entries(db, write_journal._claim(10))
+    _reconnect()
+    expired = time.time() - write_journal.CLAIM_LEASE_S - 1
+    write_journal._connect().execute("UPDATE entries SET claimed_at = ?", (expired,))
+
+    assert write_journal.replay_once() == 2
+    assert _stored(db, "prompts/a") == {"count": 2}
+    assert write_journal.pending_count() == 0
+
+
+def test_enqueue_rejects_with_503_at_max_pending(monkeypatch):
+    monkeypatch.setattr(settings, "WRITE_JOURNAL_MAX_PENDING", 2)
+    db = get_firestore_client()
+    _write(db, ("set", "prompts/a", {"n": 1}))
+    _write(db, ("set", "prompts/b", {"n": 1}))
+
+    with pytest.raises(write_journal.JournalBackpressure) as error:
+        _write(db, ("set", "prompts/c", {"n": 1}))
+    assert error.value.status_code == 503
+    assert "Retry-After" in error.value.headers
+    assert write_journal.pending_count() == 2
+
+    # replay frees room again
+    write_journal.replay_once()
+    _write(db, ("set", "prompts/c", {"n": 1}))
+
+
+def test_overlay_applies_pending_set_update_and_delete():
+    db = get_firestore_client()
+    db.document("prompts/a").set({"n": 1, "ratings": {"user": 2, "llm": 4}})
+
+    _write(db, ("update", "prompts/a", {"n": 2, "ratings.user": 5}))
+    assert write_journal.overlay("prompts/a", _stored(db, "prompts/a")) == {"n": 2, "ratings": {"user": 5, "llm": 4}}
+
+    batch = write_journal.JournalBatch()
+    batch.set(db.document("prompts/a"), {"ratings": {"llm": 1}}, merge=True)
+    batch.commit()
+    assert write_journal.overlay("prompts/a", _stored(db, "prompts/a")) == {"n": 2, "ratings": {"user": 5, "llm": 1}}
+
+    _write(db, ("set", "prompts/new", {"n": 1}))
+    assert write_journal.overlay("prompts/new", None) == {"n": 1}
+
+    _write(db, ("delete", "prompts/a", None))
+    assert write_journal.overlay("prompts/a", _stored(db, "prompts/a")) is None
+    # a set after the delete brings the document back with only the new fields
+    _write(db, ("set", "prompts/a", {"n": 9}))
+    assert write_journal.overlay("prompts/a", _stored(db, "prompts/a")) == {"n": 9}
+
+    assert sorted(write_journal.pending_paths("prompts/")) == ["prompts/a", "prompts/new"]
+    write_journal.replay_once()
+    assert write_journal.overlay("prompts/a", _stored(db, "prompts/a")) == {"n": 9}
+    assert write_journal.pending_paths("prompts/") == []
@@ -0,0 +1,82 @@
+"""
+Backfill zstd compression into existing prompt documents.
+
+Usage (from backend/):
+    python tools/backfill_compression.py --dry-run
+    python tools/backfill_compression.py --batch-size 200
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from services.firebase_db import get_firestore_client
+from services.prompt_repository import repository
+from services.compression import (
+    COMPRESSED_MAP_FIELDS,
+    COMPRESSED_TEXT_FIELDS,
+    compress_prompt_fields,
+    get_compression_stats,
+    is_available,
+)
+
+
+def backfill(batch_size: int = 200, dry_run: bool = False) -> dict:
+    """
+    Compress large text fields of every prompt document (PROMPT_LAYOUT decides where they live).
+
+    Documents are paged by document ID so the scan runs in constant memory,
+    and only documents that actually changed are rewritten.
+
+    Args:
+        batch_size: Documents per page and per batched commit (max 500)
+        dry_run: Only measure the savings, do not write
+
+    Returns:
+        Dictionary with scanned / updated document counts and byte savings
+    """
+    db = get_firestore_client()
+    prompts_ref = repository.all_prompts(db)
+    scanned = 0
+    updated = 0
+    last_doc = None
+
+    while True:
+        query = prompts_ref.order_by("__name__").limit(batch_size)
+        if last_doc is not None:
+            query = query.start_after(last_doc)
+        docs = list(query.stream())
+        if not docs:
+            break
+
+        batch = db.batch()
+        pending = 0
+        for doc in docs:
+            scanned += 1
+            data = doc.to_dict()
+            fields = {k: data[k] for k in COMPRESSED_TEXT_FIELDS + COMPRESSED_MAP_FIELDS if k in data}
+            before = dict(fields)
+            compress_prompt_fields(fields)
+            changed = {k: v for k, v in fields.items() if v != before[k]}
+            if changed:
+                updated += 1
+                pending += 1
+                batch.update(doc.reference, changed)
+
+        if pending and not dry_run:
+            batch.commit()
+        last_doc = docs[-1]
+        print(f"scanned={scanned} updated={updated}")
+
+    return {"scanned": scanned, "updated": updated, "dryRun": dry_run, **get_compression_stats()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compress large prompt text fields in Firestore")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    if not is_available():
+        sys.exit("zstandard is not installed or PROMPT_COMPRESSION_ENABLED is false")
+    print(backfill(batch_size=min(args.batch_size, 500), dry_run=args.dry_run))
@@ -0,0 +1,77 @@
+"""
+Backfill updatedAt into prompt documents written before history sync stamped it.
+
+Full /history loads order by updatedAt, and Firestore leaves documents without
+the field out of such a query, so those prompts would vanish from the history.
+
+Usage (from backend/):
+    python tools/backfill_updated_at.py --dry-run
+    python tools/backfill_updated_at.py --batch-size 200
+"""
+import argparse
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from services.firebase_db import get_firestore_client
+from services.prompt_repository import repository
+
+# for documents without createdAt either: sorts after every stamped prompt
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def backfill(batch_size: int = 200, dry_run: bool = False) -> dict:
+    """
+    Set updatedAt = createdAt on every prompt document that has no updatedAt
+    (PROMPT_LAYOUT decides where they live).
+
+    createdAt instead of the server timestamp: the prompts didn't change, so
+    clients syncing with a cursor don't download them again.
+
+    Args:
+        batch_size: Documents per page and per batched commit (max 500)
+        dry_run: Only count, do not write
+
+    Returns:
+        Dictionary with scanned / updated document counts
+    """
+    db = get_firestore_client()
+    prompts_ref = repository.all_prompts(db)
+    scanned = 0
+    updated = 0
+    last_doc = None
+
+    while True:
+        query = prompts_ref.order_by("__name__").limit(batch_size)
+        if last_doc is not None:
+            query = query.start_after(last_doc)
+        docs = list(query.stream())
+        if not docs:
+            break
+
+        batch = db.batch()
+        pending = 0
+        for doc in docs:
+            scanned += 1
+            data = doc.to_dict()
+            if data.get("updatedAt") is None:
+                updated += 1
+                pending += 1
+                batch.update(doc.reference, {"updatedAt": data.get("createdAt") or EPOCH})
+
+        if pending and not dry_run:
+            batch.commit()
+        last_doc = docs[-1]
+        print(f"scanned={scanned} updated={updated}")
+
+    return {"scanned": scanned, "updated": updated, "dryRun": dry_run}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Set a missing updatedAt on prompt documents to createdAt")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    print(backfill(batch_size=min(args.batch_size, 500), dry_run=args.dry_run))
@@ -0,0 +1,116 @@
+"""
+How many live-history WebSocket clients one worker holds, and how fast a change reaches them.
+
+Runs the app in-process under uvicorn with the fake listener source, opens
+--clients connections spread over --users users (so several tabs share a feed),
+then pushes --events changes per user and measures delivery latency. Memory is
+the process RSS growth per connection; the clients run in the same process, so
+it is an upper bound for the server side.
+
+Usage (from backend/):
+    python tools/bench_history_push.py --clients 2000 --users 500 --events 5
+"""
+import argparse
+import asyncio
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR.parent))
+os.environ["HISTORY_PUSH_SOURCE"] = "fake"
+
+
+def _rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _start_server(port: int):
+    import uvicorn
+    from backend.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+async def _run(args) -> None:
+    import orjson
+    import websockets
+    from backend.services.history_push import hub
+
+    # raise the worker limits so the benchmark measures capacity, not configuration
+    from backend.core.config import settings
+    settings.HISTORY_PUSH_MAX_CONNECTIONS = args.clients
+    settings.HISTORY_PUSH_MAX_LISTENERS = args.users
+    settings.HISTORY_PUSH_MAX_TABS = args.clients
+
+    server, thread = _start_server(args.port)
+    # the server runs its own loop; hub callbacks go to that loop
+    base = _rss_kb()
+
+    url = f"ws://127.0.0.1:{args.port}/api/v1/history/{{}}/live"
+    clients = []
+    start = time.perf_counter()
+    for i in range(args.clients):
+        ws = await websockets.connect(url.format(f"user-{i % args.users}"), max_size=None)
+        assert orjson.loads(await ws.recv())["type"] == "ready"
+        clients.append((i % args.users, ws))
+    connect_s = time.perf_counter() - start
+    rss = _rss_kb()
+
+    latencies = []
+    for event in range(args.events):
+        sent = {}
+        for user in range(args.users):
+            sent[user] = time.perf_counter()
+            hub.source.emit_prompt(f"user-{user}", {"promptID": f"p-{event}-{user}", "inputPrompt": "x"})
+
+        async def receive(user, ws):
+            message = orjson.loads(await ws.recv())
+            latencies.append((time.perf_counter() - sent[user]) * 1000)
+            return message
+
+        await asyncio.gather(*(receive(user, ws) for user, ws in clients))
+
+    for _, ws in clients:
+        await ws.close()
+    server.should_exit = True
+    thread.join(timeout=5)
+
+    latencies.sort()
+    print(f"clients: {args.clients}  users/listeners: {args.users}")
+    print(f"connect: {connect_s:.2f} s ({args.clients / connect_s:.0f} connections/s)")
+    print(f"rss growth: {(rss - base) / 1024:.1f} MB ({(rss - base) / args.clients:.1f} KB per connection)")
+    print(
+        f"delivery latency ms: p50 {statistics.median(latencies):.2f}  "
+        f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.2f}  max {latencies[-1]:.2f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=250)
+    parser.add_argument("--events", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
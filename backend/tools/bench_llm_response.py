@@ -0,0 +1,52 @@
+"""
+Microbenchmark: per-request CPU spent turning a completion into a response.
+
+Compares the old path (json.loads(response.to_json()) + stock JSONResponse)
+with LLMResult.from_completion + ORJSONResponse, using the sample completion
+in services/sample_nebius_ai_output.txt.
+
+Usage (from backend/):
+    python tools/bench_llm_response.py --iterations 20000
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from timeit import timeit
+
+from fastapi.responses import JSONResponse
+from openai.types.chat import ChatCompletion
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from core.responses import ORJSONResponse
+from services.nebius_ai import LLMResult
+
+SAMPLE_PATH = Path(__file__).resolve().parent.parent / "services" / "sample_nebius_ai_output.txt"
+
+
+def old_path(completion: ChatCompletion) -> bytes:
+    response = json.loads(completion.to_json())
+    content = response["choices"][0]["message"]["content"]
+    prompt_tokens = response.get("usage").get("prompt_tokens", 0)
+    return JSONResponse({"content": content, "promptTokens": prompt_tokens, "raw": response}).body
+
+
+def new_path(completion: ChatCompletion) -> bytes:
+    result = LLMResult.from_completion(completion, latency_ms=0.0)
+    return ORJSONResponse({"content": result.content, "promptTokens": result.usage["prompt_tokens"], "raw": result.to_dict()}).body
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark completion -> HTTP body conversion")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    completion = ChatCompletion.model_validate(json.loads(SAMPLE_PATH.read_text()))
+
+    old_s = timeit(lambda: old_path(completion), number=args.iterations)
+    new_s = timeit(lambda: new_path(completion), number=args.iterations)
+    old_us = old_s / args.iterations * 1e6
+    new_us = new_s / args.iterations * 1e6
+    print(f"json round-trip + JSONResponse : {old_us:8.2f} us/request")
+    print(f"LLMResult + ORJSONResponse      : {new_us:8.2f} us/request")
+    print(f"saved                           : {old_us - new_us:8.2f} us/request ({(1 - new_us / old_us) * 100:.1f}%)")
@@ -0,0 +1,112 @@
+"""
+Compare the stock gunicorn launch with server.py (preloaded, warmed master).
+
+Starts each server with the same number of workers, measures proportional
+set size (PSS, Linux only) per worker after warmup and requests/sec on `/`.
+
+Usage (from backend/):
+    python tools/bench_server.py --workers 4 --seconds 10 --clients 32
+"""
+import argparse
+import http.client
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+REPO_ROOT = BACKEND_DIR.parent
+
+
+def _pss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _children(pid: int) -> list[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def _wait_ready(port: int, timeout: float = 60) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not become ready")
+
+
+def _load(port: int, seconds: float, clients: int) -> float:
+    counts = [0] * clients
+    stop_at = time.time() + seconds
+
+    def client(index: int):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        while time.time() < stop_at:
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            counts[index] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / seconds
+
+
+def run(name: str, command: list[str], cwd: Path, port: int, workers: int, seconds: float, clients: int) -> dict:
+    env = dict(os.environ, PORT=str(port), SERVER_WORKERS=str(workers))
+    env.setdefault("NEBIUS_API_KEY", "bench")
+    process = subprocess.Popen(command, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_ready(port)
+        time.sleep(2)  # let every worker finish its lifespan warmup
+        worker_pss = [_pss_kb(pid) for pid in _children(process.pid)]
+        rps = _load(port, seconds, clients)
+        return {
+            "name": name,
+            "masterPssMB": _pss_kb(process.pid) / 1024,
+            "workerPssMB": (sum(worker_pss) / len(worker_pss) / 1024) if worker_pss else 0.0,
+            "totalPssMB": (_pss_kb(process.pid) + sum(worker_pss)) / 1024,
+            "rps": rps,
+        }
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory and throughput of stock gunicorn vs server.py")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    results = [
+        run("gunicorn default", [sys.executable, "-m", "gunicorn", "-k", "uvicorn.workers.UvicornWorker",
+                                 "-w", str(args.workers), "-b", f"127.0.0.1:{args.port}", "backend.main:app"],
+            REPO_ROOT, args.port, args.workers, args.seconds, args.clients),
+        run("server.py", [sys.executable, "server.py"], BACKEND_DIR, args.port + 1, args.workers, args.seconds, args.clients),
+    ]
+    print(f"{'launcher':<18} {'master MB':>10} {'per worker MB':>14} {'total MB':>10} {'req/s':>10}")
+    for r in results:
+        print(f"{r['name']:<18} {r['masterPssMB']:>10.1f} {r['workerPssMB']:>14.1f} {r['totalPssMB']:>10.1f} {r['rps']:>10.0f}")
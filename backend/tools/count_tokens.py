@@ -0,0 +1,346 @@
+"""
+Token statistics over prompt corpora and history exports.
+
+Library:
+    count(prompt)                 tokens of one text
+    count_paths(paths, ...)       per-record counts for files / directories, streamed
+    TokenStats                    aggregate (percentiles, power-of-two histogram)
+
+Files are read through mmap and cut into newline-aligned byte spans. Worker
+processes map the files themselves, so only (path, start, end) crosses the
+process boundary, and each worker keeps its encoder loaded for the whole run.
+
+Formats: "ndjson" (one JSON object per line, e.g. /history/{user_id}/export),
+"lines" (one text per line), "text" (one text per file); "auto" picks ndjson
+for .ndjson / .jsonl files and text otherwise.
+
+Usage (from backend/):
+    python tools/count_tokens.py export.ndjson --field inputPrompt --field variants.optimizedPrompt
+    python tools/count_tokens.py corpus/ --format text --workers 8 --out counts.ndjson --summary summary.json
+    python tools/count_tokens.py prompts.txt --format lines --model openai/gpt-oss-20b
+"""
+import argparse
+import mmap
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import orjson
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from services.token_counter import DEFAULT_ENCODING, get_encoding
+from services.model_registry import encoding_for
+
+SPAN_BYTES = 4 * 1024 * 1024
+TEXT_FIELD = "text"
+
+
+def count(prompt: str, encoding: str = DEFAULT_ENCODING) -> dict:
+    """
+    Count the tokens of one prompt.
+
+    Returns:
+        {"prompt", "token_count", "tokens"} with tokens as decoded strings
+    """
+    enc = get_encoding(encoding)
+    token_ids = enc.encode_ordinary(prompt)
+    return {
+        "prompt": prompt,
+        "token_count": len(token_ids),
+        "tokens": [enc.decode_single_token_bytes(t).decode("utf-8", errors="replace") for t in token_ids],
+    }
+
+
+class TokenStats:
+    """Exact percentiles from a value -> frequency table (token counts repeat a lot)"""
+
+    def __init__(self):
+        self.values = Counter()
+
+    def add(self, tokens: int) -> None:
+        self.values[tokens] += 1
+
+    def merge(self, other: "TokenStats") -> None:
+        self.values.update(other.values)
+
+    def percentile(self, fraction: float) -> int:
+        target = max(1, round(sum(self.values.values()) * fraction))
+        seen = 0
+        for value in sorted(self.values):
+            seen += self.values[value]
+            if seen >= target:
+                return value
+        return 0
+
+    def histogram(self) -> dict:
+        """Records per power-of-two bucket, keyed by the bucket's upper bound"""
+        buckets = Counter()
+        for value, frequency in self.values.items():
+            buckets[1 << max(value - 1, 0).bit_length() if value else 0] += frequency
+        return {f"<={bound}": buckets[bound] for bound in sorted(buckets)}
+
+    def summary(self) -> dict:
+        records = sum(self.values.values())
+        total = sum(value * frequency for value, frequency in self.values.items())
+        if not records:
+            return {"records": 0, "total": 0}
+        return {
+            "records": records,
+            "total": total,
+            "mean": round(total / records, 2),
+            "min": min(self.values),
+            "p50": self.percentile(0.50),
+            "p90": self.percentile(0.90),
+            "p99": self.percentile(0.99),
+            "max": max(self.values),
+            "histogram": self.histogram(),
+        }
+
+
+def resolve_format(path: Path, fmt: str) -> str:
+    if fmt != "auto":
+        return fmt
+    return "ndjson" if path.suffix in (".ndjson", ".jsonl") else "text"
+
+
+def iter_files(paths: Iterable[str]) -> Iterator[Path]:
+    for path in map(Path, paths):
+        if path.is_dir():
+            yield from sorted(p for p in path.rglob("*") if p.is_file())
+        else:
+            yield path
+
+
+def iter_spans(path: Path, fmt: str, span_bytes: int = SPAN_BYTES) -> Iterator[tuple[str, int, int]]:
+    """Newline-aligned (path, start, end) byte ranges; a text file is a single span"""
+    size = path.stat().st_size
+    if size == 0:
+        return
+    if fmt == "text":
+        yield str(path), 0, size
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < size:
+            end = min(start + span_bytes, size)
+            if end < size:
+                newline = mm.find(b"\n", end - 1)
+                end = size if newline == -1 else newline + 1
+            yield str(path), start, end
+            start = end
+
+
+def _tasks(paths: Iterable[str], fmt: str, span_bytes: int) -> Iterator[list]:
+    """Group spans (many small files or slices of a big one) into tasks of about span_bytes"""
+    task, size = [], 0
+    for path in iter_files(paths):
+        file_format = resolve_format(path, fmt)
+        for source, start, end in iter_spans(path, file_format, span_bytes):
+            task.append((source, start, end, file_format))
+            size += end - start
+            if size >= span_bytes:
+                yield task
+                task, size = [], 0
+    if task:
+        yield task
+
+
+def _field_texts(record, field: str) -> list[str]:
+    """Strings at a dotted field path; lists on the way are walked (variants.optimizedPrompt)"""
+    values = [record]
+    for part in field.split("."):
+        next_values = []
+        for value in values:
+            if isinstance(value, list):
+                next_values.extend(v.get(part) for v in value if isinstance(v, dict))
+            elif isinstance(value, dict):
+                next_values.append(value.get(part))
+        values = next_values
+    texts = []
+    for value in values:
+        if isinstance(value, str):
+            texts.append(value)
+        elif isinstance(value, list):
+            texts.extend(v for v in value if isinstance(v, str))
+    return texts
+
+
+# per worker process: settings from the initializer and the mapped file
+_worker = {}
+
+
+def _init_worker(encoding: str, fields: tuple, id_field: Optional[str]) -> None:
+    _worker.update(encoder=get_encoding(encoding), fields=fields, id_field=id_field, path=None, mm=None)
+
+
+def _mapped(path: str):
+    if _worker["path"] != path:
+        if _worker["mm"] is not None:
+            _worker["mm"].close()
+        with open(path, "rb") as f:
+            _worker["mm"] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _worker["path"] = path
+    return _worker["mm"]
+
+
+def _count_text(text: str) -> int:
+    # encode_ordinary: corpus text containing "<|endoftext|>" is counted, not rejected
+    return len(_worker["encoder"].encode_ordinary(text))
+
+
+def _count_task(task: list) -> list:
+    """Count one task's spans; per span the number of lines and the records with their line offset"""
+    results = []
+    for source, start, end, fmt in task:
+        mm = _mapped(source)
+        records = []
+        if fmt == "text":
+            text = mm[start:end].decode("utf-8", errors="replace")
+            records.append((0, None, {TEXT_FIELD: _count_text(text)}))
+            results.append((source, 1, records))
+            continue
+
+        line, position = 0, start
+        while position < end:
+            newline = mm.find(b"\n", position, end)
+            stop = end if newline == -1 else newline
+            raw = mm[position:stop].strip()
+            position = stop + 1
+            line += 1
+            if not raw:
+                continue
+            if fmt == "lines":
+                records.append((line - 1, None, {TEXT_FIELD: _count_text(raw.decode("utf-8", errors="replace"))}))
+                continue
+            try:
+                record = orjson.loads(raw)
+            except orjson.JSONDecodeError:
+                records.append((line - 1, None, None))
+                continue
+            record_id = record.get(_worker["id_field"]) if isinstance(record, dict) and _worker["id_field"] else None
+            counts = {field: sum(_count_text(t) for t in _field_texts(record, field)) for field in _worker["fields"]}
+            records.append((line - 1, record_id, counts))
+        results.append((source, line, records))
+    return results
+
+
+def count_paths(
+    paths: Iterable[str],
+    fmt: str = "auto",
+    fields: Iterable[str] = ("inputPrompt",),
+    id_field: Optional[str] = "promptID",
+    encoding: str = DEFAULT_ENCODING,
+    workers: Optional[int] = None,
+    span_bytes: int = SPAN_BYTES,
+) -> Iterator[dict]:
+    """
+    Stream per-record token counts, in input order.
+
+    Args:
+        paths: Files and / or directories (searched recursively)
+        fmt: "auto", "ndjson", "lines" or "text"
+        fields: NDJSON fields to count (dotted paths); text formats count the whole record
+        id_field: NDJSON field copied to the output as "id"
+        encoding: tiktoken encoding
+        workers: Worker processes (default: CPU count, 1 = in this process)
+        span_bytes: Approximate bytes of input per worker task
+
+    Yields:
+        {"source", "line", "id", "tokens": {field: count}}; "error" instead of
+        "tokens" for lines that aren't valid JSON
+    """
+    fields = tuple(fields)
+    tasks = _tasks(paths, fmt, span_bytes)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(encoding, fields, id_field)
+        results = map(_count_task, tasks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(encoding, fields, id_field))
+        # map submits every task up front, which is cheap: a task is only a list of byte ranges
+        results = executor.map(_count_task, tasks)
+    try:
+        lines_before = {}
+        for task_result in results:
+            for source, lines, records in task_result:
+                base = lines_before.get(source, 0)
+                for offset, record_id, counts in records:
+                    item = {"source": source, "line": base + offset + 1, "id": record_id}
+                    if counts is None:
+                        item["error"] = "invalid JSON"
+                    else:
+                        item["tokens"] = counts
+                    yield item
+                lines_before[source] = base + lines
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        elif _worker.get("mm") is not None:
+            _worker["mm"].close()
+            _worker.update(path=None, mm=None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="files or directories")
+    parser.add_argument("--format", default="auto", choices=["auto", "ndjson", "lines", "text"])
+    parser.add_argument("--field", action="append", help="NDJSON field to count, repeatable (default: inputPrompt)")
+    parser.add_argument("--id-field", default="promptID")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--encoding", default=DEFAULT_ENCODING)
+    group.add_argument("--model", help="use the model's encoding from services/model_registry.py")
+    parser.add_argument("--workers", type=int, default=None, help="default: CPU count")
+    parser.add_argument("--span-mb", type=float, default=SPAN_BYTES / 1024 / 1024)
+    parser.add_argument("--out", help="write per-record counts as NDJSON ('-' for stdout)")
+    parser.add_argument("--summary", help="write the aggregate summary as JSON")
+    args = parser.parse_args()
+
+    encoding = encoding_for(args.model) if args.model else args.encoding
+    fields = tuple(args.field or ["inputPrompt"])
+    stats: dict[str, TokenStats] = {}
+    errors = 0
+    out = None
+    if args.out == "-":
+        out = sys.stdout.buffer
+    elif args.out:
+        out = open(args.out, "wb")
+    try:
+        for item in count_paths(
+            args.paths, args.format, fields, args.id_field, encoding, args.workers, int(args.span_mb * 1024 * 1024)
+        ):
+            if out is not None:
+                out.write(orjson.dumps(item) + b"\n")
+            if "error" in item:
+                errors += 1
+                continue
+            for field, tokens in item["tokens"].items():
+                stats.setdefault(field, TokenStats()).add(tokens)
+    finally:
+        if out is not None and out is not sys.stdout.buffer:
+            out.close()
+
+    summary = {"encoding": encoding, "invalidRecords": errors, "fields": {f: s.summary() for f, s in stats.items()}}
+    report = sys.stderr if args.out == "-" else sys.stdout
+    print(f"encoding: {encoding}  invalid records: {errors}", file=report)
+    for field, field_summary in summary["fields"].items():
+        print(f"\n{field}: {field_summary['records']} records, {field_summary['total']} tokens", file=report)
+        if field_summary["records"]:
+            print(
+                f"  mean {field_summary['mean']}  min {field_summary['min']}  p50 {field_summary['p50']}  "
+                f"p90 {field_summary['p90']}  p99 {field_summary['p99']}  max {field_summary['max']}",
+                file=report,
+            )
+            peak = max(field_summary["histogram"].values())
+            for bucket, frequency in field_summary["histogram"].items():
+                print(f"  {bucket:>10} {frequency:>9}  {'#' * max(1, round(frequency / peak * 40))}", file=report)
+    if args.summary:
+        with open(args.summary, "wb") as f:
+            f.write(orjson.dumps(summary, option=orjson.OPT_INDENT_2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Import-time profile of the API app (python -X importtime).
+
+Usage (from repo root or backend/):
+    python backend/tools/import_profile.py --top 15
+"""
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent.parent
+
+
+def profile_import(module: str = "backend.main") -> list[tuple[str, int, int]]:
+    """
+    Import `module` in a fresh interpreter and collect importtime samples.
+
+    Returns:
+        List of (module name, self microseconds, cumulative microseconds)
+    """
+    env = dict(os.environ, NEBIUS_API_KEY=os.environ.get("NEBIUS_API_KEY", "profile"))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    samples = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # keep the nesting indentation, only drop the separator space
+        samples.append((name[1:].rstrip(), int(self_us), int(cumulative_us)))
+    return samples
+
+
+def self_time_by_package(samples: list[tuple[str, int, int]]) -> dict[str, int]:
+    """Sum of self import time per top-level package (no double counting of nested imports)"""
+    totals = {}
+    for name, self_us, _ in samples:
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report import time of the API app")
+    parser.add_argument("--module", default="backend.main")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    samples = profile_import(args.module)
+    totals = self_time_by_package(samples)
+    print(f"total import time: {sum(totals.values()) / 1000:.1f} ms ({len(samples)} modules)")
+    for package, micros in sorted(totals.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {package:<30} {micros / 1000:8.1f} ms")
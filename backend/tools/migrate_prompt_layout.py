@@ -0,0 +1,252 @@
+"""
+Copy prompts from the flat `prompts` collection into the nested per-user layout
+(users/{uid}/projects/{pid}/prompts/{promptID}) and verify the copy.
+
+Cutover, with no downtime:
+    1. deploy with PROMPT_DUAL_WRITE=true (PROMPT_LAYOUT still "flat"): new
+       writes go to both layouts
+    2. python tools/migrate_prompt_layout.py copy       (resumable, see --checkpoint)
+    3. python tools/migrate_prompt_layout.py verify --repair
+       (re-copies documents a write raced with during step 2 and deletes
+       nested copies whose flat prompt was deleted meanwhile)
+    4. deploy with PROMPT_LAYOUT=nested: reads move to the nested layout,
+       writes still go to both, so rolling back is a config change
+    5. deploy with PROMPT_DUAL_WRITE=false; delete the flat collection later
+
+Usage (from backend/):
+    python tools/migrate_prompt_layout.py copy --page-size 1000 --workers 8
+    python tools/migrate_prompt_layout.py verify --repair
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from core.config import settings
+from services.firebase_db import get_firestore_client
+from services.prompt_repository import (
+    DEFAULT_PROJECT,
+    FLAT_COLLECTION,
+    LOCATION_COLLECTION,
+    nested_collection,
+    project_marker,
+)
+
+# three writes per prompt (document, location, project marker) under the 500-write batch limit
+DOCS_PER_BATCH = 160
+DEFAULT_CHECKPOINT = "migrate_prompt_layout.checkpoint.json"
+
+
+def _owner(data: dict) -> tuple[str, str]:
+    return data.get("userID") or "", data.get("projectID") or DEFAULT_PROJECT
+
+
+def _copy_writes(db, batch, docs) -> None:
+    from firebase_admin import firestore
+
+    markers = set()
+    for doc in docs:
+        data = doc.to_dict()
+        user_id, project_id = _owner(data)
+        batch.set(nested_collection(db, user_id, project_id).document(doc.id), data)
+        batch.set(db.collection(LOCATION_COLLECTION).document(doc.id), {"userID": user_id, "projectID": project_id})
+        if (user_id, project_id) not in markers:
+            markers.add((user_id, project_id))
+            batch.set(project_marker(db, user_id, project_id),
+                      {"projectID": project_id, "updatedAt": firestore.SERVER_TIMESTAMP}, merge=True)
+
+
+def _commit_copies(db, docs) -> None:
+    """
+    Copy `docs` as they are now: a prompt deleted (by dual write, which also deletes
+    its nested copy) since its page was read is skipped instead of brought back.
+    """
+    current = [snapshot for snapshot in db.get_all([doc.reference for doc in docs]) if snapshot.exists]
+    if not current:
+        return
+    batch = db.batch()
+    _copy_writes(db, batch, current)
+    batch.commit()
+
+
+def _pages(query, page_size: int, after=None):
+    """Documents of `query` by path, one page at a time, the next page read while the caller works"""
+
+    def read(after):
+        page = query.order_by("__name__").limit(page_size)
+        if after is not None:
+            page = page.start_after(after)
+        return list(page.stream())
+
+    with ThreadPoolExecutor(max_workers=1) as reader:
+        pending = reader.submit(read, after)
+        while True:
+            docs = pending.result()
+            if not docs:
+                return
+            if len(docs) == page_size:
+                pending = reader.submit(read, docs[-1])
+            yield docs
+            if len(docs) < page_size:
+                return
+
+
+def _load_checkpoint(path: Path) -> dict:
+    if path.exists():
+        return json.loads(path.read_text())
+    return {"lastID": None, "copied": 0}
+
+
+def _save_checkpoint(path: Path, state: dict) -> None:
+    # write-then-rename: an interrupted run never leaves a half-written checkpoint
+    temporary = path.with_suffix(path.suffix + ".tmp")
+    temporary.write_text(json.dumps(state))
+    os.replace(temporary, path)
+
+
+def copy(page_size: int = 1000, workers: int = 8, checkpoint: Path = Path(DEFAULT_CHECKPOINT)) -> dict:
+    """
+    Copy every flat prompt to the nested layout, resuming after the last checkpointed page.
+
+    Batches of one page are committed in parallel; the checkpoint moves only
+    once all of them succeeded, so a crash re-copies at most one page (copies
+    are idempotent).
+
+    Returns:
+        Dictionary with copied document count, elapsed seconds and docs/s
+    """
+    db = get_firestore_client()
+    state = _load_checkpoint(checkpoint)
+    started = time.perf_counter()
+    copied_now = 0
+
+    flat = db.collection(FLAT_COLLECTION)
+    # resuming: the cursor only needs the reference, so a since deleted document works too
+    after = flat.document(state["lastID"]).get() if state["lastID"] else None
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for docs in _pages(flat, page_size, after):
+            chunks = [docs[i:i + DOCS_PER_BATCH] for i in range(0, len(docs), DOCS_PER_BATCH)]
+            for future in [pool.submit(_commit_copies, db, chunk) for chunk in chunks]:
+                future.result()
+            copied_now += len(docs)
+            state = {"lastID": docs[-1].id, "copied": state["copied"] + len(docs)}
+            _save_checkpoint(checkpoint, state)
+            elapsed = time.perf_counter() - started
+            print(f"copied={state['copied']} last={state['lastID']} rate={copied_now / elapsed:.0f}/s")
+
+    elapsed = time.perf_counter() - started
+    return {"copied": state["copied"], "copiedThisRun": copied_now, "elapsedS": round(elapsed, 1),
+            "docsPerS": round(copied_now / elapsed, 1) if elapsed else None}
+
+
+def _delete_orphans(db, docs) -> None:
+    """Delete nested copies and their location documents (when they still point to them)"""
+    locations = [db.collection(LOCATION_COLLECTION).document(doc.id) for doc in docs]
+    pointing = {snapshot.id: snapshot.to_dict() for snapshot in db.get_all(locations) if snapshot.exists}
+    batch = db.batch()
+    for doc, location in zip(docs, locations):
+        batch.delete(doc.reference)
+        if pointing.get(doc.id) == dict(zip(("userID", "projectID"), _owner(doc.to_dict()))):
+            batch.delete(location)
+    batch.commit()
+
+
+def _find_orphans(db, page_size: int, after, repair: bool) -> tuple[int, list[str]]:
+    """
+    Nested copies whose flat prompt no longer exists (deleted after `copy` read its page).
+
+    The collection group also matches the flat collection, whose paths sort first,
+    so the scan starts after the last flat document.
+
+    Returns:
+        (checked nested copies, orphan IDs)
+    """
+    checked, orphans = 0, []
+    for docs in _pages(db.collection_group("prompts"), page_size, after):
+        # flat prompts/{id} documents still in the group (deleted or added since the flat scan)
+        docs = [doc for doc in docs if doc.reference.path.count("/") > 1]
+        flat = {snapshot.id for snapshot in db.get_all([db.collection(FLAT_COLLECTION).document(doc.id) for doc in docs])
+                if snapshot.exists}
+        found = [doc for doc in docs if doc.id not in flat]
+        checked += len(docs)
+        orphans += [doc.id for doc in found]
+        if repair and found:
+            for start in range(0, len(found), DOCS_PER_BATCH):
+                _delete_orphans(db, found[start:start + DOCS_PER_BATCH])
+        print(f"nested checked={checked} orphans={len(orphans)}")
+    return checked, orphans
+
+
+def verify(page_size: int = 500, repair: bool = False, workers: int = 8) -> dict:
+    """
+    Compare every flat prompt with its nested copy, then every nested copy with its flat prompt.
+
+    A copy is missing when it doesn't exist and stale when its updatedAt differs.
+    It is an orphan when its flat prompt is gone: deleted after `copy` read it.
+    With repair missing and stale copies are copied again and orphans are deleted;
+    orphans are only deleted while PROMPT_DUAL_WRITE=true, since with dual write
+    off nested-only prompts are legitimate.
+
+    Returns:
+        Dictionary with checked / missing / stale / orphan / repaired counts and sample IDs
+    """
+    db = get_firestore_client()
+    checked = 0
+    missing, stale = [], []
+    repaired = 0
+    last = None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for docs in _pages(db.collection(FLAT_COLLECTION), page_size):
+            last = docs[-1]
+            refs = [nested_collection(db, *_owner(doc.to_dict())).document(doc.id) for doc in docs]
+            copies = {snapshot.reference.path: snapshot for snapshot in db.get_all(refs)}
+            broken = []
+            for doc, ref in zip(docs, refs):
+                nested = copies.get(ref.path)
+                if nested is None or not nested.exists:
+                    missing.append(doc.id)
+                    broken.append(doc)
+                elif (nested.to_dict() or {}).get("updatedAt") != doc.to_dict().get("updatedAt"):
+                    stale.append(doc.id)
+                    broken.append(doc)
+            checked += len(docs)
+            if repair and broken:
+                chunks = [broken[i:i + DOCS_PER_BATCH] for i in range(0, len(broken), DOCS_PER_BATCH)]
+                for future in [pool.submit(_commit_copies, db, chunk) for chunk in chunks]:
+                    future.result()
+                repaired += len(broken)
+            print(f"checked={checked} missing={len(missing)} stale={len(stale)}")
+
+    delete_orphans = repair and settings.PROMPT_DUAL_WRITE
+    if repair and not delete_orphans:
+        print("PROMPT_DUAL_WRITE is off: orphans are reported, not deleted")
+    nested_checked, orphans = _find_orphans(db, page_size, last, delete_orphans)
+
+    return {"checked": checked, "missing": len(missing), "stale": len(stale), "repaired": repaired,
+            "nestedChecked": nested_checked, "orphans": len(orphans),
+            "orphansDeleted": len(orphans) if delete_orphans else 0,
+            "missingSample": missing[:20], "staleSample": stale[:20], "orphanSample": orphans[:20]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate prompts to the nested per-user layout")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    copy_parser = subcommands.add_parser("copy", help="copy flat prompts to the nested layout")
+    copy_parser.add_argument("--page-size", type=int, default=1000)
+    copy_parser.add_argument("--workers", type=int, default=8)
+    copy_parser.add_argument("--checkpoint", type=Path, default=Path(DEFAULT_CHECKPOINT))
+    verify_parser = subcommands.add_parser("verify", help="compare both layouts")
+    verify_parser.add_argument("--page-size", type=int, default=500)
+    verify_parser.add_argument("--workers", type=int, default=8)
+    verify_parser.add_argument("--repair", action="store_true", help="re-copy missing / stale documents")
+    args = parser.parse_args()
+
+    if args.command == "copy":
+        print(copy(page_size=args.page_size, workers=args.workers, checkpoint=args.checkpoint))
+    else:
+        print(verify(page_size=args.page_size, repair=args.repair, workers=args.workers))
@@ -0,0 +1,35 @@
+"""
+Recompute analytics aggregates from the prompts collection.
+
+Usage (from backend/):
+    python tools/rebuild_analytics.py --user <user_id>
+    python tools/rebuild_analytics.py --all
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from services.firebase_db import get_firestore_client
+from services.prompt_repository import repository
+from services.analytics import rebuild_user_analytics, summarize
+
+
+def all_user_ids() -> set[str]:
+    """Distinct userIDs found in the prompts collection"""
+    db = get_firestore_client()
+    return {doc.to_dict().get("userID") for doc in repository.all_prompts(db).select(["userID"]).stream()} - {None, ""}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild per-user analytics aggregates")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--user")
+    group.add_argument("--all", action="store_true")
+    args = parser.parse_args()
+
+    user_ids = sorted(all_user_ids()) if args.all else [args.user]
+    for user_id in user_ids:
+        counters = rebuild_user_analytics(user_id)
+        total = summarize(counters.get("total", {}))
+        print(f"{user_id}: prompts={total['prompts']} variants={total['variants']} tokensSaved={total['tokensSaved']}")
@@ -0,0 +1,318 @@
+"""
+Re-run parse and/or optimize on stored prompts under a system prompt version
+(schemas/prompt.py SYSTEM_PROMPT_VERSIONS), to compare versions at scale after
+a rubric or optimize prompt change.
+
+Results are added next to what is stored, tagged with the version:
+- parse:    parsedVersions[<version>] = {parsedData, overallScores, usage};
+            the live parsedData / overallScores are left alone
+- optimize: a new variant, ID uuid5(promptID/version/model), with
+            promptVersions[<variantID>] = <version>
+
+Prompts are streamed in document order one page at a time and processed by
+--concurrency threads, with LLM steps started at most --rate per second. The
+checkpoint (cursor and running totals) moves once a whole page is written, so
+a resumed run redoes at most one page. Prompts that already have results for
+the version are skipped without LLM calls, which also makes a run with a fresh
+checkpoint a cheap retry of the prompts that failed.
+
+Against the local stand-ins (nothing leaves the process):
+    FIRESTORE_BACKEND=fake LLM_BACKEND=fake python tools/reoptimize_history.py --version v1 --seed 200
+
+Usage (from backend/):
+    python tools/reoptimize_history.py --version v2 --steps parse,optimize --concurrency 8 --rate 5
+    python tools/reoptimize_history.py --version v2 --user <uid> --limit 100 --max-tokens 2000000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import perf_counter
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from core.config import settings
+from schemas.prompt import PromptDBModel, ParsedPrompt, PARSED_COMPONENTS, system_prompts
+from services.firebase_db import get_firestore_client
+from services.model_registry import get_model
+from services.prompt_repository import repository
+
+STEPS = ("parse", "optimize")
+MAX_FAILED_IDS = 1000
+
+
+class RateLimiter:
+    """Spaces acquire() calls at least 1 / rate seconds apart across threads (rate <= 0: unlimited)"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+
+def variant_id(prompt_id: str, version: str, model: str) -> str:
+    """Same ID on every run, so a redone page replaces its variants instead of adding more"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{prompt_id}/{version}/{model}"))
+
+
+def _baseline_tokens(prompt: PromptDBModel, model: str, version: str) -> Optional[int]:
+    """finalTokenSize of the latest variant not made with `version`, preferring the same model"""
+    older = [vid for vid in prompt.optimizedPrompts if prompt.promptVersions.get(vid) != version]
+    same_model = [vid for vid in older if prompt.usedLLMs.get(vid) == model]
+    for candidates in (same_model, older):
+        for vid in reversed(candidates):
+            if vid in prompt.finalTokenSizes:
+                return prompt.finalTokenSizes[vid]
+    return None
+
+
+def reoptimize(data: dict, version: str, steps: tuple, model: str, limiter: RateLimiter) -> dict:
+    """
+    Run the missing steps for one prompt and write the results.
+
+    Returns:
+        {"skipped", "usage": [usage dicts], "scoreDelta", "tokenDelta"}
+
+    Raises:
+        RuntimeError: The write failed
+    """
+    prompt = PromptDBModel.from_firestore_dict(data)
+    result = {"skipped": False, "usage": [], "scoreDelta": None, "tokenDelta": None}
+    updates = {}
+
+    if "parse" in steps and version not in prompt.parsedVersions:
+        # parse a copy: the live parsedData / overallScores / token sizes stay as they are
+        candidate = prompt.model_copy(deep=True)
+        limiter.acquire()
+        parsed = candidate.get_parsed_data_and_scores_from_llm_returns_score(ai_model=model, version=version)
+        prompt.parsedVersions[version] = {
+            "parsedData": parsed["parsedData"],
+            "overallScores": parsed["overallScores"],
+            "usage": parsed["usage"],
+        }
+        updates["parsedVersions"] = prompt.parsedVersions
+        result["usage"].append(parsed["usage"])
+        if isinstance(prompt.overallScores, (int, float)) and parsed["overallScores"] is not None:
+            result["scoreDelta"] = parsed["overallScores"] - prompt.overallScores
+
+    new_variant_id = variant_id(prompt.promptID, version, model)
+    if "optimize" in steps and new_variant_id not in prompt.optimizedPrompts:
+        baseline = _baseline_tokens(prompt, model, version)
+        limiter.acquire()
+        variant = prompt.generate_optimized_variant(ai_model=model, version=version)
+        variant["optimizedPromptID"] = new_variant_id
+        prompt.add_optimized_variant(variant)
+        updates.update({
+            "optimizedPrompts": prompt.optimizedPrompts,
+            "finalTokenSizes": prompt.finalTokenSizes,
+            "usedLLMs": prompt.usedLLMs,
+            "latencyMs": prompt.latencyMs,
+            "completionUsage": prompt.completionUsage,
+            "promptVersions": prompt.promptVersions,
+        })
+        result["usage"].append(variant["usage"])
+        if baseline is not None:
+            result["tokenDelta"] = variant["finalTokenSize"] - baseline
+
+    if not updates:
+        result["skipped"] = True
+        return result
+    prompt.update_in_firestore(updates)
+    return result
+
+
+def _empty_stats() -> dict:
+    return {
+        "processed": 0, "skipped": 0, "failed": 0, "llmCalls": 0,
+        "promptTokens": 0, "completionTokens": 0, "reasoningTokens": 0, "totalTokens": 0, "costUsd": 0.0,
+        "scoreDeltaSum": 0.0, "scoreDeltas": 0, "scoreImproved": 0, "scoreRegressed": 0,
+        "tokenDeltaSum": 0, "tokenDeltas": 0, "elapsedS": 0.0,
+    }
+
+
+def _add(stats: dict, result: dict, model: str) -> None:
+    if result["skipped"]:
+        stats["skipped"] += 1
+        return
+    stats["processed"] += 1
+    info = get_model(model)
+    for usage in result["usage"]:
+        stats["llmCalls"] += usage.get("calls", 1)
+        stats["promptTokens"] += usage.get("prompt_tokens", 0)
+        stats["completionTokens"] += usage.get("completion_tokens", 0)
+        stats["reasoningTokens"] += usage.get("reasoning_tokens", 0)
+        stats["totalTokens"] += usage.get("total_tokens", 0)
+        stats["costUsd"] += info.cost(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+    if result["scoreDelta"] is not None:
+        stats["scoreDeltaSum"] += result["scoreDelta"]
+        stats["scoreDeltas"] += 1
+        stats["scoreImproved"] += result["scoreDelta"] > 0
+        stats["scoreRegressed"] += result["scoreDelta"] < 0
+    if result["tokenDelta"] is not None:
+        stats["tokenDeltaSum"] += result["tokenDelta"]
+        stats["tokenDeltas"] += 1
+
+
+def summarize(stats: dict) -> dict:
+    """Throughput, token spend and deltas against the stored results"""
+    elapsed = stats["elapsedS"]
+    return {
+        "processed": stats["processed"],
+        "skipped": stats["skipped"],
+        "failed": stats["failed"],
+        "elapsedS": round(elapsed, 1),
+        "promptsPerS": round(stats["processed"] / elapsed, 2) if elapsed else None,
+        "llmCalls": stats["llmCalls"],
+        "tokens": {key: stats[f"{key}Tokens"] for key in ("prompt", "completion", "reasoning", "total")},
+        "tokensPerS": round(stats["totalTokens"] / elapsed) if elapsed else None,
+        "costUsd": round(stats["costUsd"], 4),
+        "avgScoreDelta": round(stats["scoreDeltaSum"] / stats["scoreDeltas"], 3) if stats["scoreDeltas"] else None,
+        "scoreImproved": stats["scoreImproved"],
+        "scoreRegressed": stats["scoreRegressed"],
+        "avgFinalTokenDelta": round(stats["tokenDeltaSum"] / stats["tokenDeltas"], 1) if stats["tokenDeltas"] else None,
+    }
+
+
+def _load_checkpoint(path: Path, run: dict) -> dict:
+    if not path.exists():
+        return {**run, "query": 0, "lastPath": None, "failedIDs": [], "stats": _empty_stats()}
+    state = json.loads(path.read_text())
+    stored = {key: state.get(key) for key in run}
+    if stored != run:
+        raise SystemExit(f"{path} belongs to another run ({stored}), pass a different --checkpoint")
+    return state
+
+
+def _save_checkpoint(path: Path, state: dict) -> None:
+    # write-then-rename: an interrupted run never leaves a half-written checkpoint
+    temporary = path.with_suffix(path.suffix + ".tmp")
+    temporary.write_text(json.dumps(state))
+    os.replace(temporary, path)
+
+
+def _pages(db, queries: list, page_size: int, query_index: int, last_path: Optional[str]):
+    """(query index, documents) pages of each query in document order, after the checkpointed position"""
+    for index in range(query_index, len(queries)):
+        query = queries[index].order_by("__name__").limit(page_size)
+        last = db.document(last_path).get() if index == query_index and last_path else None
+        while True:
+            docs = list((query.start_after(last) if last is not None else query).stream())
+            if docs:
+                yield index, docs
+            if len(docs) < page_size:
+                break
+            last = docs[-1]
+
+
+def run(version: str, steps: tuple = STEPS, model: Optional[str] = None, concurrency: int = 8, rate: float = 5,
+        page_size: int = 100, checkpoint: Optional[Path] = None, user: Optional[str] = None,
+        limit: Optional[int] = None, max_tokens: Optional[int] = None) -> dict:
+    """
+    Re-run `steps` under `version` for every stored prompt (or one user's), resuming from the checkpoint.
+
+    Returns:
+        summarize() of the totals over every run on this checkpoint
+    """
+    system_prompts(version)
+    # nothing would replay a local write journal after the tool exits
+    settings.WRITE_JOURNAL_ENABLED = False
+    model = model or settings.NEBIUS_MODEL
+    checkpoint = checkpoint or Path(f"reoptimize_{version}.checkpoint.json")
+    db = get_firestore_client()
+    state = _load_checkpoint(checkpoint, {"version": version, "steps": list(steps), "model": model, "user": user})
+    stats = state["stats"]
+    queries = repository.user_queries(db, user) if user else [repository.all_prompts(db)]
+    limiter = RateLimiter(rate)
+    seen = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index, docs in _pages(db, queries, page_size, state["query"], state["lastPath"]):
+            page_started = perf_counter()
+            if limit is not None:
+                docs = docs[:limit - seen]
+            futures = [pool.submit(reoptimize, doc.to_dict(), version, steps, model, limiter) for doc in docs]
+            for doc, future in zip(docs, futures):
+                try:
+                    _add(stats, future.result(), model)
+                except Exception as e:
+                    stats["failed"] += 1
+                    if len(state["failedIDs"]) < MAX_FAILED_IDS:
+                        state["failedIDs"].append(doc.id)
+                    print(f"failed {doc.id}: {e}")
+            seen += len(docs)
+            stats["elapsedS"] += perf_counter() - page_started
+            state.update(query=index, lastPath=docs[-1].reference.path)
+            _save_checkpoint(checkpoint, state)
+            summary = summarize(stats)
+            print(f"processed={summary['processed']} skipped={summary['skipped']} failed={summary['failed']} "
+                  f"rate={summary['promptsPerS']}/s tokens={stats['totalTokens']} cost=${summary['costUsd']}")
+            if limit is not None and seen >= limit:
+                break
+            if max_tokens is not None and stats["totalTokens"] >= max_tokens:
+                print(f"stopping: token budget of {max_tokens} spent")
+                break
+
+    return summarize(stats)
+
+
+def seed(count: int) -> None:
+    """Synthetic parsed and optimized prompts in the fake Firestore, for trying the pipeline locally"""
+    if settings.FIRESTORE_BACKEND != "fake":
+        raise SystemExit("--seed only writes to the fake Firestore (FIRESTORE_BACKEND=fake)")
+    topics = ("a product launch email", "a SQL migration plan", "a history essay on Rome", "unit tests for a parser")
+    for n in range(count):
+        text = f"Act as an expert. Write {random.choice(topics)} for our team, in a concise style. Use bullet points."
+        scores = {f"{component}_score": random.randint(2, 9) for component in PARSED_COMPONENTS}
+        old_variant = str(uuid.uuid4())
+        PromptDBModel(
+            promptID=str(uuid.uuid4()),
+            userID=f"user-{n % 5}",
+            inputPrompt=text,
+            parsedData=ParsedPrompt(**{component: "" for component in PARSED_COMPONENTS}, **scores),
+            overallScores=sum(scores.values()) / len(scores),
+            optimizedPrompts={old_variant: text + " Be specific."},
+            finalTokenSizes={old_variant: len(text) // 4 + 3},
+            usedLLMs={old_variant: settings.NEBIUS_MODEL},
+            initialTokenSize=len(text) // 4,
+        ).set_to_firestore()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-run parse / optimize on stored prompts under a system prompt version")
+    parser.add_argument("--version", required=True, help="system prompt version (SYSTEM_PROMPT_VERSIONS)")
+    parser.add_argument("--steps", default="parse,optimize", help="comma-separated: parse, optimize")
+    parser.add_argument("--model", default=None, help="default: NEBIUS_MODEL")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=5, help="LLM steps started per second (0 = unlimited)")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--checkpoint", type=Path, default=None, help="default: reoptimize_<version>.checkpoint.json")
+    parser.add_argument("--user", default=None, help="only this user's prompts")
+    parser.add_argument("--limit", type=int, default=None, help="prompts to visit in this run")
+    parser.add_argument("--max-tokens", type=int, default=None, help="stop once this many tokens are spent")
+    parser.add_argument("--seed", type=int, default=0, help="fake Firestore only: create N prompts first")
+    args = parser.parse_args()
+
+    steps = tuple(step.strip() for step in args.steps.split(",") if step.strip())
+    unknown = set(steps) - set(STEPS)
+    if unknown or not steps:
+        parser.error(f"--steps must be a comma-separated subset of {', '.join(STEPS)}")
+    if args.seed:
+        settings.WRITE_JOURNAL_ENABLED = False
+        seed(args.seed)
+    print(json.dumps(run(args.version, steps, args.model, args.concurrency, args.rate, args.page_size,
+                         args.checkpoint, args.user, args.limit, args.max_tokens), indent=2))
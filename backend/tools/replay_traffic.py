@@ -0,0 +1,328 @@
+"""
+Replay a traffic recording (services/traffic_recorder.py) against a local instance.
+
+Starts the app under uvicorn with the in-process Firestore and LLM stand-ins
+(services/fakes.py), then sends every recorded request at its recorded arrival time
+(relative to the first one) divided by --speed (open loop: slow responses don't slow the schedule down).
+Text is regenerated with the recorded token counts, IDs are mapped so a
+recorded /parse -> /optimizeExisting session runs against the prompt the
+replay created; prompts that existed before the recording started are
+seeded with /parse first.
+
+The report has throughput and latency percentiles overall and per route.
+Save it with --out and pass it as --baseline on another build to see the
+change. The server inherits the environment, so FAKE_LLM_LATENCY_MS,
+ADMISSION_* etc. can be set as usual. The fakes are per process, so the
+default is one worker; --target points the replay at an already running
+instance instead. Needs httpx (pip install httpx).
+
+Usage (from backend/):
+    TRAFFIC_RECORD_PATH=traffic.jsonl uvicorn backend.main:app   # record (from the repo root)
+    python tools/replay_traffic.py traffic.jsonl --speed 4 --out build-a.json
+    python tools/replay_traffic.py traffic.jsonl --speed 4 --baseline build-a.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+REPO_ROOT = BACKEND_DIR.parent
+
+PROMPT_ID_FIELDS = {"promptID", "prompt_id"}
+# common words, about one token each
+WORDS = (
+    "the model should write a short clear answer for each user question about data time work system "
+    "team plan list report text code test result step example format rule style role task context "
+    "output table summary email review change issue goal value price order customer product service"
+).split()
+
+
+def load_records(path: str) -> list[dict]:
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return sorted(records, key=lambda record: record["t"])
+
+
+def synthetic_text(tokens: int, rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(max(tokens, 1)))
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Session:
+    """Maps recorded (hashed) IDs to the IDs of the replay instance"""
+
+    def __init__(self, records: list[dict], seed: int):
+        self.rng = random.Random(seed)
+        self.prompts: dict[str, str] = {}
+        self.created: dict[str, asyncio.Future] = {}
+
+    def prompt_id(self, hashed: str) -> str:
+        return self.prompts.get(hashed, hashed)
+
+    async def wait_for(self, hashed_ids: set[str]) -> None:
+        # a request on a prompt created earlier in the recording waits for that creation
+        pending = [self.created[h] for h in hashed_ids if h in self.created and not self.created[h].done()]
+        if pending:
+            await asyncio.wait(pending)
+
+    def build(self, value, key=None):
+        if isinstance(value, list):
+            return [self.build(item, key) for item in value]
+        if not isinstance(value, dict):
+            return value
+        if "$id" in value:
+            return self.prompt_id(value["$id"]) if key in PROMPT_ID_FIELDS else f"replay-{value['$id']}"
+        if "$text" in value:
+            return synthetic_text(value["$text"], self.rng)
+        if "$age_s" in value:
+            from datetime import datetime, timedelta, timezone
+            return (datetime.now(timezone.utc) - timedelta(seconds=value["$age_s"])).isoformat()
+        return {k: self.build(v, k) for k, v in value.items()}
+
+
+def referenced_prompts(record: dict) -> set[str]:
+    found = set()
+
+    def walk(value, key=None):
+        if isinstance(value, dict):
+            if "$id" in value and key in PROMPT_ID_FIELDS:
+                found.add(value["$id"])
+            for k, v in value.items():
+                walk(v, k)
+        elif isinstance(value, list):
+            for item in value:
+                walk(item, key)
+
+    walk(record.get("pathParams"), None)
+    walk(record.get("body"))
+    walk(record.get("query"))
+    return found
+
+
+def request_for(record: dict, session: Session) -> tuple[str, dict, object]:
+    path = record["route"]
+    for name, value in (record.get("pathParams") or {}).items():
+        path = path.replace("{" + name + "}", str(session.build(value, name)))
+    query = session.build(record.get("query") or {})
+    body = session.build(record["body"]) if record.get("body") is not None else None
+    return path, query, body
+
+
+async def seed_prompts(client, records: list[dict], session: Session) -> int:
+    """Create the prompts the recording uses but didn't create itself"""
+    created_in_recording = set()
+    needed = []
+    for record in records:
+        for hashed in referenced_prompts(record) - created_in_recording:
+            if hashed not in needed:
+                needed.append(hashed)
+        if record.get("createdPromptID"):
+            created_in_recording.add(record["createdPromptID"])
+
+    sizes = [
+        record["body"]["inputPrompt"]["$text"]
+        for record in records
+        if isinstance(record.get("body"), dict) and isinstance(record["body"].get("inputPrompt"), dict)
+    ]
+    size = int(statistics.median(sizes)) if sizes else 200
+    limit = asyncio.Semaphore(16)
+
+    async def seed(hashed: str):
+        async with limit:
+            body = {"inputPrompt": synthetic_text(size, session.rng), "userID": "replay-seed"}
+            response = await client.post("/api/v1/parse", json=body)
+            if response.status_code == 200:
+                session.prompts[hashed] = response.json()["promptID"]
+
+    await asyncio.gather(*(seed(hashed) for hashed in needed))
+    return len(needed)
+
+
+async def replay(args, records: list[dict], base_url: str) -> dict:
+    import httpx
+
+    session = Session(records, args.seed)
+    results = []
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        seeded = await seed_prompts(client, records, session)
+        loop = asyncio.get_running_loop()
+        for record in records:
+            if record.get("createdPromptID"):
+                session.created.setdefault(record["createdPromptID"], loop.create_future())
+        origin = records[0]["t"] if records else 0.0
+        start = time.perf_counter()
+
+        async def send(record: dict):
+            scheduled = (record["t"] - origin) / args.speed
+            await asyncio.sleep(max(0.0, scheduled - (time.perf_counter() - start)))
+            await session.wait_for(referenced_prompts(record))
+            path, query, body = request_for(record, session)
+            sent = time.perf_counter()
+            try:
+                response = await client.request(record["method"], path, params=query, json=body)
+                status = response.status_code
+                if record.get("createdPromptID") and status == 200:
+                    created = response.json().get("promptID")
+                    if created:
+                        session.prompts[record["createdPromptID"]] = created
+            except httpx.HTTPError:
+                status = 0
+            finally:
+                future = session.created.get(record.get("createdPromptID"))
+                if future is not None and not future.done():
+                    future.set_result(None)
+            results.append({
+                "route": f"{record['method']} {record['route']}",
+                "status": status,
+                "latencyMs": (time.perf_counter() - sent) * 1000,
+                "lagMs": (sent - start - scheduled) * 1000,
+                "recordedMs": record.get("durationMs"),
+            })
+
+        await asyncio.gather(*(send(record) for record in records))
+        elapsed = time.perf_counter() - start
+    return summarize(results, elapsed, args.speed, seeded)
+
+
+def _stats(rows: list[dict], elapsed: float) -> dict:
+    latencies = [row["latencyMs"] for row in rows]
+    recorded = [row["recordedMs"] for row in rows if row["recordedMs"] is not None]
+    statuses = defaultdict(int)
+    for row in rows:
+        statuses[str(row["status"])] += 1
+    return {
+        "requests": len(rows),
+        "throughputRps": round(len(rows) / elapsed, 2) if elapsed else 0.0,
+        "errors": sum(1 for row in rows if row["status"] == 0 or row["status"] >= 500),
+        "statuses": dict(statuses),
+        "p50Ms": round(percentile(latencies, 0.50), 1),
+        "p95Ms": round(percentile(latencies, 0.95), 1),
+        "p99Ms": round(percentile(latencies, 0.99), 1),
+        "maxMs": round(max(latencies, default=0.0), 1),
+        "recordedP99Ms": round(percentile(recorded, 0.99), 1),
+    }
+
+
+def summarize(results: list[dict], elapsed: float, speed: float, seeded: int) -> dict:
+    by_route = defaultdict(list)
+    for row in results:
+        by_route[row["route"]].append(row)
+    lags = [row["lagMs"] for row in results]
+    return {
+        "speed": speed,
+        "elapsedS": round(elapsed, 2),
+        "seededPrompts": seeded,
+        # how late requests left compared to the schedule: waits for the prompt a request
+        # works on, or a saturated load generator
+        "scheduleLagP99Ms": round(percentile(lags, 0.99), 1),
+        "overall": _stats(results, elapsed),
+        "routes": {route: _stats(rows, elapsed) for route, rows in sorted(by_route.items())},
+    }
+
+
+def _delta(new: float, old: float) -> str:
+    if not old:
+        return ""
+    return f" ({(new - old) / old * 100:+.1f}%)"
+
+
+def print_report(report: dict, baseline: dict = None) -> None:
+    print(f"speed {report['speed']}x, {report['elapsedS']} s, seeded prompts: {report['seededPrompts']}, "
+          f"schedule lag p99 {report['scheduleLagP99Ms']} ms")
+    rows = [("overall", report["overall"], (baseline or {}).get("overall"))]
+    rows += [(route, stats, (baseline or {}).get("routes", {}).get(route)) for route, stats in report["routes"].items()]
+    print(f"{'route':<48} {'reqs':>6} {'rps':>16} {'err':>5} {'p50 ms':>18} {'p99 ms':>18} {'max ms':>9}")
+    for name, stats, old in rows:
+        old = old or {}
+        print(
+            f"{name:<48} {stats['requests']:>6} "
+            f"{stats['throughputRps']:>7}{_delta(stats['throughputRps'], old.get('throughputRps')):>9} "
+            f"{stats['errors']:>5} "
+            f"{stats['p50Ms']:>8}{_delta(stats['p50Ms'], old.get('p50Ms')):>10} "
+            f"{stats['p99Ms']:>8}{_delta(stats['p99Ms'], old.get('p99Ms')):>10} "
+            f"{stats['maxMs']:>9}"
+        )
+
+
+def start_server(port: int, workers: int) -> subprocess.Popen:
+    import http.client
+
+    env = {
+        **os.environ,
+        "FIRESTORE_BACKEND": "fake",
+        "LLM_BACKEND": "fake",
+        "HISTORY_PUSH_SOURCE": "fake",
+        "TRAFFIC_RECORD_PATH": "",
+        "WRITE_JOURNAL_PATH": os.path.join(tempfile.mkdtemp(prefix="replay-"), "write_journal.db"),
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=REPO_ROOT,
+        env=env,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("server did not become ready")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", help="JSONL written with TRAFFIC_RECORD_PATH")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay N times faster than recorded")
+    parser.add_argument("--target", help="base URL of a running instance (default: start one with the fakes)")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--limit", type=int, help="replay only the first N requests")
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0, help="seed for the regenerated text")
+    parser.add_argument("--out", help="write the report as JSON")
+    parser.add_argument("--baseline", help="report JSON of an earlier build to compare with")
+    args = parser.parse_args()
+
+    records = load_records(args.recording)[:args.limit]
+    server = None if args.target else start_server(args.port, args.workers)
+    try:
+        report = asyncio.run(replay(args, records, args.target or f"http://127.0.0.1:{args.port}"))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Train a shared zstd dictionary on the stored prompt corpus.
+
+Usage (from backend/):
+    python tools/train_compression_dict.py --output services/prompt_dict.zstd --limit 5000
+
+Point PROMPT_COMPRESSION_DICT at the output file to use it. Documents written
+with a dictionary can only be read with the same dictionary, so keep old files
+and list them in PROMPT_COMPRESSION_RETIRED_DICTS.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import zstandard
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from services.firebase_db import get_firestore_client
+from services.prompt_repository import repository
+from services.compression import decompress_prompt_fields
+
+
+def collect_samples(limit: int) -> list[bytes]:
+    """Read up to `limit` prompt documents and return their text fields as samples"""
+    db = get_firestore_client()
+    samples = []
+    for doc in repository.all_prompts(db).limit(limit).stream():
+        data = decompress_prompt_fields(doc.to_dict())
+        if data.get("inputPrompt"):
+            samples.append(data["inputPrompt"].encode("utf-8"))
+        for text in (data.get("optimizedPrompts") or {}).values():
+            if text:
+                samples.append(text.encode("utf-8"))
+    return samples
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train a zstd dictionary for prompt compression")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--limit", type=int, default=5000)
+    parser.add_argument("--dict-size", type=int, default=112640)  # zstd default (110 KB)
+    args = parser.parse_args()
+
+    samples = collect_samples(args.limit)
+    if len(samples) < 10:
+        sys.exit(f"not enough samples to train a dictionary ({len(samples)})")
+
+    dictionary = zstandard.train_dictionary(args.dict_size, samples)
+    Path(args.output).write_bytes(dictionary.as_bytes())
+    print(f"trained dictionary id={dictionary.dict_id()} from {len(samples)} samples -> {args.output}")
@@ -0,0 +1,37 @@
+"""
+Download tiktoken BPE files into backend/tiktoken_cache at build time.
+
+tiktoken looks up TIKTOKEN_CACHE_DIR before going to the network, and
+services/token_counter.py points that variable at the vendored directory,
+so workers never download encodings at runtime.
+
+Usage (from backend/, run by the Render build command):
+    python tools/vendor_tiktoken.py
+    python tools/vendor_tiktoken.py --encodings cl100k_base o200k_base
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from services.token_counter import TIKTOKEN_CACHE_DIR
+
+# every encoding in services/model_registry.py (o200k_harmony shares o200k_base's BPE file)
+DEFAULT_ENCODINGS = ["cl100k_base", "o200k_base", "o200k_harmony"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vendor tiktoken encodings for offline use")
+    parser.add_argument("--encodings", nargs="+", default=DEFAULT_ENCODINGS)
+    args = parser.parse_args()
+
+    TIKTOKEN_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    # must be set before tiktoken reads it
+    os.environ["TIKTOKEN_CACHE_DIR"] = str(TIKTOKEN_CACHE_DIR)
+    import tiktoken
+
+    for name in args.encodings:
+        enc = tiktoken.get_encoding(name)
+        print(f"{name}: {enc.n_vocab} tokens cached")
+    print(f"cache dir: {TIKTOKEN_CACHE_DIR} ({sum(f.stat().st_size for f in TIKTOKEN_CACHE_DIR.iterdir()) // 1024} KB)")